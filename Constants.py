@@ -1,8 +1,59 @@
 import os
 
+from dotenv import load_dotenv
+
+load_dotenv()
+
 TWITCH_CLIENT_ID = os.getenv("TWITCH_CLIENT_ID")
 TWITCH_CLIENT_SECRET = os.getenv("TWITCH_CLIENT_SECRET")
 YOUTUBE_API_KEY = os.getenv("YOUTUBE_API_KEY")
 REDIS_HOST = os.getenv("REDIS_HOST")
 REDIS_PORT = os.getenv("REDIS_PORT")
 REDIS_PASSWORD = os.getenv("REDIS_PASSWORD")
+
+# EventSub：websocket / webhook，未設定時只使用輪詢
+TWITCH_EVENTSUB_MODE = os.getenv("TWITCH_EVENTSUB_MODE")
+TWITCH_EVENTSUB_WS_URL = os.getenv("TWITCH_EVENTSUB_WS_URL") or "wss://eventsub.wss.twitch.tv/ws"
+TWITCH_EVENTSUB_SUBSCRIPTION_URL = (
+    os.getenv("TWITCH_EVENTSUB_SUBSCRIPTION_URL") or "https://api.twitch.tv/helix/eventsub/subscriptions"
+)
+TWITCH_EVENTSUB_USER_TOKEN = os.getenv("TWITCH_EVENTSUB_USER_TOKEN")
+TWITCH_EVENTSUB_CALLBACK_URL = os.getenv("TWITCH_EVENTSUB_CALLBACK_URL")
+TWITCH_EVENTSUB_SECRET = os.getenv("TWITCH_EVENTSUB_SECRET")
+TWITCH_EVENTSUB_HOST = os.getenv("TWITCH_EVENTSUB_HOST") or "0.0.0.0"
+TWITCH_EVENTSUB_PORT = int(os.getenv("TWITCH_EVENTSUB_PORT") or 8080)
+# 啟用 EventSub 後，輪詢只作為低頻率的校正
+TWITCH_RECONCILE_INTERVAL = int(os.getenv("TWITCH_RECONCILE_INTERVAL") or 300)
+
+# 多 worker 分片輪詢：TWITCH_SHARD_COUNT 為 0 時由單一程序輪詢所有實況主
+# 各 worker 必須負責所有 Discord shard，不能與 DISCORD_SHARD_IDS 同時使用
+TWITCH_SHARD_COUNT = int(os.getenv("TWITCH_SHARD_COUNT") or 0)
+TWITCH_SHARD_LEASE_TTL = int(os.getenv("TWITCH_SHARD_LEASE_TTL") or 30)
+WORKER_ID = os.getenv("WORKER_ID")
+
+# Discord Gateway 分片：未設定 DISCORD_SHARD_COUNT 時由 Discord 建議數量自動分片
+# 指定 DISCORD_SHARD_IDS (以逗號分隔) 可將 shard 分散到多個程序，此時必須同時設定 DISCORD_SHARD_COUNT，
+# 且每個程序各自輪詢自己 Guild 追蹤的實況主 (TWITCH_SHARD_COUNT=0)
+DISCORD_SHARD_COUNT = int(os.getenv("DISCORD_SHARD_COUNT") or 0) or None
+DISCORD_SHARD_IDS = [
+    int(shard_id) for shard_id in (os.getenv("DISCORD_SHARD_IDS") or "").split(",") if shard_id.strip()
+] or None
+
+# 低記憶體模式：只啟用 guilds / webhooks intents，不快取成員與訊息，也不在啟動時請求成員列表 (預設關閉)
+LOW_MEMORY_MODE = (os.getenv("LOW_MEMORY_MODE") or "false").lower() in ("1", "true", "yes")
+
+# 直播狀態的快取秒數：Helix 查無直播後，超過這段時間才視為關台，避免短暫斷線造成重複通知
+TWITCH_OFFLINE_GRACE = float(os.getenv("TWITCH_OFFLINE_GRACE") or 60)
+
+# 未啟用 EventSub 時依開台習慣調整每位實況主的輪詢頻率，並限制每分鐘的 Helix 請求數；預設 0 則每 10 秒輪詢所有實況主
+TWITCH_POLL_BUDGET = int(os.getenv("TWITCH_POLL_BUDGET") or 0)
+
+# 通知佇列：輪詢只把開台/關台/更新工作寫入 Redis Stream，由 consumer group 中的 worker 發送 Discord 訊息 (預設關閉)
+NOTIFICATION_QUEUE = (os.getenv("NOTIFICATION_QUEUE") or "false").lower() in ("1", "true", "yes")
+NOTIFICATION_WORKERS = int(os.getenv("NOTIFICATION_WORKERS") or 32)  # 每個程序同時處理的工作數量
+NOTIFICATION_MAX_ATTEMPTS = int(os.getenv("NOTIFICATION_MAX_ATTEMPTS") or 5)
+NOTIFICATION_RETRY_AFTER = int(os.getenv("NOTIFICATION_RETRY_AFTER") or 30)
+
+# Prometheus 指標：設定 METRICS_PORT 後在 METRICS_HOST:METRICS_PORT/metrics 提供抓取，0 表示不啟用
+METRICS_HOST = os.getenv("METRICS_HOST") or "127.0.0.1"
+METRICS_PORT = int(os.getenv("METRICS_PORT") or 0)
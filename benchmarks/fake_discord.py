@@ -0,0 +1,98 @@
+"""模擬 Discord Webhook execute / edit / delete 的本機 aiohttp 伺服器"""
+import asyncio
+import itertools
+import json
+import time
+
+from collections import Counter
+from typing import Callable, Dict, List, Optional
+
+from aiohttp import web
+
+API_PREFIX = "/api/v10"
+TIMESTAMP = "2024-01-01T00:00:00+00:00"
+
+
+class FakeDiscord:
+    """
+    Discord Webhook API 的替身，記錄每種操作的次數。
+
+    開台通知送達時，以 embed 作者連結取得實況主，透過 ``went_live_at`` 查詢開台時間，計算通知延遲。
+    """
+
+    def __init__(self, went_live_at: Callable[[str], Optional[float]], latency: float = 0.0):
+        self.went_live_at = went_live_at
+        self.latency = latency
+
+        self.calls: Counter = Counter()
+        self.delays: List[float] = []
+        self._message_ids = itertools.count(1_200_000_000_000_000_000)
+
+    def app(self) -> web.Application:
+        app = web.Application()
+        app.router.add_post(API_PREFIX + "/webhooks/{webhook_id}/{token}", self.execute)
+        app.router.add_patch(API_PREFIX + "/webhooks/{webhook_id}/{token}/messages/{message_id}", self.edit)
+        app.router.add_delete(API_PREFIX + "/webhooks/{webhook_id}/{token}/messages/{message_id}", self.delete)
+        return app
+
+    @staticmethod
+    def _json(data: Dict) -> web.Response:
+        # disnake 只在 Content-Type 完全等於 application/json 時解析回應，不能帶 charset
+        return web.Response(body=json.dumps(data).encode(), headers={"Content-Type": "application/json"})
+
+    @staticmethod
+    def _message(message_id: int, webhook_id: str, body: Dict) -> Dict:
+        return {
+            "id": str(message_id),
+            "channel_id": "1100000000000000000",
+            "type": 0,
+            "content": body.get("content") or "",
+            "author": {"id": webhook_id, "username": body.get("username") or "webhook", "discriminator": "0000",
+                       "avatar": None, "bot": True},
+            "embeds": body.get("embeds") or [],
+            "components": [],
+            "attachments": [],
+            "mentions": [],
+            "mention_roles": [],
+            "mention_everyone": False,
+            "pinned": False,
+            "tts": False,
+            "timestamp": TIMESTAMP,
+            "edited_timestamp": None,
+            "webhook_id": webhook_id,
+        }
+
+    async def execute(self, request: web.Request) -> web.Response:
+        body = await request.json()
+        received_at = time.time()
+
+        if self.latency:
+            await asyncio.sleep(self.latency)
+
+        self.calls["execute"] += 1
+
+        for embed in body.get("embeds") or []:
+            login = ((embed.get("author") or {}).get("url") or "").rsplit("/", 1)[-1]
+            went_live_at = self.went_live_at(login)
+            if went_live_at is not None:
+                self.delays.append(received_at - went_live_at)
+
+        return self._json(self._message(next(self._message_ids), request.match_info["webhook_id"], body))
+
+    async def edit(self, request: web.Request) -> web.Response:
+        body = await request.json()
+
+        if self.latency:
+            await asyncio.sleep(self.latency)
+
+        self.calls["edit"] += 1
+        return self._json(
+            self._message(int(request.match_info["message_id"]), request.match_info["webhook_id"], body)
+        )
+
+    async def delete(self, request: web.Request) -> web.Response:
+        if self.latency:
+            await asyncio.sleep(self.latency)
+
+        self.calls["delete"] += 1
+        return web.Response(status=204)
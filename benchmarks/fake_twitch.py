@@ -0,0 +1,155 @@
+"""模擬 Twitch Helix 的本機 aiohttp 伺服器，只實作 ``core.twitch.TwitchClient`` 用到的端點"""
+import asyncio
+import time
+
+from collections import Counter
+from typing import Dict, List, Optional
+
+from aiohttp import web
+
+CREATED_AT = "2020-01-01T00:00:00Z"
+
+
+def user_id_of(index: int) -> str:
+    return str(10_000_000 + index)
+
+
+class FakeHelix:
+    """
+    Helix 的替身：``live`` 記錄目前正在直播的實況主與開台時間，由 benchmark 控制開台/關台。
+
+    每分鐘的 points 與真正的 App Access Token 一樣受 ``rate_limit`` 限制，超出時回傳 429，
+    並回傳 ``Ratelimit-*`` 標頭讓 ``HelixRateLimiter`` 同步額度。
+    """
+
+    def __init__(self, streamers: List[str], rate_limit: int = 800, latency: float = 0.0):
+        self.users: Dict[str, dict] = {login: self._user(index, login) for index, login in enumerate(streamers)}
+        self.users_by_id: Dict[str, dict] = {user["id"]: user for user in self.users.values()}
+        self.live: Dict[str, float] = {}  # login -> 開台時間 (time.time())
+        self.rate_limit = rate_limit
+        self.latency = latency
+
+        self.calls: Counter = Counter()
+        self.rate_limited = 0
+        self._points = rate_limit
+        self._reset_at = time.time() + 60
+
+    @staticmethod
+    def _user(index: int, login: str) -> dict:
+        return {
+            "id": user_id_of(index),
+            "login": login,
+            "display_name": login.capitalize(),
+            "type": "",
+            "broadcaster_type": "",
+            "description": "",
+            "profile_image_url": f"https://static-cdn.jtvnw.net/{login}.png",
+            "offline_image_url": "",
+            "view_count": 0,
+            "created_at": CREATED_AT,
+        }
+
+    def go_live(self, login: str, now: Optional[float] = None) -> None:
+        self.live.setdefault(login, now or time.time())
+
+    def go_offline(self, login: str) -> None:
+        self.live.pop(login, None)
+
+    def app(self) -> web.Application:
+        app = web.Application()
+        app.router.add_post("/oauth2/token", self.token)
+        app.router.add_get("/helix/streams", self.streams)
+        app.router.add_get("/helix/users", self.get_users)
+        app.router.add_get("/helix/videos", self.videos)
+        return app
+
+    def _spend(self) -> Dict[str, str]:
+        now = time.time()
+        if now >= self._reset_at:
+            self._points = self.rate_limit
+            self._reset_at = now + 60
+
+        self._points -= 1
+
+        return {
+            "Ratelimit-Limit": str(self.rate_limit),
+            "Ratelimit-Remaining": str(max(0, self._points)),
+            "Ratelimit-Reset": str(int(self._reset_at)),
+        }
+
+    async def _respond(self, endpoint: str, data: List[dict]) -> web.Response:
+        self.calls[endpoint] += 1
+        headers = self._spend()
+
+        if self.latency:
+            await asyncio.sleep(self.latency)
+
+        if self._points < 0:
+            self.rate_limited += 1
+            return web.json_response({"error": "Too Many Requests", "status": 429}, status=429, headers=headers)
+
+        return web.json_response({"data": data, "pagination": {}}, headers=headers)
+
+    async def token(self, request: web.Request) -> web.Response:
+        self.calls["token"] += 1
+        return web.json_response({"access_token": "benchmark", "expires_in": 86400, "token_type": "bearer"})
+
+    async def streams(self, request: web.Request) -> web.Response:
+        data = []
+
+        for login in request.query.getall("user_login", []):
+            started_at = self.live.get(login)
+            user = self.users.get(login)
+            if started_at is None or user is None:
+                continue
+
+            data.append({
+                "id": str(int(started_at)),
+                "user_id": user["id"],
+                "user_login": login,
+                "user_name": user["display_name"],
+                "game_id": "509658",
+                "game_name": "Just Chatting",
+                "type": "live",
+                "title": f"{user['display_name']} 的直播",
+                "viewer_count": 100,
+                "started_at": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime(started_at)),
+                "language": "zh",
+                "thumbnail_url": f"https://static-cdn.jtvnw.net/previews-ttv/live_user_{login}-{{width}}x{{height}}.jpg",
+                "tags": [],
+                "is_mature": False,
+            })
+
+        return await self._respond("streams", data)
+
+    async def get_users(self, request: web.Request) -> web.Response:
+        data = [self.users[login] for login in request.query.getall("login", []) if login in self.users]
+        data += [self.users_by_id[user_id] for user_id in request.query.getall("id", []) if user_id in self.users_by_id]
+        return await self._respond("users", data)
+
+    async def videos(self, request: web.Request) -> web.Response:
+        user = self.users_by_id.get(request.query.get("user_id", ""))
+        data = []
+
+        if user:
+            data.append({
+                "id": f"v{user['id']}",
+                "stream_id": None,
+                "user_id": user["id"],
+                "user_login": user["login"],
+                "user_name": user["display_name"],
+                "title": f"{user['display_name']} 的直播",
+                "description": "",
+                "created_at": CREATED_AT,
+                "published_at": CREATED_AT,
+                "url": f"https://www.twitch.tv/videos/{user['id']}",
+                "thumbnail_url": "https://static-cdn.jtvnw.net/cf_vods/%{width}x%{height}.jpg",
+                "viewable": "public",
+                "view_count": 10,
+                "language": "zh",
+                "type": "archive",
+                "duration": "1h2m3s",
+                "muted_segments": None,
+            })
+
+        return await self._respond("videos", data)
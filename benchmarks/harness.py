@@ -0,0 +1,239 @@
+"""
+benchmark 的主要流程。
+
+會讀取 Constants 的模組 (core.*、cogs.*) 必須在 ``benchmarks.run`` 設定好環境變數後才匯入，
+因此這個模組只由 ``benchmarks.run`` 匯入。
+"""
+import asyncio
+import logging
+import random
+import time
+
+from typing import Dict, List, Optional
+
+import disnake.http
+from aiohttp import web
+from sqlalchemy.dialects.sqlite import insert
+
+import core.twitch
+from benchmarks.fake_discord import API_PREFIX, FakeDiscord
+from benchmarks.fake_twitch import FakeHelix
+from cogs.events import Events
+from core.bot import Bot, gateway_options
+from core.db import SQL_IN_CHUNK_SIZE, async_session_scope, create_table, engine
+from models.platform import GuildStreamers, TwitchGuilds
+
+GUILD_ID_BASE = 1_000_000_000_000_000
+WEBHOOK_ID_BASE = 1_100_000_000_000_000_000
+WEBHOOK_TOKEN = "b" * 68
+POPULARITY_EXPONENT = 0.8  # 追蹤人數呈 Zipf 分布：少數熱門實況主被大量 Guild 追蹤
+
+
+class BenchmarkBot(Bot):
+    """不連線 Gateway：Guild 由合成資料直接寫入快取，並全部視為這個程序負責的 Guild"""
+
+    def shard_guild_ids(self) -> List[int]:
+        return [guild.id for guild in self.guilds]
+
+
+def percentiles(values: List[float]) -> Dict[str, Optional[float]]:
+    if not values:
+        return {"count": 0, "p50": None, "p90": None, "p99": None, "max": None}
+
+    values = sorted(values)
+
+    def pick(p: float) -> float:
+        return round(values[min(len(values) - 1, int(p * len(values)))], 4)
+
+    return {"count": len(values), "p50": pick(0.5), "p90": pick(0.9), "p99": pick(0.99), "max": round(values[-1], 4)}
+
+
+def build_dataset(guilds: int, streamers: int, follows: int, seed: int) -> Dict[int, List[str]]:
+    """每個 Guild 依熱門程度抽出 ``follows`` 位不重複的實況主"""
+    rng = random.Random(seed)
+    logins = [f"streamer_{index}" for index in range(streamers)]
+    weights = [1 / (rank + 1) ** POPULARITY_EXPONENT for rank in range(streamers)]
+    follows = min(follows, streamers)
+
+    dataset = {}
+    for index in range(guilds):
+        chosen = set()
+        while len(chosen) < follows:
+            chosen.update(rng.choices(logins, weights, k=follows - len(chosen)))
+        dataset[GUILD_ID_BASE + index] = sorted(chosen)
+
+    return dataset
+
+
+async def seed_database(dataset: Dict[int, List[str]]) -> None:
+    await create_table()
+
+    guild_rows = [
+        {
+            "id": guild_id,
+            "streamers": {},
+            "webhook_link": f"https://discord.com/api/webhooks/{WEBHOOK_ID_BASE + index}/{WEBHOOK_TOKEN}",
+            "webhook_name": "直播通知",
+            # 一半的 Guild 使用自訂通知訊息，讓模板的成本也被量測到
+            "content": "{everyone} {name} 開台了！\\n快來看 {role}" if index % 2 else None,
+            # 關台時一半的 Guild 刪除訊息、一半查詢 VOD 後編輯訊息
+            "when_live_end": (index // 2) % 2,
+        }
+        for index, guild_id in enumerate(dataset)
+    ]
+    streamer_rows = [
+        {"guild_id": guild_id, "platform": "twitch", "streamer": streamer}
+        for guild_id, streamers in dataset.items()
+        for streamer in streamers
+    ]
+
+    async with async_session_scope() as session:
+        for model, rows in ((TwitchGuilds, guild_rows), (GuildStreamers, streamer_rows)):
+            for i in range(0, len(rows), SQL_IN_CHUNK_SIZE):
+                await session.execute(insert(model).values(rows[i:i + SQL_IN_CHUNK_SIZE]).on_conflict_do_nothing())
+
+
+def populate_guilds(bot: Bot, guild_ids: List[int]) -> None:
+    """以合成的 GUILD_CREATE 事件填入 Guild 快取"""
+    state = bot._connection
+
+    for guild_id in guild_ids:
+        state.parse_guild_create({
+            "id": str(guild_id),
+            "name": f"Guild {guild_id - GUILD_ID_BASE}",
+            "owner_id": str(guild_id),
+            "member_count": 1,
+            "large": False,
+            "features": [],
+            "emojis": [],
+            "stickers": [],
+            "channels": [],
+            "roles": [{
+                "id": str(guild_id),
+                "name": "@everyone",
+                "permissions": "0",
+                "position": 0,
+                "color": 0,
+                "colors": {"primary_color": 0, "secondary_color": None, "tertiary_color": None},
+                "hoist": False,
+                "managed": False,
+                "mentionable": False,
+            }],
+        })
+
+
+async def start_server(app: web.Application) -> tuple:
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    await site.start()
+    port = site._server.sockets[0].getsockname()[1]
+    return runner, f"http://127.0.0.1:{port}"
+
+
+async def wait_for_queue(events: Events, timeout: float) -> Optional[float]:
+    """等待通知佇列清空，回傳花費的秒數；逾時回傳 None"""
+    started = time.perf_counter()
+
+    while time.perf_counter() - started < timeout:
+        unread, pending = await events.queue.backlog()
+        if not unread and not pending and not events.queue._tasks:
+            return time.perf_counter() - started
+        await asyncio.sleep(0.05)
+
+    return None
+
+
+async def run_benchmark(args) -> dict:
+    rng = random.Random(args.seed)
+    logger = logging.getLogger("benchmark")
+
+    dataset = build_dataset(args.guilds, args.streamers, args.follows, args.seed)
+    followed = sorted({streamer for streamers in dataset.values() for streamer in streamers})
+
+    helix = FakeHelix(
+        [f"streamer_{index}" for index in range(args.streamers)], rate_limit=args.helix_rate, latency=args.latency
+    )
+    discord = FakeDiscord(helix.live.get, latency=args.latency)
+
+    helix_runner, helix_url = await start_server(helix.app())
+    discord_runner, discord_url = await start_server(discord.app())
+
+    # 把 Helix 與 Discord 的請求導向本機的替身
+    core.twitch.HELIX_URL = f"{helix_url}/helix"
+    core.twitch.OAUTH_TOKEN_URL = f"{helix_url}/oauth2/token"
+    disnake.http.Route.BASE = f"{discord_url}{API_PREFIX}"
+
+    started = time.perf_counter()
+    await seed_database(dataset)
+    seed_time = time.perf_counter() - started
+
+    bot = BenchmarkBot(logger=logger, **gateway_options(True))
+    populate_guilds(bot, list(dataset))
+    await bot.twitch.start()
+
+    events = Events(bot)
+    await events.cog_load()
+
+    started = time.perf_counter()
+    await bot.subscriptions.load()
+    index_load_time = time.perf_counter() - started
+
+    queue_task = asyncio.create_task(events.queue.run(events.handle_job)) if events.queue else None
+
+    for streamer in rng.sample(followed, int(len(followed) * args.initial_live)):
+        helix.go_live(streamer)
+
+    tick_times = []
+
+    try:
+        for _ in range(args.ticks):
+            for streamer in rng.sample(followed, int(len(followed) * args.churn)):
+                if streamer in helix.live:
+                    helix.go_offline(streamer)
+                else:
+                    helix.go_live(streamer)
+
+            started = time.perf_counter()
+            await events.check_twitch_stream()
+            tick_times.append(time.perf_counter() - started)
+
+            await asyncio.sleep(args.interval)
+
+        started = time.perf_counter()
+        await events.update_live_messages()
+        update_time = time.perf_counter() - started
+
+        drain_time = await wait_for_queue(events, args.drain_timeout) if events.queue else 0.0
+    finally:
+        if events.queue:
+            events.queue.stop()
+        if queue_task:
+            queue_task.cancel()
+        await events.session.close()
+        await bot.twitch.close()
+        await helix_runner.cleanup()
+        await discord_runner.cleanup()
+        await engine.dispose()  # aiosqlite 的連線執行緒不是 daemon，不關閉會讓程序無法結束
+
+    return {
+        "config": {
+            "guilds": args.guilds,
+            "streamers": args.streamers,
+            "followed_streamers": len(followed),
+            "subscriptions": sum(len(streamers) for streamers in dataset.values()),
+            "ticks": args.ticks,
+            "churn": args.churn,
+            "queue": events.queue is not None,
+            "poll_budget": args.poll_budget,
+        },
+        "seed_seconds": round(seed_time, 3),
+        "index_load_seconds": round(index_load_time, 3),
+        "tick_seconds": percentiles(tick_times),
+        "update_live_messages_seconds": round(update_time, 3),
+        "queue_drain_seconds": None if drain_time is None else round(drain_time, 3),
+        "helix_calls": dict(helix.calls),
+        "helix_rate_limited": helix.rate_limited,
+        "discord_calls": dict(discord.calls),
+        "notification_delay_seconds": percentiles(discord.delays),
+    }
@@ -0,0 +1,157 @@
+"""
+在本機量測輪詢 (``Events.check_twitch_stream``) 與直播通知更新 (``update_live_messages``) 的效能。
+
+    python -m benchmarks.run --guilds 10000 --streamers 5000 --ticks 20
+    python -m benchmarks.run --json result.json
+    python -m benchmarks.run --compare baseline.json   # 比基準慢超過 --tolerance 時以非 0 結束
+
+不會連線到任何外部服務：Twitch Helix 與 Discord Webhook 由本機的 aiohttp 替身回應，
+Redis 使用 fakeredis 的 TCP 伺服器 (需先 ``pip install -r requirements-bench.txt``)，
+SQLite 資料庫建立在暫存目錄中，並填入合成的 Guild 與追蹤列表。
+輸出每一輪的耗時百分位數、各 API 的呼叫次數，以及從開台到 Discord 收到通知的延遲。
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import socket
+import sys
+import tempfile
+import threading
+
+# 與基準比較時檢查的指標：(名稱, 取值方式)
+COMPARED_METRICS = [
+    ("tick p50", lambda result: result["tick_seconds"]["p50"]),
+    ("tick p90", lambda result: result["tick_seconds"]["p90"]),
+    ("update_live_messages", lambda result: result["update_live_messages_seconds"]),
+    ("notification delay p90", lambda result: result["notification_delay_seconds"]["p90"]),
+    ("helix calls", lambda result: sum(result["helix_calls"].values())),
+]
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def start_fake_redis() -> int:
+    from fakeredis import TcpFakeServer
+
+    port = free_port()
+    server = TcpFakeServer(("127.0.0.1", port))
+    server.daemon_threads = True  # 每個連線一個執行緒，設為 daemon 才不會在結束時等待連線關閉
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return port
+
+
+def configure_environment(args, redis_port: int) -> None:
+    """Constants 在匯入時讀取環境變數，必須在匯入 core / cogs 之前設定"""
+    os.environ.update({
+        "REDIS_HOST": "127.0.0.1",
+        "REDIS_PORT": str(redis_port),
+        "REDIS_PASSWORD": "",
+        "TWITCH_CLIENT_ID": "benchmark",
+        "TWITCH_CLIENT_SECRET": "benchmark",
+        "TWITCH_EVENTSUB_MODE": "",
+        "TWITCH_SHARD_COUNT": "0",
+        "LOW_MEMORY_MODE": "true",
+        "TWITCH_POLL_BUDGET": str(args.poll_budget),
+        "NOTIFICATION_QUEUE": "false" if args.no_queue else "true",
+        "NOTIFICATION_RETRY_AFTER": "5",
+        # 每輪之間遠短於正式環境的 60 秒，縮短直播狀態快取才能讓關台 (與 /videos) 在量測中發生
+        "TWITCH_OFFLINE_GRACE": str(args.offline_grace),
+    })
+
+
+def print_report(result: dict) -> None:
+    config = result["config"]
+    print(
+        f"{config['guilds']} 個 Guild、{config['followed_streamers']} 位被追蹤的實況主、"
+        f"{config['subscriptions']} 筆追蹤，{config['ticks']} 輪 "
+        f"({'通知佇列' if config['queue'] else '直接發送'}，每輪 {config['churn'] * 100:.1f}% 的實況主開/關台)"
+    )
+    print(f"建立資料: {result['seed_seconds']}s，載入追蹤索引: {result['index_load_seconds']}s")
+
+    for name, key in (("每輪耗時", "tick_seconds"), ("通知延遲", "notification_delay_seconds")):
+        stats = result[key]
+        if not stats["count"]:
+            print(f"{name}: 無資料")
+            continue
+        print(f"{name} (n={stats['count']}): p50={stats['p50']}s p90={stats['p90']}s p99={stats['p99']}s max={stats['max']}s")
+
+    print(f"update_live_messages: {result['update_live_messages_seconds']}s")
+    if config["queue"]:
+        print(f"通知佇列清空: {result['queue_drain_seconds']}s")
+    print(f"Helix 呼叫: {result['helix_calls']} (429: {result['helix_rate_limited']})")
+    print(f"Discord 呼叫: {result['discord_calls']}")
+
+
+def compare(result: dict, baseline: dict, tolerance: float) -> bool:
+    """與基準結果比較，任何指標變差超過 ``tolerance`` 時回傳 False"""
+    ok = True
+
+    for name, metric in COMPARED_METRICS:
+        current, previous = metric(result), metric(baseline)
+        if current is None or not previous:
+            continue
+
+        change = current / previous - 1
+        regressed = change > tolerance
+        ok &= not regressed
+        print(f"{'❌' if regressed else '✅'} {name}: {previous} -> {current} ({change:+.1%})")
+
+    return ok
+
+
+def main():
+    parser = argparse.ArgumentParser(description="以本機替身量測輪詢與通知發送的效能")
+    parser.add_argument("--guilds", type=int, default=10000)
+    parser.add_argument("--streamers", type=int, default=5000)
+    parser.add_argument("--follows", type=int, default=5, help="每個 Guild 追蹤的實況主數量")
+    parser.add_argument("--ticks", type=int, default=10)
+    parser.add_argument("--interval", type=float, default=0.0, help="每輪之間等待的秒數")
+    parser.add_argument("--churn", type=float, default=0.01, help="每輪開台或關台的實況主比例")
+    parser.add_argument("--initial-live", type=float, default=0.02, help="開始時已在直播的實況主比例")
+    parser.add_argument("--poll-budget", type=int, default=0, help="TWITCH_POLL_BUDGET，預設 0 表示每輪輪詢所有實況主")
+    parser.add_argument("--helix-rate", type=int, default=800, help="Helix 替身每分鐘的 points")
+    parser.add_argument("--latency", type=float, default=0.0, help="替身回應前等待的秒數")
+    parser.add_argument(
+        "--offline-grace", type=float, default=0.05, help="TWITCH_OFFLINE_GRACE，查無直播後多少秒視為關台"
+    )
+    parser.add_argument("--no-queue", action="store_true", help="不使用通知佇列，在輪詢中直接發送")
+    parser.add_argument("--drain-timeout", type=float, default=120.0)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", help="將結果寫入 JSON 檔")
+    parser.add_argument("--compare", help="與先前的 JSON 結果比較")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="允許變差的比例")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING)
+
+    configure_environment(args, start_fake_redis())
+    # 結果與基準的路徑相對於執行時的目錄，需在切換目錄前解析
+    args.json = args.json and os.path.abspath(args.json)
+    args.compare = args.compare and os.path.abspath(args.compare)
+    # 資料庫路徑是相對路徑，切換到暫存目錄避免寫入正式的 tystream.db
+    os.chdir(tempfile.mkdtemp(prefix="tystream-benchmark-"))
+
+    from benchmarks.harness import run_benchmark
+
+    result = asyncio.run(run_benchmark(args))
+    print_report(result)
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as file:
+            json.dump(result, file, ensure_ascii=False, indent=2)
+
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as file:
+            baseline = json.load(file)
+        if not compare(result, baseline, args.tolerance):
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,8 +1,7 @@
 import asyncio
 import re
 
-
-import Constants
+from typing import List
 
 from disnake import Embed, Colour, ApplicationCommandInteraction, Attachment, TextChannel, Role, Localized
 from disnake.ext import commands
@@ -10,7 +9,6 @@ from disnake.ext import commands
 from core.bot import Bot
 from core.db import (
     upsert_user,
-    search_streamers,
     get_all_streamers,
     upsert_channel,
     delete_user,
@@ -20,13 +18,18 @@ from core.db import (
     upsert_action,
 )
 
-from tystream import AsyncTwitch
-
 from core.embeds import SuccessEmbed, RemoveEmbed
-from core.redis_utils import remove_twitch_guild_streamers, remove_youtube_guild_streamers
+from core.redis_utils import (
+    index_twitch_streamers,
+    add_twitch_streamer_to_index,
+    unindex_twitch_streamer,
+    search_twitch_streamers,
+)
 
 actions = {"刪除": 0, "更新訊息為 VOD": 1}
 
+AUTOCOMPLETE_DB_TIMEOUT = 2  # Discord 要求在 3 秒內回應自動完成
+
 
 async def extract_twitch_username(twitch_name_or_link: str) -> str:
     match = re.search(r'^https://www\.twitch\.tv/(.+)$', twitch_name_or_link)
@@ -35,6 +38,29 @@ async def extract_twitch_username(twitch_name_or_link: str) -> str:
     return twitch_name_or_link
 
 
+async def autocomplete_twitch_streamers(inter: ApplicationCommandInteraction, query: str) -> List[str]:
+    """以 Redis 前綴索引自動完成追蹤中的實況主，索引不存在時才從資料庫建立"""
+    results = await search_twitch_streamers(inter.guild.id, query)
+    if results is not None:
+        return results
+
+    try:
+        streamers = await asyncio.wait_for(
+            get_all_streamers(inter.guild.id, platform="twitch"), timeout=AUTOCOMPLETE_DB_TIMEOUT
+        )
+    except asyncio.TimeoutError:
+        return []
+
+    # 只使用已快取的顯示名稱，避免在自動完成中呼叫 Twitch API
+    users = inter.bot.twitch.users
+    await index_twitch_streamers(
+        inter.guild.id,
+        {login: getattr(users.get(("login", login.lower())), "display_name", None) for login in streamers},
+    )
+
+    return await search_twitch_streamers(inter.guild.id, query) or []
+
+
 class Commands(commands.Cog):
     def __init__(self, bot: Bot):
         self.bot = bot
@@ -230,9 +256,12 @@ class Commands(commands.Cog):
             return
 
         await upsert_user(inter.guild.id, twitch_username, platform="twitch")
+        await self.bot.subscriptions.add(inter.guild.id, twitch_username)
 
-        async with AsyncTwitch(Constants.TWITCH_CLIENT_ID, Constants.TWITCH_CLIENT_SECRET) as twitch:
-            user = await twitch.get_user(twitch_username)
+        user = await self.bot.twitch.get_user(twitch_username)
+
+        # 索引尚未建立時不寫入，避免只含這位實況主的索引讓自動完成不再從資料庫建立完整索引
+        await add_twitch_streamer_to_index(inter.guild.id, twitch_username, user.display_name)
 
         embed = SuccessEmbed(
             title="🎉 新增成功",
@@ -249,7 +278,7 @@ class Commands(commands.Cog):
         inter: ApplicationCommandInteraction,
         username: str = commands.Param(
             name="實況主頻道",
-            autocomplete=lambda inter, query: search_streamers(inter.guild.id, query, platform="twitch"),
+            autocomplete=autocomplete_twitch_streamers,
             description="Twitch 用戶名稱或連結",
         ),
     ):
@@ -257,27 +286,25 @@ class Commands(commands.Cog):
 
         twitch_username = await extract_twitch_username(username)
 
-        remove = remove_twitch_guild_streamers(inter.guild.id, twitch_username)
-
         streamers = await get_all_streamers(inter.guild.id, platform="twitch")
 
         if twitch_username not in streamers:
             await inter.edit_original_response(f"❌ `{twitch_username}` 不在追蹤列表內")
             return
 
-        if remove:
-            await delete_user(inter.guild.id, twitch_username, platform="twitch")
+        await delete_user(inter.guild.id, twitch_username, platform="twitch")
+        await self.bot.subscriptions.remove(inter.guild.id, twitch_username)
+        await unindex_twitch_streamer(inter.guild.id, twitch_username)
 
-            async with AsyncTwitch(Constants.TWITCH_CLIENT_ID, Constants.TWITCH_CLIENT_SECRET) as twitch:
-                user = await twitch.get_user(twitch_username)
+        user = await self.bot.twitch.get_user(twitch_username)
 
-            embed = RemoveEmbed(
-                title="🗑️ 移除成功",
-                description=f"已從群組直播追蹤列表中移除 {user.display_name}",
-                thumbnail=user.profile_image_url,
-            )
+        embed = RemoveEmbed(
+            title="🗑️ 移除成功",
+            description=f"已從群組直播追蹤列表中移除 {user.display_name}",
+            thumbnail=user.profile_image_url,
+        )
 
-            return await inter.edit_original_response(embed=embed)
+        return await inter.edit_original_response(embed=embed)
 
     @twitch.sub_command(name=Localized("view_streamer", data={"zh-TW": "查看實況主"}), description="查看群組直播追蹤列表中的所有實況主")
     async def list_streamers(self, inter: ApplicationCommandInteraction):
@@ -290,10 +317,13 @@ class Commands(commands.Cog):
             await inter.edit_original_response(embed=embed)
             return
 
-        async with AsyncTwitch(Constants.TWITCH_CLIENT_ID, Constants.TWITCH_CLIENT_SECRET) as twitch:
-            users = await asyncio.gather(*(twitch.get_user(streamer) for streamer in streamers))
+        users = await self.bot.twitch.get_users(streamers)
 
-        description = "\n".join(f"[{user.display_name}](https://www.twitch.tv/{user.login})" for user in users)
+        description = "\n".join(
+            f"[{users[streamer.lower()].display_name if streamer.lower() in users else streamer}]"
+            f"(https://www.twitch.tv/{streamer})"
+            for streamer in streamers
+        )
 
         embed = SuccessEmbed(title="<:twitch:1343217893441011833> 目前追蹤列表 (Twitch)", description=description)
 
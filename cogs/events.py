@@ -1,13 +1,13 @@
 import asyncio
-import re
+import time
 
-from collections import defaultdict
-from typing import Dict, Set, Optional
+from functools import partial
+from typing import Awaitable, Callable, Dict, Set, Optional, List, Tuple
 
 import aiohttp
 import pytz
 
-from disnake import Embed, Color, ButtonStyle, Webhook, ApplicationCommandInteraction, Guild, NotFound, HTTPException
+from disnake import Embed, Color, ButtonStyle, Webhook, ApplicationCommandInteraction, Guild, NotFound
 from disnake.utils import MISSING
 from disnake.ui import Button
 from disnake.ext import commands, tasks
@@ -16,33 +16,24 @@ from tystream import TwitchStreamData
 import Constants
 from core.bot import Bot
 
-from tystream.async_api import AsyncTwitch
-
-from core.db import get_all_streamers, get_guild, upsert_message, get_message_id, get_action, get_webhook
-from core.embeds import TwitchVODEmbed, TwitchStreamEmbed
+from core.cache import LRUCache
+from core.db import get_guild_settings, get_guilds_settings, upsert_message
+from core.dispatcher import WebhookDispatcher
+from core.eventsub import EventSub, WebSocketEventSub, WebhookEventSub
+from core.jobs import NotificationQueue
+from core.metrics import (
+    FOLLOWED_STREAMERS, LIVE_STREAMERS, NOTIFICATION_LAG, QUEUE_BACKLOG, registry, timed_loop, track_webhook
+)
+from core.scheduler import PollScheduler
+from core.sharding import ShardCoordinator
+from core.templates import render_content
+from core.twitch import Priority
+from core.embeds import TwitchVODEmbed, TwitchStreamEmbed, TwitchLiveEmbed
 from core.redis_utils import *
+from models.settings import GuildSettings
 
 taipei_tz = pytz.timezone("Asia/Taipei")
 
-notified_streams = set()
-
-
-def replace_text(text: str, role: Optional[str] = None, streamer_name: Optional[str] = None) -> str:
-    replacements = {
-        "{everyone}": "@everyone",
-        "{here}": "@here",
-        "{role}": role if role is not None else "",
-        "{name}": streamer_name if streamer_name is not None else "",
-        "\\n": "\n"
-    }
-
-    for old, new in replacements.items():
-        text = text.replace(old, new)
-
-    text = re.sub(r'\s+', ' ', text).strip()
-
-    return text
-
 
 # async def send_yt_webhook(
 #     data, guild: Guild, stream: YoutubeStreamDataAPI | YoutubeStreamDataYTDLP, session: aiohttp.ClientSession
@@ -105,63 +96,65 @@ def replace_text(text: str, role: Optional[str] = None, streamer_name: Optional[
 #     await upsert_message(guild_id, message.id, platform="youtube")
 
 
-async def send_twitch_webhook(data, guild: Guild, stream: TwitchStreamData, session: aiohttp.ClientSession):
-    guild_id = guild.id
-
+async def send_twitch_webhook(
+    data,
+    guild: Optional[Guild],
+    stream: TwitchStreamData,
+    session: aiohttp.ClientSession,
+    embed: Optional[Embed] = None,
+    fetch_guild: Optional[Callable[[int], Awaitable[Guild]]] = None,
+):
+    """
+    以 Webhook 發送開台通知。
+
+    ``guild`` 為 None 表示 Guild 不在這個程序的快取中 (由其他 shard 負責)，
+    只有在需要私訊擁有者的警告時才以 ``fetch_guild`` 查詢，避免每則通知都多一次 REST 請求。
+    """
     if not data:
         return
 
+    guild_id = data.id
     webhook_url = data.webhook_link
 
     if not webhook_url:
+        guild = guild or await fetch_guild(guild_id)
         embed = Embed(
             title=f"⚠️ 警告 (由 {guild.name} 發出)",
             description="當您看到此訊息時，通常是因為您沒有設定通知頻道，導致通知訊息沒有正常發送，請使用`設定通知頻道`的指令設定。",
             colour=Color.yellow(),
         )
         embed.set_footer(text="• 此訊息為系統自動發送")
-        return await guild.owner.send(embed=embed)
+        owner = guild.owner or await guild.fetch_member(guild.owner_id)  # 未啟用 members intent 時不會快取成員
+        return await owner.send(embed=embed)
 
     webhook_avatar = data.webhook_avatar
     webhook_name = data.webhook_name
 
-    embed = Embed(title=stream.title, colour=Color.purple())
-    embed.set_author(
-        name=f"{stream.user.display_name} 正在直播！",
-        url=f"https://www.twitch.tv/{stream.user.login}",
-        icon_url=stream.user.profile_image_url,
-    )
-    embed.set_image(url=stream.thumbnail_url)
-    embed.add_field(
-        name="直播開始時間",
-        value=f"<t:{int(stream.started_at.astimezone(pytz.timezone('Asia/Taipei')).replace(tzinfo=None).timestamp())}:R>",
-        inline=True,
-    )
-    embed.add_field(name="遊戲", value=stream.game_name, inline=True)
-    embed.add_field(name="觀看人數", value=stream.viewer_count, inline=True)
-    embed.set_footer(
-        text="此通知由 TYStream 發布 • ㄐ器人由 鰻頭(´・ω・) 製作", icon_url="https://i.imgur.com/g1bfpCW.png"
-    )
+    embed = embed or TwitchLiveEmbed(stream)
 
-    role_mention = (
-        guild.get_role(int(data.notification_role)).mention
-        if data.notification_role and guild.get_role(int(data.notification_role))
-        else ""
-    )
+    role_mention = ""
+    if data.notification_role:
+        if guild is None:
+            role_mention = f"<@&{int(data.notification_role)}>"  # 無法確認身分組是否仍存在，直接提及
+        elif role := guild.get_role(int(data.notification_role)):
+            role_mention = role.mention
 
     content = (
-        replace_text(data.content, role_mention, stream.user.display_name) if data.content else role_mention or MISSING
+        render_content(data.content, role_mention, stream.user.display_name) if data.content else role_mention or MISSING
     )
 
     webhook = Webhook.from_url(webhook_url, session=session)
-    message = await webhook.send(
-        content=content,
-        embed=embed,
-        username=webhook_name,
-        avatar_url=webhook_avatar,
-        components=Button(label="觀看直播", style=ButtonStyle.link, url=f"https://www.twitch.tv/{stream.user.login}"),
-        wait=True,
-    )
+    with track_webhook("send"):
+        message = await webhook.send(
+            content=content,
+            embed=embed,
+            username=webhook_name,
+            avatar_url=webhook_avatar,
+            components=Button(
+                label="觀看直播", style=ButtonStyle.link, url=f"https://www.twitch.tv/{stream.user.login}"
+            ),
+            wait=True,
+        )
 
     await upsert_message(guild_id, stream.user.login, message.id, platform="twitch")
 
@@ -171,16 +164,136 @@ async def send_twitch_webhook(data, guild: Guild, stream: TwitchStreamData, sess
 class Events(commands.Cog):
     def __init__(self, bot: Bot):
         self.bot = bot
-        self.notified_streams = {}
-        self.session = None
+        self.session: Optional[aiohttp.ClientSession] = None
+        self.dispatcher = WebhookDispatcher(logger=bot.logger)
+        self.eventsub: Optional[EventSub] = None
+        self.coordinator: Optional[ShardCoordinator] = None
+        self.scheduler: Optional[PollScheduler] = None
+        self.queue: Optional[NotificationQueue] = None
+        self._queue_task: Optional[asyncio.Task] = None
+        self.claim_ttl = CLAIM_PENDING_TTL  # 開台通知的搶佔在這個秒數內未送出才可被重新搶佔
+        self._reconciled_at = 0.0  # 上一次輪詢所有 (包含 EventSub 已訂閱的) 實況主的時間
+        self.live_streamers: Set[str] = set()  # 這個程序負責的實況主中目前正在直播的人，只用於指標
+        # (工作類型, 直播資料 JSON) -> (直播資料, Embed)，同一場直播的工作只解析一次
+        self._job_streams: LRUCache[Tuple[str, str], Tuple[TwitchStreamData, Embed]] = LRUCache(maxsize=1024, ttl=300)
+
+    async def cog_load(self):
+        connector = aiohttp.TCPConnector(limit=100, limit_per_host=50, ttl_dns_cache=300, keepalive_timeout=60)
+        self.session = aiohttp.ClientSession(connector=connector)
+
+        match Constants.TWITCH_EVENTSUB_MODE:
+            case "websocket":
+                self.eventsub = WebSocketEventSub(
+                    self.bot.twitch,
+                    self.on_stream_online,
+                    self.on_stream_offline,
+                    logger=self.bot.logger,
+                    url=Constants.TWITCH_EVENTSUB_WS_URL,
+                    user_token=Constants.TWITCH_EVENTSUB_USER_TOKEN,
+                )
+            case "webhook":
+                self.eventsub = WebhookEventSub(
+                    self.bot.twitch,
+                    self.on_stream_online,
+                    self.on_stream_offline,
+                    logger=self.bot.logger,
+                    callback_url=Constants.TWITCH_EVENTSUB_CALLBACK_URL,
+                    secret=Constants.TWITCH_EVENTSUB_SECRET,
+                    host=Constants.TWITCH_EVENTSUB_HOST,
+                    port=Constants.TWITCH_EVENTSUB_PORT,
+                )
+
+        if Constants.TWITCH_SHARD_COUNT:
+            self.coordinator = ShardCoordinator(
+                r,
+                worker_id=Constants.WORKER_ID,
+                shard_count=Constants.TWITCH_SHARD_COUNT,
+                lease_ttl=Constants.TWITCH_SHARD_LEASE_TTL,
+                logger=self.bot.logger,
+            )
+            self.refresh_shards.change_interval(seconds=max(1, Constants.TWITCH_SHARD_LEASE_TTL // 3))
+
+        if self.eventsub is None and Constants.TWITCH_POLL_BUDGET:
+            self.scheduler = PollScheduler(
+                budget=Constants.TWITCH_POLL_BUDGET,
+                load_history=get_twitch_schedules,
+                save_history=save_twitch_schedules,
+            )
+
+        if Constants.NOTIFICATION_QUEUE:
+            self.queue = NotificationQueue(
+                r,
+                consumer=Constants.WORKER_ID,
+                concurrency=Constants.NOTIFICATION_WORKERS,
+                max_attempts=Constants.NOTIFICATION_MAX_ATTEMPTS,
+                retry_after=Constants.NOTIFICATION_RETRY_AFTER,
+                logger=self.bot.logger,
+            )
+            # 工作在佇列中重試期間搶佔不能過期，否則下一輪輪詢會再排入同一則開台通知
+            self.claim_ttl = CLAIM_PENDING_TTL + int(self.queue.retry_window)
+
+        registry.add_collector(self.collect_metrics)
+
+    def cog_unload(self):
+        self.check_twitch_stream.cancel()
+        self.update_live_messages.cancel()
+        self.refresh_shards.cancel()
+
+        registry.remove_collector(self.collect_metrics)
+
+        if self.queue:
+            self.queue.stop()
+
+        if self._queue_task:
+            self._queue_task.cancel()
+
+        if self.coordinator:
+            self.bot.loop.create_task(self.coordinator.stop())
+
+        if self.eventsub:
+            self.bot.loop.create_task(self.eventsub.close())
+
+        if self.session and not self.session.closed:
+            self.bot.loop.create_task(self.session.close())
 
     @commands.Cog.listener()
     async def on_ready(self):
         self.bot.logger.info(f"Cog {self.__class__.__name__} has started")
+
+        await self.bot.subscriptions.load()
+
+        if self.queue and self._queue_task is None:
+            self._queue_task = asyncio.create_task(self.queue.run(self.handle_job))
+
+        if self.coordinator:
+            await self.coordinator.refresh()
+            self.refresh_shards.start()
+
+        if self.eventsub:
+            # 由 EventSub 即時推送開台/關台，已訂閱的實況主在 check_twitch_stream 中只做低頻率的校正
+            await self.eventsub.start()
+
         self.check_twitch_stream.start()
         self.update_live_messages.start()
         # self.check_youtube_stream.start()
 
+    async def collect_metrics(self):
+        """在抓取指標時才更新的數值"""
+        LIVE_STREAMERS.set(len(self.live_streamers))
+
+        if self.queue:
+            unread, pending = await self.queue.backlog()
+            QUEUE_BACKLOG.set(unread, state="unread")
+            QUEUE_BACKLOG.set(pending, state="pending")
+
+    @commands.Cog.listener()
+    async def on_guild_join(self, guild: Guild):
+        await self.bot.subscriptions.load_guild(guild.id)
+
+    @commands.Cog.listener()
+    async def on_guild_remove(self, guild: Guild):
+        await self.bot.subscriptions.remove_guild(guild.id)
+
     @commands.Cog.listener()
     async def on_slash_command_error(self, inter: ApplicationCommandInteraction, error: commands.CommandError):
         if isinstance(error, commands.MissingPermissions):
@@ -263,129 +376,394 @@ class Events(commands.Cog):
     #                         f"{streamer} not live. (Youtube)",
     #                     )
 
+    @tasks.loop(seconds=10)
+    @timed_loop("refresh_shards")
+    async def refresh_shards(self):
+        """續約分片租約，並在 worker 增減時重新分配負責的實況主"""
+        await self.coordinator.refresh()
+
     @tasks.loop(minutes=5)
+    @timed_loop("update_live_messages")
     async def update_live_messages(self):
-        # Use the shared session instead of creating a new one
-        async with AsyncTwitch(Constants.TWITCH_CLIENT_ID, Constants.TWITCH_CLIENT_SECRET) as twitch:
-            async with aiohttp.ClientSession() as session:
-                for guild in self.bot.guilds:
-                    streamers = get_twitch_guild_streamers(guild.id)
-
-                    for streamer in streamers:
-                        message_id = get_twitch_message_id(guild.id, streamer)
-                        webhook_url = await get_webhook(guild.id, platform="twitch")
-
-                        if not message_id or not webhook_url:
-                            continue
-
-                        webhook = Webhook.from_url(str(webhook_url), session=session)
-                        live_data = await twitch.check_stream_live(streamer)
-
-                        if isinstance(live_data, TwitchStreamData):
-                            print("編輯訊息 啟動!")
-                            embed = TwitchStreamEmbed(live_data)
-                            try:
-                                await webhook.edit_message(message_id, embed=embed)
-                            except NotFound:
-                                self.bot.logger.warning(f"訊息 {message_id} 已被刪除: {streamer}.")
-                                clear_twitch_notified_streamer(streamer)
-                            except HTTPException as e:
-                                self.bot.logger.error(f"無法編輯消息 {message_id} - {streamer}: {e}")
+        subscriptions = self.bot.subscriptions
+
+        message_ids = await get_twitch_message_ids(
+            (guild_id, streamer)
+            for streamer in subscriptions.streamers
+            if self.coordinator is None or self.coordinator.owns(streamer)
+            for guild_id in subscriptions.guilds_for(streamer)
+        )
+
+        if not message_ids:
+            return
+
+        guild_settings = await get_guilds_settings({guild_id for guild_id, _ in message_ids}, platform="twitch")
+        message_ids = {
+            pair: message_id
+            for pair, message_id in message_ids.items()
+            if pair[0] in guild_settings and guild_settings[pair[0]].webhook_link
+        }
+
+        try:
+            live_streams = await self.bot.twitch.check_streams_live(
+                {streamer for _, streamer in message_ids}, priority=Priority.REFRESH
+            )
+        except Exception as e:
+            self.bot.logger.error(f"Twitch API Error: {e}")
+            return
+
+        if self.queue:
+            streams = {streamer: live_data.model_dump_json() for streamer, live_data in live_streams.items()}
+            count = await self.queue.publish(
+                {"type": "refresh", "guild": guild_id, "streamer": streamer, "message": message_id,
+                 "stream": streams[streamer], "detected_at": time.time()}
+                for (guild_id, streamer), message_id in message_ids.items()
+                if streamer in streams
+            )
+            self.bot.logger.info(f"排入 {count} 則直播通知的更新 ({len(streams)} 位實況主)")
+            return
+
+        embeds = {streamer: TwitchStreamEmbed(live_data) for streamer, live_data in live_streams.items()}
+
+        targets = [(pair, message_id) for pair, message_id in message_ids.items() if pair[1] in embeds]
+        jobs = [
+            (
+                guild_settings[guild_id].webhook_link,
+                partial(self.edit_live_message, guild_settings[guild_id], streamer, message_id, embeds[streamer]),
+            )
+            for (guild_id, streamer), message_id in targets
+        ]
+
+        self.bot.logger.info(f"編輯 {len(jobs)} 則直播通知 ({len(embeds)} 位實況主)")
+
+        results = await self.dispatcher.fan_out(jobs)
+
+        for ((guild_id, streamer), message_id), result in zip(targets, results):
+            if isinstance(result, Exception):
+                self.bot.logger.error(f"無法編輯消息 {message_id} - Guild {guild_id} {streamer}: {result}")
+
+    async def edit_live_message(self, settings: GuildSettings, streamer: str, message_id: str, embed: Embed):
+        webhook = Webhook.from_url(str(settings.webhook_link), session=self.session)
+
+        try:
+            with track_webhook("edit"):
+                await webhook.edit_message(int(message_id), embed=embed)
+        except NotFound:
+            self.bot.logger.warning(f"訊息 {message_id} 已被刪除: {streamer}.")
+            await clear_twitch_notified_streamer(settings.id, streamer, expected=str(message_id))
 
     @tasks.loop(seconds=10)
+    @timed_loop("check_twitch_stream")
     async def check_twitch_stream(self):
-        streamer_guilds_map: Dict[str, Set[int]] = defaultdict(set)
-
-        for guild in self.bot.guilds:
-            streamers = await get_all_streamers(guild.id, platform="twitch")
-
-            cache_twitch_guild_streamers(guild.id, list(streamers.keys()))
-
-            for streamer in streamers.keys():
-                streamer_guilds_map[streamer].add(guild.id)
-
-        all_streamers = list(streamer_guilds_map.keys())
-
-        stream_status = {s: is_twitch_streamer_live(s) for s in all_streamers}
-
-        self.bot.logger.debug(f"初始 Stream 狀態: {stream_status}")
-
-        streamers_to_check = [s for s, live in stream_status.items() if live != 1]
-
-        print("Streamer Guilds Map:", streamer_guilds_map)
-        print("all streamers:", all_streamers)
-        async with AsyncTwitch(Constants.TWITCH_CLIENT_ID, Constants.TWITCH_CLIENT_SECRET) as twitch:
-            if streamers_to_check:
-                tasks_list = [twitch.check_stream_live(s) for s in streamers_to_check]
-                results = await asyncio.gather(*tasks_list, return_exceptions=True)
-
-                for streamer, result in zip(streamers_to_check, results):
-                    if isinstance(result, Exception):
-                        self.bot.logger.error(f"Twitch API Error for {streamer}: {result}")
-                        continue
-
-                    if isinstance(result, TwitchStreamData):
-                        stream_status[streamer] = result
-                        cache_twitch_streamer_live(streamer)
-                    else:
-                        prev_live_status = is_twitch_streamer_live(streamer)
-                        if prev_live_status:
-                            self.bot.logger.debug(f"{streamer} 可能短暫掉線，暫不通知離線")
-                            continue
-                        stream_status[streamer] = None
-
-            async with aiohttp.ClientSession() as session:
-                for streamer, live_data in stream_status.items():
-                    streamer_name = streamer.decode('utf-8') if isinstance(streamer, bytes) else streamer
-
-                    if isinstance(live_data, TwitchStreamData) or live_data == 1:
-                        if live_data == 1:
-                            live_data = await twitch.check_stream_live(streamer)
-
-                        for guild_id in streamer_guilds_map[streamer]:
-                            if not has_twitch_notified(guild_id, streamer):
-                                data = await get_guild(guild_id, platform="twitch")
-                                self.bot.logger.info(f"🔔 Guild {guild_id}: {streamer_name} 正在直播 (Twitch)！")
-                                message = await send_twitch_webhook(
-                                    data, self.bot.get_guild(guild_id), live_data, session
-                                )
-                                mark_twitch_as_notified(guild_id, streamer, message.id)
-
-                    else:
-                        for guild_id in streamer_guilds_map[streamer]:
-                            if has_twitch_notified(guild_id, streamer):
-                                action = await get_action(guild_id, platform="twitch")
-                                message_id = await get_message_id(guild_id, streamer, platform="twitch")
-                                webhook_url = await get_webhook(guild_id, platform="twitch")
-
-                                if not message_id or not webhook_url:
-                                    clear_twitch_notified_streamer(guild_id, streamer)
-                                    continue
-
-                                webhook = Webhook.from_url(str(webhook_url), session=session)
-
-                                try:
-                                    if action == 0:
-                                        await webhook.delete_message(message_id)
-                                        clear_twitch_notified_streamer(guild_id, streamer)
-                                    elif action == 1:
-                                        vod = await twitch.get_latest_stream_vod(streamer_name)
-                                        if vod:
-                                            embed = TwitchVODEmbed(vod)
-                                            await webhook.edit_message(
-                                                message_id,
-                                                content=f"{(await twitch.get_user(streamer_name)).display_name} **已結束直播**",
-                                                embed=embed,
-                                                components=Button(
-                                                    label="觀看VOD", style=ButtonStyle.link, url=str(vod.url)
-                                                ),
-                                            )
-                                            clear_twitch_notified_streamer(guild_id, streamer)
-                                except NotFound:
-                                    self.bot.logger.warning(f"訊息 {message_id} 不存在，可能已被刪除: {streamer_name}.")
-                                    clear_twitch_notified_streamer(guild_id, streamer)
-                                except HTTPException as e:
-                                    self.bot.logger.error(f"無法刪除/編輯訊息 {message_id} - {streamer_name}: {e}")
+        subscriptions = self.bot.subscriptions
+
+        if not subscriptions.loaded:
+            return
+
+        await subscriptions.refresh()
+
+        all_streamers = list(subscriptions.streamers)
+
+        if self.coordinator:
+            all_streamers = self.coordinator.filter(all_streamers)
+
+        FOLLOWED_STREAMERS.set(len(all_streamers))
+        self.live_streamers.intersection_update(all_streamers)
+
+        if self.eventsub:
+            await self.eventsub.sync(all_streamers)
+
+            # 超過訂閱上限或訂閱失敗的實況主照常輪詢，其餘只在每 TWITCH_RECONCILE_INTERVAL 秒校正一次
+            if time.monotonic() - self._reconciled_at >= Constants.TWITCH_RECONCILE_INTERVAL:
+                self._reconciled_at = time.monotonic()
+            else:
+                all_streamers = [streamer for streamer in all_streamers if not self.eventsub.covers(streamer)]
+
+        # 依開台習慣只輪詢這一輪到期的實況主
+        polled = await self.scheduler.due(all_streamers) if self.scheduler else all_streamers
+
+        if not polled:
+            return
+
+        streamer_guilds_map = subscriptions.snapshot(polled)
+
+        self.bot.logger.debug("輪詢 %s/%s 位實況主", len(polled), len(all_streamers))
+
+        stream_status = await are_twitch_streamers_live(polled)
+
+        self.bot.logger.debug("初始 Stream 狀態: %s", stream_status)
+
+        twitch = self.bot.twitch
+
+        try:
+            live_streams = await twitch.check_streams_live(polled)
+        except Exception as e:
+            self.bot.logger.error(f"Twitch API Error: {e}")
+            return
+
+        for streamer in polled:
+            if streamer in live_streams:
+                stream_status[streamer] = live_streams[streamer]
+            elif stream_status[streamer]:
+                self.bot.logger.debug(f"{streamer} 可能短暫掉線，暫不通知離線")
+            else:
+                stream_status[streamer] = None
+
+            if stream_status[streamer]:
+                self.live_streamers.add(streamer)
+            else:
+                self.live_streamers.discard(streamer)
+
+        await cache_twitch_streamers_live(live_streams.keys(), Constants.TWITCH_OFFLINE_GRACE)
+
+        if self.scheduler:
+            for streamer in polled:
+                await self.scheduler.record(streamer, bool(stream_status[streamer]))
+
+        # 輪詢期間追蹤列表可能被指令修改，使用決定輪詢對象時的副本
+        await self.dispatch_stream_status(stream_status, streamer_guilds_map)
+
+    async def on_stream_online(self, streamer: str):
+        """EventSub stream.online：取得直播資料後走與輪詢相同的通知流程"""
+        streamer_guilds_map = self.bot.subscriptions.snapshot([streamer])
+
+        if not streamer_guilds_map[streamer]:
+            return
+
+        for _ in range(3):
+            live_streams = await self.bot.twitch.check_streams_live([streamer])
+            if streamer in live_streams:
+                break
+            await asyncio.sleep(5)  # Helix /streams 可能比 EventSub 晚幾秒才出現該直播
+        else:
+            self.bot.logger.warning(f"EventSub: {streamer} 已開台，但 Helix 查無直播資料")
+            return
+
+        await cache_twitch_streamers_live([streamer], Constants.TWITCH_OFFLINE_GRACE)
+        self.live_streamers.add(streamer)
+        await self.dispatch_stream_status({streamer: live_streams[streamer]}, streamer_guilds_map)
+
+    async def on_stream_offline(self, streamer: str):
+        """EventSub stream.offline：清除直播狀態並執行直播結束後的動作"""
+        streamer_guilds_map = self.bot.subscriptions.snapshot([streamer])
+
+        await clear_twitch_streamer_live(streamer)
+        self.live_streamers.discard(streamer)
+
+        if streamer_guilds_map[streamer]:
+            await self.dispatch_stream_status({streamer: None}, streamer_guilds_map)
+
+    async def dispatch_stream_status(
+        self,
+        stream_status: Dict[str, Optional[TwitchStreamData | bool]],
+        streamer_guilds_map: Dict[str, Set[int]],
+    ):
+        """依照每位實況主的狀態，並行發送開台通知或執行直播結束後的動作"""
+        claimed = await claim_twitch_notifications(
+            (
+                (guild_id, streamer)
+                for streamer, live_data in stream_status.items()
+                if isinstance(live_data, TwitchStreamData)
+                for guild_id in streamer_guilds_map[streamer]
+            ),
+            pending_ttl=self.claim_ttl,
+        )
+        # {(Guild, 實況主): offline 標記}，每次關台只會標記一次，之後的輪詢不會重複排入
+        ended = await mark_twitch_offline(
+            (guild_id, streamer)
+            for streamer, live_data in stream_status.items()
+            if live_data is None
+            for guild_id in streamer_guilds_map[streamer]
+        )
+
+        if not claimed and not ended:
+            return
+
+        detected_at = time.time()
+
+        if self.queue:
+            # 只寫入佇列，實際發送由佇列的 worker 執行，輪詢不需等待 Discord
+            jobs = []
+
+            for streamer, live_data in stream_status.items():
+                if isinstance(live_data, TwitchStreamData):
+                    stream = live_data.model_dump_json()
+                    jobs.extend(
+                        {"type": "live", "guild": guild_id, "streamer": streamer, "stream": stream,
+                         "detected_at": detected_at}
+                        for guild_id in streamer_guilds_map[streamer]
+                        if (guild_id, streamer) in claimed
+                    )
+                elif live_data is None:
+                    jobs.extend(
+                        {"type": "offline", "guild": guild_id, "streamer": streamer,
+                         "marker": ended[(guild_id, streamer)], "detected_at": detected_at}
+                        for guild_id in streamer_guilds_map[streamer]
+                        if (guild_id, streamer) in ended
+                    )
+
+            await self.queue.publish(jobs)
+            return
+
+        # 只有這一輪需要發送/編輯/刪除訊息的 Guild 才需要通知設定
+        guild_settings = await get_guilds_settings({guild_id for guild_id, _ in claimed | ended.keys()}, platform="twitch")
+
+        targets: List[Tuple[int, str]] = []
+        jobs = []
+        embeds: Dict[str, Embed] = {}  # 每場直播只建立一次，所有 Guild 共用
+
+        for streamer, live_data in stream_status.items():
+            if live_data is True:
+                continue
+
+            for guild_id in streamer_guilds_map[streamer]:
+                settings = guild_settings.get(guild_id)
+                if settings is None:
+                    continue
+
+                bucket = settings.webhook_link or str(guild_id)
+
+                if isinstance(live_data, TwitchStreamData):
+                    if (guild_id, streamer) in claimed:
+                        if streamer not in embeds:
+                            embeds[streamer] = TwitchLiveEmbed(live_data)
+                        targets.append((guild_id, streamer))
+                        notify = partial(
+                            self.notify_live, settings, streamer, live_data, embeds[streamer], detected_at
+                        )
+                        jobs.append((bucket, notify))
+                elif (guild_id, streamer) in ended:
+                    targets.append((guild_id, streamer))
+                    notify = partial(self.notify_offline, settings, streamer, ended[(guild_id, streamer)], detected_at)
+                    jobs.append((bucket, notify))
+
+        results = await self.dispatcher.fan_out(jobs)
+
+        for (guild_id, streamer), result in zip(targets, results):
+            if isinstance(result, Exception):
+                self.bot.logger.error(f"無法傳送/刪除/編輯訊息 - Guild {guild_id} {streamer}: {result}")
+
+                if (guild_id, streamer) in claimed:
+                    await release_twitch_claim(guild_id, streamer)
+                elif (guild_id, streamer) in ended:
+                    await restore_twitch_offline(guild_id, streamer, ended[(guild_id, streamer)])
+
+    async def handle_job(self, job: dict):
+        """執行通知佇列中的工作，拋出例外時由佇列稍後重試"""
+        guild_id, streamer = job["guild"], job["streamer"]
+
+        settings = await get_guild_settings(guild_id, platform="twitch")
+        if settings is None or streamer not in settings.streamers:
+            # 快取可能早於其他程序的修改 (例如剛在別的 shard 新增的追蹤)，以資料庫為準再確認一次
+            settings = await get_guild_settings(guild_id, platform="twitch", refresh=True)
+            if settings is None or streamer not in settings.streamers:
+                return  # Guild 已移除設定或不再追蹤該實況主
+
+        bucket = settings.webhook_link or str(guild_id)
+
+        match job["type"]:
+            case "live":
+                # 每次嘗試都延長搶佔；通知已送出 (重複的工作) 或搶佔已被清除時略過
+                if not await renew_twitch_claim(guild_id, streamer):
+                    return
+                live_data, embed = self.job_stream(job, TwitchLiveEmbed)
+                await self.dispatcher.send(
+                    bucket, partial(self.notify_live, settings, streamer, live_data, embed, job["detected_at"])
+                )
+            case "offline":
+                await self.dispatcher.send(
+                    bucket, partial(self.notify_offline, settings, streamer, job["marker"], job["detected_at"])
+                )
+            case "refresh":
+                # 工作在佇列中等待或重試期間直播可能已結束 (訊息已改為 VOD 或刪除)，只更新仍是目前通知的訊息
+                if await get_twitch_message_id(guild_id, streamer) != str(job["message"]):
+                    return
+                _, embed = self.job_stream(job, TwitchStreamEmbed)
+                await self.dispatcher.send(
+                    bucket, partial(self.edit_live_message, settings, streamer, job["message"], embed)
+                )
+                NOTIFICATION_LAG.observe(time.time() - job["detected_at"], type="refresh")
+
+    def job_stream(self, job: dict, embed_class) -> Tuple[TwitchStreamData, Embed]:
+        key = (job["type"], job["stream"])
+        cached = self._job_streams.get(key)
+
+        if cached is None:
+            live_data = TwitchStreamData.model_validate_json(job["stream"])
+            cached = (live_data, embed_class(live_data))
+            self._job_streams.set(key, cached)
+
+        return cached
+
+    async def notify_live(
+        self,
+        settings: GuildSettings,
+        streamer: str,
+        live_data: TwitchStreamData,
+        embed: Optional[Embed] = None,
+        detected_at: Optional[float] = None,
+    ):
+        guild_id = settings.id
+        # 佇列的工作可能由負責其他 shard 的程序處理，此時 Guild 不在快取中，只在需要時才查詢
+        guild = self.bot.get_guild(guild_id)
+
+        self.bot.logger.info(f"🔔 Guild {guild_id}: {streamer} 正在直播 (Twitch)！")
+        message = await send_twitch_webhook(
+            settings, guild, live_data, self.session, embed, fetch_guild=self.bot.fetch_guild
+        )
+        await mark_twitch_as_notified(guild_id, streamer, message.id)
+
+        if detected_at:
+            NOTIFICATION_LAG.observe(time.time() - detected_at, type="live")
+
+    async def notify_offline(
+        self, settings: GuildSettings, streamer: str, marker: str, detected_at: Optional[float] = None
+    ):
+        """
+        執行直播結束後的動作，``marker`` 為 :func:`mark_twitch_offline` 寫入的 offline 標記。
+
+        執行前先確認標記仍在：過時的工作 (例如實況主已再次開台並送出新通知) 不會編輯或清除新的訊息與搶佔。
+        動作失敗時會拋出例外並保留標記，由呼叫端決定重試或還原。
+        """
+        guild_id = settings.id
+        action = settings.when_live_end
+        message_id = twitch_offline_message_id(marker)
+        webhook_url = settings.webhook_link
+
+        if await get_twitch_message_id(guild_id, streamer) != marker:
+            self.bot.logger.debug("略過過時的關台工作: Guild %s %s", guild_id, streamer)
+            return
+
+        if not webhook_url:
+            await clear_twitch_notified_streamer(guild_id, streamer, expected=marker)
+            return
+
+        webhook = Webhook.from_url(str(webhook_url), session=self.session)
+
+        try:
+            if action == 0:
+                with track_webhook("delete"):
+                    await webhook.delete_message(int(message_id))
+            elif action == 1:
+                vod = await self.bot.twitch.get_latest_stream_vod(streamer)
+                if vod:
+                    embed = TwitchVODEmbed(vod)
+                    with track_webhook("edit"):
+                        await webhook.edit_message(
+                            int(message_id),
+                            content=f"{vod.user_name} **已結束直播**",
+                            embed=embed,
+                            components=Button(label="觀看VOD", style=ButtonStyle.link, url=str(vod.url)),
+                        )
+                else:
+                    self.bot.logger.debug("%s 沒有可用的 VOD，保留原本的通知訊息", streamer)
+        except NotFound:
+            self.bot.logger.warning(f"訊息 {message_id} 不存在，可能已被刪除: {streamer}.")
+
+        await clear_twitch_notified_streamer(guild_id, streamer, expected=marker)
+
+        if detected_at:
+            NOTIFICATION_LAG.observe(time.time() - detected_at, type="offline")
 
 
 def setup(bot: Bot):
@@ -1,16 +1,95 @@
 from logging import Logger
+from typing import Any, Dict, List
 
-from disnake.ext.commands import InteractionBot as OriginalBot
+from disnake import Intents, MemberCacheFlags
+from disnake.ext.commands import AutoShardedInteractionBot as OriginalBot
 
+import Constants
 from core.db import create_table
+from core.metrics import MetricsServer, registry
+from core.redis_utils import cache_twitch_user_profiles, get_twitch_user_profiles
+from core.subscriptions import SubscriptionIndex
+from core.twitch import TwitchClient
+
+
+def gateway_options(low_memory: bool = True) -> Dict[str, Any]:
+    """
+    Gateway 連線與快取相關的 Bot 參數。
+
+    低記憶體模式只訂閱指令與通知實際用到的 guilds / webhooks 事件 (Guild、頻道、身分組)，
+    關閉成員快取、啟動時的成員分塊請求與訊息快取；完整模式則與先前的 ``Intents.all()`` 相同。
+    """
+    if not low_memory:
+        return {"intents": Intents.all()}
+
+    return {
+        "intents": Intents(guilds=True, webhooks=True),
+        "member_cache_flags": MemberCacheFlags.none(),
+        "chunk_guilds_at_startup": False,
+        "max_messages": None,
+    }
 
 
 class Bot(OriginalBot):
     def __init__(self, logger: Logger, **kwargs):
+        kwargs.setdefault("shard_count", Constants.DISCORD_SHARD_COUNT)
+        kwargs.setdefault("shard_ids", Constants.DISCORD_SHARD_IDS)
+
+        shard_ids, shard_count = kwargs["shard_ids"], kwargs["shard_count"]
+        if Constants.TWITCH_SHARD_COUNT and shard_ids is not None and set(shard_ids) != set(range(shard_count or 0)):
+            # 追蹤索引只包含本程序 shard 中的 Guild，租約卻是全域分配的：
+            # 持有租約的程序只會通知自己 shard 中的 Guild，其他程序的 Guild 永遠收不到該實況主的通知
+            raise ValueError(
+                "DISCORD_SHARD_IDS 將 Discord shard 分散到多個程序時不支援 TWITCH_SHARD_COUNT，"
+                "請讓每個程序各自輪詢 (TWITCH_SHARD_COUNT=0)，或由單一程序負責所有 Discord shard"
+            )
+
         super().__init__(**kwargs)
 
         self.logger = logger
+        self.twitch = TwitchClient(
+            Constants.TWITCH_CLIENT_ID,
+            Constants.TWITCH_CLIENT_SECRET,
+            eventsub_url=Constants.TWITCH_EVENTSUB_SUBSCRIPTION_URL,
+            load_profiles=get_twitch_user_profiles,
+            save_profiles=cache_twitch_user_profiles,
+        )
+        self.metrics = (
+            MetricsServer(registry, Constants.METRICS_HOST, Constants.METRICS_PORT, logger=logger)
+            if Constants.METRICS_PORT
+            else None
+        )
+        self.subscriptions = SubscriptionIndex(
+            self.shard_guild_ids, owns_guild=lambda guild_id: self.get_guild(guild_id) is not None
+        )
 
-    async def on_ready(self):
+    async def start(self, *args, **kwargs):
+        # 必須在連線 Gateway 之前完成：Cog 的 on_ready 會立即從資料表載入追蹤索引
         await create_table()
-        self.logger.info("The bot is ready! Logged in as %s" % self.user)
\ No newline at end of file
+        await self.twitch.start()
+        if self.metrics:
+            await self.metrics.start()
+        await super().start(*args, **kwargs)
+
+    async def close(self):
+        await self.twitch.close()
+        if self.metrics:
+            await self.metrics.close()
+        await super().close()
+
+    def shard_guild_ids(self) -> List[int]:
+        """
+        這個程序負責的 shard 中、目前可用的 Guild ID。
+
+        已斷線的 shard 中的 Guild 會被略過，等重新連線後再處理；
+        多個程序分別負責不同 shard 時，每個程序只會處理自己 shard 的 Guild。
+        """
+        connected = {shard_id for shard_id, shard in self.shards.items() if not shard.is_closed()}
+
+        return [guild.id for guild in self.guilds if guild.shard_id in connected and not guild.unavailable]
+
+    async def on_ready(self):
+        self.logger.info("The bot is ready! Logged in as %s" % self.user)
+
+    async def on_shard_ready(self, shard_id: int):
+        self.logger.info("Shard %s/%s is ready", shard_id, self.shard_count)
@@ -1,18 +1,38 @@
 from contextlib import asynccontextmanager
+from datetime import datetime, timezone
+from time import perf_counter
 
-from typing import Dict, Optional, List
+from typing import Dict, Optional, List, Iterable
 
-from sqlalchemy import select
+from sqlalchemy import select, update, delete, and_, event
+from sqlalchemy.dialects.sqlite import insert
 from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession
 from sqlalchemy.orm import sessionmaker
-from sqlalchemy.orm.attributes import flag_modified
 
-from models.platform import TwitchGuilds, YouTubeGuilds
+from models.platform import TwitchGuilds, YouTubeGuilds, GuildStreamers
+from models.settings import GuildSettings
 from core.base import Base
+from core.cache import LRUCache
+from core.metrics import DB_QUERY_DURATION
 
 DATABASE_URL = "sqlite+aiosqlite:///tystream.db"
 engine = create_async_engine(DATABASE_URL, echo=False, connect_args={'check_same_thread': False})
 
+
+# 記錄每個 SQL 語句的執行時間 (以 SELECT / INSERT / UPDATE 等語句類型分類)
+@event.listens_for(engine.sync_engine, "before_cursor_execute")
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if context is not None:
+        context.query_started_at = perf_counter()
+
+
+@event.listens_for(engine.sync_engine, "after_cursor_execute")
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    started = getattr(context, "query_started_at", None)
+    if started is not None:
+        DB_QUERY_DURATION.observe(perf_counter() - started, statement=statement.split(None, 1)[0].upper())
+
+
 AsyncSessionLocal = sessionmaker(
     autocommit=False,
     autoflush=False,
@@ -21,6 +41,15 @@ AsyncSessionLocal = sessionmaker(
     expire_on_commit=False,
 )
 
+GUILD_SETTINGS_CACHE_SIZE = 10000
+GUILD_SETTINGS_CACHE_TTL = 300  # 其他程序修改的設定最多延遲這麼久才會在這個程序生效
+SQL_IN_CHUNK_SIZE = 500  # 避免單一 IN 查詢超過 SQLite 的參數數量上限
+
+# (platform, guild_id) -> GuildSettings，由 get_all_guild_settings 填入，並由各個 upsert_* 同步寫入
+guild_settings_cache: LRUCache[tuple, GuildSettings] = LRUCache(
+    maxsize=GUILD_SETTINGS_CACHE_SIZE, ttl=GUILD_SETTINGS_CACHE_TTL
+)
+
 @asynccontextmanager
 async def async_session_scope():
     session = AsyncSessionLocal()
@@ -37,6 +66,77 @@ async def create_table():
     async with engine.begin() as conn:
         await conn.run_sync(Base.metadata.create_all)
 
+    await migrate_json_streamers()
+
+
+async def migrate_json_streamers():
+    """將舊版 JSON 欄位中的追蹤列表搬到 guild_streamers，搬完後清空 JSON 欄位，因此只會執行一次"""
+    async with async_session_scope() as session:
+        for platform, model in (("twitch", TwitchGuilds), ("youtube", YouTubeGuilds)):
+            result = await session.execute(select(model.id, model.streamers))
+
+            rows = [
+                {"guild_id": guild_id, "platform": platform, "streamer": streamer, "message_id": message_id}
+                for guild_id, streamers in result
+                if isinstance(streamers, dict)
+                for streamer, message_id in streamers.items()
+            ]
+
+            if not rows:
+                continue
+
+            for i in range(0, len(rows), SQL_IN_CHUNK_SIZE):
+                await session.execute(
+                    insert(GuildStreamers).values(rows[i:i + SQL_IN_CHUNK_SIZE]).on_conflict_do_nothing()
+                )
+            await session.execute(update(model).values(streamers={}))
+
+
+def _write_through(guild: TwitchGuilds | YouTubeGuilds, platform: str):
+    """將剛寫入資料庫的設定同步到快取中 (只更新已快取的 Guild)"""
+    settings = guild_settings_cache.get((platform, guild.id))
+    if settings is None:
+        return
+
+    settings.content = guild.content
+    settings.channel_id = guild.channel_id
+    settings.webhook_link = guild.webhook_link
+    settings.webhook_name = guild.webhook_name
+    settings.webhook_avatar = guild.webhook_avatar
+    settings.notification_role = guild.notification_role
+    settings.when_live_end = guild.when_live_end
+
+
+def _cached_streamers(guild_id: int, platform: str) -> Optional[Dict[str, Optional[int]]]:
+    settings = guild_settings_cache.get((platform, guild_id))
+    return settings.streamers if settings else None
+
+
+async def get_guild_settings(guild_id: int, platform: str, refresh: bool = False) -> Optional[GuildSettings]:
+    """優先從快取取得 Guild 設定，快取沒有或指定 ``refresh`` 時才查詢資料庫"""
+    settings = None if refresh else guild_settings_cache.get((platform, guild_id))
+    if settings is None:
+        settings = (await get_all_guild_settings(platform, [guild_id])).get(guild_id)
+    return settings
+
+
+async def get_guilds_settings(guild_ids: Iterable[int], platform: str) -> Dict[int, GuildSettings]:
+    """批次版的 :func:`get_guild_settings`，快取中沒有的 Guild 以單次查詢載入"""
+    guilds: Dict[int, GuildSettings] = {}
+    missing = []
+
+    for guild_id in guild_ids:
+        settings = guild_settings_cache.get((platform, guild_id))
+        if settings is None:
+            missing.append(guild_id)
+        else:
+            guilds[guild_id] = settings
+
+    if missing:
+        guilds.update(await get_all_guild_settings(platform, missing))
+
+    return guilds
+
 
 async def get_guild(guild_id: int, platform: str) -> TwitchGuilds | YouTubeGuilds:
     async with async_session_scope() as session:
@@ -66,43 +166,44 @@ async def upsert_notification_content_and_role(guild_id: int, role_id: int, cont
 
         session.add(guild)
 
+    _write_through(guild, platform)
 
 
 async def upsert_message(guild_id: int, streamer: str, message_id: int, platform: str):
     async with async_session_scope() as session:
-        model = TwitchGuilds if platform == "twitch" else YouTubeGuilds
-        stmt = select(model).where(model.id == guild_id)
-        result = await session.execute(stmt)
-        guild = result.scalar()
-
-        if guild:
-            guild.streamers[streamer] = message_id
-        else:
-            guild = model(id=guild_id, streamers={streamer: message_id})
-        
-        flag_modified(guild, "streamers")
+        stmt = (
+            insert(GuildStreamers)
+            .values(
+                guild_id=guild_id,
+                platform=platform,
+                streamer=streamer,
+                message_id=message_id,
+                notified_at=datetime.now(timezone.utc),
+            )
+            .on_conflict_do_update(
+                index_elements=["guild_id", "platform", "streamer"],
+                set_={"message_id": message_id, "notified_at": datetime.now(timezone.utc)},
+            )
+        )
+        await session.execute(stmt)
 
-        session.add(guild)
+    streamers = _cached_streamers(guild_id, platform)
+    if streamers is not None:
+        streamers[streamer] = message_id
 
 async def upsert_user(guild_id: int, streamer: str, platform: str):
     async with async_session_scope() as session:
         model = TwitchGuilds if platform == "twitch" else YouTubeGuilds
-        stmt = select(model).where(model.id == guild_id)
-        result = await session.execute(stmt)
-        guild = result.scalar()
-
-        if guild is None:
-            guild = model(id=guild_id, streamers={})
-
-        if not isinstance(guild.streamers, dict):
-            guild.streamers = {}
+        await session.execute(insert(model).values(id=guild_id, streamers={}).on_conflict_do_nothing())
+        await session.execute(
+            insert(GuildStreamers)
+            .values(guild_id=guild_id, platform=platform, streamer=streamer)
+            .on_conflict_do_nothing()
+        )
 
-        if streamer not in guild.streamers:
-            guild.streamers[streamer] = None
-        
-        flag_modified(guild, "streamers")
-
-        session.add(guild)
+    streamers = _cached_streamers(guild_id, platform)
+    if streamers is not None:
+        streamers.setdefault(streamer, None)
 
 async def upsert_action(guild_id: int, action: int, platform: str):
     async with async_session_scope() as session:
@@ -119,6 +220,8 @@ async def upsert_action(guild_id: int, action: int, platform: str):
         session.add(guild)
         await session.commit()
 
+    _write_through(guild, platform)
+
 async def upsert_channel(guild_id: int, channel: Optional[int], platform: str):
     async with async_session_scope() as session:
         model = TwitchGuilds if platform == "twitch" else YouTubeGuilds
@@ -133,38 +236,24 @@ async def upsert_channel(guild_id: int, channel: Optional[int], platform: str):
 
         session.add(guild)
 
+    _write_through(guild, platform)
+
 
 async def get_channel(guild_id: int, platform: str) -> Optional[int]:
-    async with async_session_scope() as session:
-        model = TwitchGuilds if platform == "twitch" else YouTubeGuilds
-        stmt = select(model).where(model.id == guild_id)
-        result = await session.execute(stmt)
-        guild = result.scalar()
-        return guild.channel_id if guild else None
+    settings = await get_guild_settings(guild_id, platform)
+    return settings.channel_id if settings else None
 
 async def get_message_id(guild_id: int, streamer: str, platform: str) -> Optional[int]:
-    async with async_session_scope() as session:
-        model = TwitchGuilds if platform == "twitch" else YouTubeGuilds
-        stmt = select(model).where(model.id == guild_id)
-        result = await session.execute(stmt)
-        guild = result.scalar()
-        return guild.streamers[streamer] if guild else None
+    settings = await get_guild_settings(guild_id, platform)
+    return settings.streamers.get(streamer) if settings else None
 
 async def get_action(guild_id: int, platform: str) -> int:
-    async with async_session_scope() as session:
-        model = TwitchGuilds if platform == "twitch" else YouTubeGuilds
-        stmt = select(model).where(model.id == guild_id)
-        result = await session.execute(stmt)
-        guild = result.scalar()
-        return guild.when_live_end if guild else 3
+    settings = await get_guild_settings(guild_id, platform)
+    return settings.when_live_end if settings else 3
 
 async def get_webhook(guild_id: int, platform: str) -> Optional[str]:
-    async with async_session_scope() as session:
-        model = TwitchGuilds if platform == "twitch" else YouTubeGuilds
-        stmt = select(model).where(model.id == guild_id)
-        result = await session.execute(stmt)
-        guild = result.scalar()
-        return guild.webhook_link if guild else None
+    settings = await get_guild_settings(guild_id, platform)
+    return settings.webhook_link if settings else None
 
 async def upsert_webhook(
     guild_id: int,
@@ -195,55 +284,115 @@ async def upsert_webhook(
 
         await session.commit()
 
+    _write_through(guild, platform)
+
 
 async def delete_user(guild_id: int, streamer: str, platform: str):
     async with async_session_scope() as session:
-        model = TwitchGuilds if platform == "twitch" else YouTubeGuilds
-        stmt = select(model).where(model.id == guild_id)
-        result = await session.execute(stmt)
-        guild = result.scalar()
+        stmt = delete(GuildStreamers).where(
+            GuildStreamers.guild_id == guild_id,
+            GuildStreamers.platform == platform,
+            GuildStreamers.streamer == streamer,
+        )
+        await session.execute(stmt)
 
-        if guild:
-            if guild.streamers is None:
-                guild.streamers = []
+    streamers = _cached_streamers(guild_id, platform)
+    if streamers is not None:
+        streamers.pop(streamer, None)
 
-            if streamer in guild.streamers:
-                guild.streamers.remove(streamer)
+async def delete_message(guild_id: int, platform: str):
+    async with async_session_scope() as session:
+        stmt = (
+            update(GuildStreamers)
+            .where(GuildStreamers.guild_id == guild_id, GuildStreamers.platform == platform)
+            .values(message_id=None)
+        )
+        await session.execute(stmt)
 
-                flag_modified(guild, "streamers")
+    streamers = _cached_streamers(guild_id, platform)
+    if streamers is not None:
+        streamers.update(dict.fromkeys(streamers))
 
-                session.add(guild)
-                await session.commit()
+async def get_all_streamers(guild_id: int, platform: str) -> Dict[str, Optional[int]]:
+    settings = await get_guild_settings(guild_id, platform)
+    return dict(settings.streamers) if settings else {}
 
-async def delete_message(guild_id: int, platform: str):
+
+async def get_streamer_guilds(streamer: str, platform: str) -> Dict[int, Optional[int]]:
+    """反查追蹤特定實況主的所有 Guild (guild_id -> message_id)"""
     async with async_session_scope() as session:
-        model = TwitchGuilds if platform == "twitch" else YouTubeGuilds
-        stmt = select(model).where(model.id == guild_id)
+        stmt = select(GuildStreamers.guild_id, GuildStreamers.message_id).where(
+            GuildStreamers.platform == platform, GuildStreamers.streamer == streamer
+        )
         result = await session.execute(stmt)
-        guild = result.scalar()
+        return {guild_id: message_id for guild_id, message_id in result}
 
-        if guild:
-            guild.message_id = None
 
-        session.add(guild)
-
-async def get_all_streamers(guild_id: int, platform: str) -> Dict[str, Optional[int]]:
+async def get_all_guild_settings(platform: str, guild_ids: Optional[Iterable[int]] = None) -> Dict[int, GuildSettings]:
+    """以 JOIN 查詢載入所有 (或指定) Guild 的追蹤列表與通知設定，指定的 Guild 過多時分批查詢"""
     async with async_session_scope() as session:
         model = TwitchGuilds if platform == "twitch" else YouTubeGuilds
-        stmt = select(model).where(model.id == guild_id)
-        result = await session.execute(stmt)
-        guild = result.scalar()
-        return guild.streamers if guild and isinstance(guild.streamers, dict) else {}
+        stmt = select(
+            model.id,
+            model.content,
+            model.channel_id,
+            model.webhook_link,
+            model.webhook_name,
+            model.webhook_avatar,
+            model.notification_role,
+            model.when_live_end,
+            GuildStreamers.streamer,
+            GuildStreamers.message_id,
+        ).outerjoin(
+            GuildStreamers,
+            and_(GuildStreamers.guild_id == model.id, GuildStreamers.platform == platform),
+        )
+
+        if guild_ids is None:
+            statements = [stmt]
+        else:
+            guild_ids = list(guild_ids)
+            statements = [
+                stmt.where(model.id.in_(guild_ids[i:i + SQL_IN_CHUNK_SIZE]))
+                for i in range(0, len(guild_ids), SQL_IN_CHUNK_SIZE)
+            ]
+
+        rows = [row for statement in statements for row in await session.execute(statement)]
+
+        guilds: Dict[int, GuildSettings] = {}
+
+        for row in rows:
+            settings = guilds.get(row.id)
+            if settings is None:
+                settings = guilds[row.id] = GuildSettings(
+                    id=row.id,
+                    content=row.content,
+                    channel_id=row.channel_id,
+                    webhook_link=row.webhook_link,
+                    webhook_name=row.webhook_name,
+                    webhook_avatar=row.webhook_avatar,
+                    notification_role=row.notification_role,
+                    when_live_end=row.when_live_end,
+                )
+            if row.streamer is not None:
+                settings.streamers[row.streamer] = row.message_id
+
+    for guild_id, settings in guilds.items():
+        guild_settings_cache.set((platform, guild_id), settings)
+
+    return guilds
 
 
 async def search_streamers(guild_id: int, query: str, platform: str) -> List[str]:
     async with async_session_scope() as session:
-        model = TwitchGuilds if platform == "twitch" else YouTubeGuilds
-        stmt = select(model).where(model.id == guild_id)
+        stmt = (
+            select(GuildStreamers.streamer)
+            .where(
+                GuildStreamers.guild_id == guild_id,
+                GuildStreamers.platform == platform,
+                GuildStreamers.streamer.icontains(query),
+            )
+            .limit(25)
+        )
         result = await session.execute(stmt)
-        guild = result.scalar()
-
-        if not guild or not isinstance(guild.streamers, list):
-            return []
-
-        return [s for s in guild.streamers if query.lower() in s.lower()]
+        return list(result.scalars())
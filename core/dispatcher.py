@@ -0,0 +1,132 @@
+import asyncio
+import logging
+import time
+
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Awaitable, Callable, Dict, Iterable, List, Optional, Tuple, TypeVar, Union
+
+from disnake import HTTPException
+
+T = TypeVar("T")
+
+DISCORD_GLOBAL_RATE = 50  # Discord 全域限制：每秒 50 個請求
+
+
+class GlobalRateLimiter:
+    """Token bucket，限制所有 Webhook 請求加總的速率，並可在收到全域 429 時整體暫停"""
+
+    def __init__(self, rate: float = DISCORD_GLOBAL_RATE, per: float = 1.0):
+        self.rate = rate
+        self.per = per
+        self._tokens = float(rate)
+        self._updated_at = time.monotonic()
+        self._paused_until = 0.0
+        self._lock = asyncio.Lock()
+
+    def pause(self, delay: float) -> None:
+        self._paused_until = max(self._paused_until, time.monotonic() + delay)
+
+    async def acquire(self) -> None:
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+
+                if now < self._paused_until:
+                    await asyncio.sleep(self._paused_until - now)
+                    continue
+
+                self._tokens = min(self.rate, self._tokens + (now - self._updated_at) * self.rate / self.per)
+                self._updated_at = now
+
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+
+                await asyncio.sleep((1 - self._tokens) * self.per / self.rate)
+
+
+def parse_rate_limit(error: HTTPException) -> Tuple[float, bool]:
+    """從 429 回應取出需要等待的秒數，以及是否為全域限制"""
+    headers = error.response.headers
+
+    try:
+        retry_after = float(headers.get("Retry-After") or headers.get("X-RateLimit-Reset-After") or 1)
+    except ValueError:
+        retry_after = 1.0
+
+    is_global = headers.get("X-RateLimit-Global") == "true" or headers.get("X-RateLimit-Scope") == "global"
+
+    return retry_after, is_global
+
+
+class WebhookDispatcher:
+    """
+    並行發送 Webhook 訊息。
+
+    - 以 Semaphore 限制同時進行中的請求數量
+    - 同一個 Webhook 的請求依序排隊 (disnake 會依 ``X-RateLimit-*`` 標頭在同一個 bucket 內預先等待)
+    - 所有請求共用全域 token bucket，收到全域 429 時整體暫停
+    - 429 會依照回應的 ``Retry-After`` 等待後重試
+    """
+
+    def __init__(
+        self,
+        concurrency: int = 50,
+        global_rate: float = DISCORD_GLOBAL_RATE,
+        max_retries: int = 3,
+        logger: Optional[logging.Logger] = None,
+    ):
+        self.semaphore = asyncio.Semaphore(concurrency)
+        self.limiter = GlobalRateLimiter(global_rate)
+        self.max_retries = max_retries
+        self.logger = logger or logging.getLogger(__name__)
+        # Webhook URL -> (鎖, 持有或等待中的請求數)，沒有請求時移除，避免 URL 更換後一直累積
+        self._buckets: Dict[str, Tuple[asyncio.Lock, int]] = {}
+
+    @asynccontextmanager
+    async def _bucket(self, webhook_url: str) -> AsyncIterator[None]:
+        lock, users = self._buckets.get(webhook_url) or (asyncio.Lock(), 0)
+        self._buckets[webhook_url] = (lock, users + 1)
+
+        try:
+            async with lock:
+                yield
+        finally:
+            lock, users = self._buckets[webhook_url]
+            if users == 1:
+                del self._buckets[webhook_url]
+            else:
+                self._buckets[webhook_url] = (lock, users - 1)
+
+    async def send(self, webhook_url: str, func: Callable[[], Awaitable[T]]) -> T:
+        """在 Webhook 的 bucket 中執行 ``func``，遇到 429 時等待後重試"""
+        async with self._bucket(webhook_url):
+            for attempt in range(self.max_retries + 1):
+                await self.limiter.acquire()
+
+                try:
+                    async with self.semaphore:
+                        return await func()
+                except HTTPException as e:
+                    if e.status != 429 or attempt == self.max_retries:
+                        raise
+
+                    retry_after, is_global = parse_rate_limit(e)
+
+                    if is_global:
+                        self.limiter.pause(retry_after)
+
+                    self.logger.warning(
+                        f"Webhook 被限速 ({'全域' if is_global else '單一 Webhook'})，{retry_after:.2f} 秒後重試"
+                    )
+                    await asyncio.sleep(retry_after)
+
+        raise RuntimeError("Unreachable code in webhook dispatch.")
+
+    async def fan_out(
+        self, jobs: Iterable[Tuple[str, Callable[[], Awaitable[T]]]]
+    ) -> List[Union[T, BaseException]]:
+        """並行執行多個 (webhook_url, func) 工作，回傳每個工作的結果或例外"""
+        return await asyncio.gather(
+            *(self.send(webhook_url, func) for webhook_url, func in jobs), return_exceptions=True
+        )
@@ -10,6 +10,12 @@ from tystream import TwitchVODData, TwitchStreamData
 
 from core.utils import convert_duration
 
+TAIPEI_TZ = pytz.timezone('Asia/Taipei')
+
+
+def relative_timestamp(dt: datetime) -> str:
+    return f"<t:{int(dt.astimezone(TAIPEI_TZ).replace(tzinfo=None).timestamp())}:R>"
+
 
 class SuccessEmbed(Embed):
     def __init__(self, title: str, description: str, thumbnail: Optional[str] = None, **kwargs):
@@ -34,8 +40,7 @@ class TwitchStreamEmbed(Embed):
     def __init__(self, stream: TwitchStreamData):
         super().__init__(title=stream.title, colour=Colour.purple())
 
-        taipei_tz = pytz.timezone('Asia/Taipei')
-        current_time = datetime.now(taipei_tz).strftime("%H:%M")
+        current_time = datetime.now(TAIPEI_TZ).strftime("%H:%M")
 
         self.set_author(
             name=f"{stream.user.display_name} 正在直播！",
@@ -45,7 +50,7 @@ class TwitchStreamEmbed(Embed):
         self.set_image(url=f"{stream.thumbnail_url}?t={int(time.time())}")
         self.add_field(
             name="直播開始時間",
-            value=f"<t:{int(stream.started_at.astimezone(pytz.timezone('Asia/Taipei')).replace(tzinfo=None).timestamp())}:R>",
+            value=relative_timestamp(stream.started_at),
             inline=True,
         )
         self.add_field(name="遊戲", value=stream.game_name, inline=True)
@@ -57,6 +62,27 @@ class TwitchStreamEmbed(Embed):
         )
 
 
+class TwitchLiveEmbed(Embed):
+    """開台通知的 Embed，內容與 Guild 無關，同一場直播只需建立一次並發送到所有 Guild"""
+
+    def __init__(self, stream: TwitchStreamData):
+        super().__init__(title=stream.title, colour=Colour.purple())
+
+        self.set_author(
+            name=f"{stream.user.display_name} 正在直播！",
+            url=f"https://www.twitch.tv/{stream.user.login}",
+            icon_url=stream.user.profile_image_url,
+        )
+        self.set_image(url=stream.thumbnail_url)
+        self.add_field(name="直播開始時間", value=relative_timestamp(stream.started_at), inline=True)
+        self.add_field(name="遊戲", value=stream.game_name, inline=True)
+        self.add_field(name="觀看人數", value=stream.viewer_count, inline=True)
+
+        self.set_footer(
+            text="此通知由 TYStream 發布 • ㄐ器人由 鰻頭(´・ω・) 製作", icon_url="https://i.imgur.com/g1bfpCW.png"
+        )
+
+
 class TwitchVODEmbed(Embed):
     def __init__(self, vod: TwitchVODData):
         super().__init__(title=vod.title, colour=Colour.purple())
@@ -67,7 +93,7 @@ class TwitchVODEmbed(Embed):
         self.add_field(name="時長", value=convert_duration(vod.duration), inline=True)
         self.add_field(
             name="直播結束時間",
-            value=f"<t:{int(vod.published_at.astimezone(pytz.timezone('Asia/Taipei')).replace(tzinfo=None).timestamp())}:R>",
+            value=relative_timestamp(vod.published_at),
             inline=True,
         )
 
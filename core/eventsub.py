@@ -0,0 +1,404 @@
+import asyncio
+import hashlib
+import hmac
+import json
+import logging
+import re
+import time
+
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from datetime import datetime, timedelta, timezone
+from typing import Awaitable, Callable, Coroutine, Dict, Iterable, Optional, Set, Tuple
+
+import aiohttp
+from aiohttp import web
+
+from core.twitch import TwitchClient
+
+STREAM_EVENTS = ("stream.online", "stream.offline")
+MESSAGE_ID_HISTORY = 1000  # 記住最近的 message id，用來忽略 Twitch 重送的通知
+SUBSCRIBE_CONCURRENCY = 10
+WEBSOCKET_MAX_SUBSCRIPTIONS = 300  # 每個 WebSocket session 最多可啟用的訂閱數
+SUBSCRIBE_RETRY_BASE = 30  # 訂閱失敗後等待的秒數，連續失敗時加倍
+SUBSCRIBE_RETRY_MAX = 3600
+MESSAGE_MAX_AGE = timedelta(minutes=10)  # Twitch 建議拒絕時間戳超過 10 分鐘的 Webhook 通知，避免重放攻擊
+
+StreamHandler = Callable[[str], Awaitable[None]]
+
+
+def parse_timestamp(value: str) -> Optional[datetime]:
+    """解析 Twitch 的 RFC 3339 時間戳，小數秒可能有 9 位數，只保留 datetime 支援的 6 位"""
+    value = re.sub(r"(\.\d{6})\d+", r"\1", value.strip()).replace("Z", "+00:00")
+    try:
+        timestamp = datetime.fromisoformat(value)
+    except ValueError:
+        return None
+    return timestamp if timestamp.tzinfo else timestamp.replace(tzinfo=timezone.utc)
+
+
+class EventSub(ABC):
+    """
+    Twitch EventSub 的共用邏輯。
+
+    負責維護每位追蹤實況主的 ``stream.online`` / ``stream.offline`` 訂閱，
+    並把收到的通知轉交給 ``on_online`` / ``on_offline``，參數為追蹤列表中的 login。
+    子類別只需要提供 ``transport`` 與連線方式。
+
+    傳輸方式有訂閱數量上限 (``max_subscriptions``) 時，超出的實況主不會訂閱，
+    呼叫端以 :meth:`covers` 判斷哪些實況主仍需要輪詢。
+    """
+
+    max_subscriptions: Optional[int] = None
+
+    def __init__(
+        self,
+        twitch: TwitchClient,
+        on_online: StreamHandler,
+        on_offline: StreamHandler,
+        logger: Optional[logging.Logger] = None,
+    ):
+        self.twitch = twitch
+        self.on_online = on_online
+        self.on_offline = on_offline
+        self.logger = logger or logging.getLogger(__name__)
+
+        self._tracked: Dict[str, str] = {}  # 小寫 login -> 追蹤列表中的 login
+        self._subscriptions: Dict[str, Dict[str, Optional[str]]] = {}  # 小寫 login -> {type: subscription_id}
+        self._broadcasters: Dict[str, str] = {}  # broadcaster id -> 小寫 login
+        self._seen: "OrderedDict[str, None]" = OrderedDict()
+        self._tasks: Set[asyncio.Task] = set()
+        self._sync_lock = asyncio.Lock()
+        self._overflow = 0  # 上一次 sync 因訂閱上限而未訂閱的實況主人數
+        self._failures: Dict[str, Tuple[int, float]] = {}  # 小寫 login -> (連續失敗次數, 可再次嘗試的時間)
+
+    @property
+    @abstractmethod
+    def transport(self) -> Optional[Dict[str, str]]:
+        """建立訂閱時使用的 transport，尚無法訂閱 (例如 WebSocket 未連線) 時為 None"""
+
+    @property
+    def user_token(self) -> Optional[str]:
+        return None
+
+    @abstractmethod
+    async def start(self) -> None:
+        """開始接收通知"""
+
+    async def close(self) -> None:
+        for task in self._tasks:
+            task.cancel()
+
+    def covers(self, login: str) -> bool:
+        """是否已訂閱該實況主的開台與關台，未涵蓋的實況主需要由輪詢偵測"""
+        return len(self._subscriptions.get(login.lower(), ())) == len(STREAM_EVENTS)
+
+    async def sync(self, logins: Iterable[str]) -> None:
+        """讓訂閱與目前的追蹤列表一致：新增缺少的訂閱、移除不再追蹤的訂閱"""
+        self._tracked = {login.lower(): login for login in logins}
+
+        async with self._sync_lock:
+            if self.transport is None:
+                return
+
+            for login in set(self._subscriptions) - set(self._tracked):
+                await self._unsubscribe(login)
+
+            for login in set(self._failures) - set(self._tracked):
+                del self._failures[login]
+
+            # 只處理缺少訂閱、且不在失敗冷卻中的實況主；已有部分訂閱的只補上缺少的類型
+            now = time.monotonic()
+            retry = [
+                login for login in self._tracked
+                if not self.covers(login) and self._failures.get(login, (0, 0.0))[1] <= now
+            ]
+            partial = [login for login in retry if login in self._subscriptions]
+            missing = [login for login in retry if login not in self._subscriptions]
+
+            if self.max_subscriptions is not None:
+                room = max(0, self.max_subscriptions // len(STREAM_EVENTS) - len(self._subscriptions))
+                overflow = max(0, len(missing) - room)
+                if overflow and overflow != self._overflow:
+                    self.logger.warning(
+                        f"EventSub: 訂閱數已達上限 {self.max_subscriptions}，{overflow} 位實況主改由輪詢偵測"
+                    )
+                self._overflow = overflow
+                missing = missing[:room]
+
+            missing = partial + missing
+            if not missing:
+                return
+
+            users = await self.twitch.get_users(missing)
+
+            for login in missing:
+                if login not in users:
+                    self.logger.warning(f"EventSub: 找不到 Twitch 用戶 {login}，略過訂閱")
+                    self._record_failure(login)
+
+            semaphore = asyncio.Semaphore(SUBSCRIBE_CONCURRENCY)
+
+            async def subscribe(login: str, broadcaster_id: str):
+                async with semaphore:
+                    await self._subscribe(login, broadcaster_id)
+
+            await asyncio.gather(*(subscribe(login, users[login].id) for login in missing if login in users))
+
+    async def _subscribe(self, login: str, broadcaster_id: str) -> None:
+        """建立該實況主缺少的訂閱類型，仍有缺少時進入冷卻，避免每一輪都重送失敗的請求"""
+        subscriptions = dict(self._subscriptions.get(login, {}))
+
+        for subscription_type in STREAM_EVENTS:
+            if subscription_type in subscriptions:
+                continue
+            try:
+                subscriptions[subscription_type] = await self.twitch.create_eventsub_subscription(
+                    subscription_type, broadcaster_id, self.transport, user_token=self.user_token
+                )
+            except aiohttp.ClientError as e:
+                self.logger.error(f"EventSub: 無法訂閱 {login} 的 {subscription_type}: {e}")
+
+        if subscriptions:
+            self._subscriptions[login] = subscriptions
+            self._broadcasters[broadcaster_id] = login
+
+        if len(subscriptions) == len(STREAM_EVENTS):
+            self._failures.pop(login, None)
+        else:
+            self._record_failure(login)
+
+    def _record_failure(self, login: str) -> None:
+        failures = self._failures.get(login, (0, 0.0))[0] + 1
+        delay = min(SUBSCRIBE_RETRY_MAX, SUBSCRIBE_RETRY_BASE * 2 ** (failures - 1))
+        self._failures[login] = (failures, time.monotonic() + delay)
+
+    async def _unsubscribe(self, login: str) -> None:
+        subscriptions = self._subscriptions.pop(login, {})
+
+        for subscription_id in subscriptions.values():
+            if subscription_id is None:
+                continue
+            try:
+                await self.twitch.delete_eventsub_subscription(subscription_id, user_token=self.user_token)
+            except aiohttp.ClientError as e:
+                self.logger.error(f"EventSub: 無法取消訂閱 {login}: {e}")
+
+    def _reset_subscriptions(self) -> None:
+        """連線失效時訂閱也會一併失效，清空後由下一次 sync 重新建立"""
+        self._subscriptions.clear()
+        self._broadcasters.clear()
+        self._failures.clear()  # 失敗可能來自舊的 session (例如已達上限)，新的 session 立即重試
+
+    def _revoke(self, subscription: dict) -> None:
+        """訂閱被撤銷時移除該類型的紀錄，讓下一次 sync 重新訂閱"""
+        login = self._broadcasters.get(subscription["condition"].get("broadcaster_user_id"))
+        self.logger.warning(f"EventSub: {login} 的訂閱被撤銷 ({subscription.get('status')})")
+        if login in self._subscriptions:
+            self._subscriptions[login].pop(subscription.get("type"), None)
+
+    def _dispatch(self, message_id: str, subscription_type: str, event: dict) -> None:
+        if message_id in self._seen:
+            return
+
+        self._seen[message_id] = None
+        if len(self._seen) > MESSAGE_ID_HISTORY:
+            self._seen.popitem(last=False)
+
+        login = self._broadcasters.get(event.get("broadcaster_user_id")) or event.get("broadcaster_user_login", "")
+        login = self._tracked.get(login.lower())
+
+        if login is None:
+            return
+
+        handler = self.on_online if subscription_type == "stream.online" else self.on_offline
+
+        self.logger.info(f"EventSub: {subscription_type} - {login}")
+
+        self._spawn(self._run_handler(handler, login))
+
+    def _spawn(self, coro: Coroutine) -> None:
+        """在背景執行，關閉時一併取消"""
+        task = asyncio.create_task(coro)
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _run_handler(self, handler: StreamHandler, login: str) -> None:
+        try:
+            await handler(login)
+        except Exception as e:
+            self.logger.error(f"EventSub: 處理 {login} 的通知時發生錯誤: {e}")
+
+    async def _resync(self) -> None:
+        try:
+            await self.sync(list(self._tracked.values()))
+        except Exception as e:
+            self.logger.error(f"EventSub: 重新建立訂閱失敗，將在下一次檢查時重試: {e}")
+
+
+class WebSocketEventSub(EventSub):
+    """透過 EventSub WebSocket 接收通知 (需要 User Access Token)"""
+
+    max_subscriptions = WEBSOCKET_MAX_SUBSCRIPTIONS
+
+    def __init__(self, *args, url: str, user_token: Optional[str] = None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.url = url
+        self._user_token = user_token
+        self._session_id: Optional[str] = None
+        self._runner: Optional[asyncio.Task] = None
+
+    @property
+    def transport(self) -> Optional[Dict[str, str]]:
+        if self._session_id is None:
+            return None
+        return {"method": "websocket", "session_id": self._session_id}
+
+    @property
+    def user_token(self) -> Optional[str]:
+        return self._user_token
+
+    async def start(self) -> None:
+        if self._runner is None or self._runner.done():
+            self._runner = asyncio.create_task(self._run())
+
+    async def close(self) -> None:
+        if self._runner:
+            self._runner.cancel()
+        await super().close()
+
+    async def _run(self) -> None:
+        url = self.url
+        backoff = 1
+
+        while True:
+            try:
+                url = await self._connect(url) or self.url
+                backoff = 1
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self.logger.error(f"EventSub WebSocket 連線中斷: {e}，{backoff} 秒後重新連線")
+                self._session_id = None
+                self._reset_subscriptions()
+                url = self.url
+                await asyncio.sleep(backoff)
+                backoff = min(backoff * 2, 60)
+
+    async def _connect(self, url: str) -> Optional[str]:
+        """維持一條 WebSocket 連線，收到 session_reconnect 時回傳新的連線網址"""
+        keepalive = 30
+
+        async with aiohttp.ClientSession() as session, session.ws_connect(url, heartbeat=None) as ws:
+            while True:
+                message = await ws.receive(timeout=keepalive + 10)  # 超過 keepalive 沒收到任何訊息視為斷線
+
+                if message.type in (aiohttp.WSMsgType.CLOSE, aiohttp.WSMsgType.CLOSED, aiohttp.WSMsgType.ERROR):
+                    raise ConnectionError(f"WebSocket closed ({ws.close_code})")
+
+                if message.type != aiohttp.WSMsgType.TEXT:
+                    continue
+
+                data = json.loads(message.data)
+                metadata = data["metadata"]
+                payload = data["payload"]
+
+                match metadata["message_type"]:
+                    case "session_welcome":
+                        session = payload["session"]
+                        keepalive = session.get("keepalive_timeout_seconds") or keepalive
+
+                        if session["id"] != self._session_id:
+                            self._session_id = session["id"]
+                            self._reset_subscriptions()
+                            # 訂閱需要數百個 Helix 請求，在背景執行，避免接收迴圈因此錯過 keepalive
+                            self._spawn(self._resync())
+                    case "notification":
+                        self._dispatch(metadata["message_id"], metadata["subscription_type"], payload["event"])
+                    case "session_reconnect":
+                        return payload["session"]["reconnect_url"]
+                    case "revocation":
+                        self._revoke(payload["subscription"])
+
+
+class WebhookEventSub(EventSub):
+    """透過本地 aiohttp 伺服器接收 EventSub Webhook 回呼"""
+
+    def __init__(
+        self, *args, callback_url: str, secret: Optional[str], host: str = "0.0.0.0", port: int = 8080, **kwargs
+    ):
+        super().__init__(*args, **kwargs)
+        self.callback_url = callback_url
+        self.secret = secret
+        self.host = host
+        self.port = port
+        self._runner: Optional[web.AppRunner] = None
+
+    @property
+    def transport(self) -> Optional[Dict[str, str]]:
+        return {"method": "webhook", "callback": self.callback_url, "secret": self.secret}
+
+    async def start(self) -> None:
+        if self._runner is not None:
+            return
+
+        if not self.secret:
+            self.logger.error("EventSub Webhook 未設定 TWITCH_EVENTSUB_SECRET，所有回呼都會被拒絕")
+
+        app = web.Application()
+        app.router.add_post("/eventsub", self.handle_callback)
+
+        self._runner = web.AppRunner(app)
+        await self._runner.setup()
+        await web.TCPSite(self._runner, self.host, self.port).start()
+
+        self.logger.info(f"EventSub Webhook 伺服器已啟動於 {self.host}:{self.port}")
+
+    async def close(self) -> None:
+        if self._runner:
+            await self._runner.cleanup()
+            self._runner = None
+        await super().close()
+
+    def verify_signature(self, request: web.Request, body: bytes) -> bool:
+        if not self.secret:
+            return False
+
+        message = (
+            request.headers.get("Twitch-Eventsub-Message-Id", "")
+            + request.headers.get("Twitch-Eventsub-Message-Timestamp", "")
+        ).encode() + body
+        expected = "sha256=" + hmac.new(self.secret.encode(), message, hashlib.sha256).hexdigest()
+        return hmac.compare_digest(expected, request.headers.get("Twitch-Eventsub-Message-Signature", ""))
+
+    @staticmethod
+    def is_fresh(request: web.Request, now: Optional[datetime] = None) -> bool:
+        """訊息時間戳是否在 ``MESSAGE_MAX_AGE`` 之內，無法解析時視為過期"""
+        timestamp = parse_timestamp(request.headers.get("Twitch-Eventsub-Message-Timestamp", ""))
+        if timestamp is None:
+            return False
+        return (now or datetime.now(timezone.utc)) - timestamp <= MESSAGE_MAX_AGE
+
+    async def handle_callback(self, request: web.Request) -> web.Response:
+        body = await request.read()
+
+        if not self.verify_signature(request, body):
+            return web.Response(status=403)
+
+        if not self.is_fresh(request):
+            self.logger.warning(f"EventSub: 拒絕過期的通知 {request.headers.get('Twitch-Eventsub-Message-Id')}")
+            return web.Response(status=403)
+
+        data = json.loads(body)
+
+        match request.headers.get("Twitch-Eventsub-Message-Type"):
+            case "webhook_callback_verification":
+                return web.Response(text=data["challenge"], content_type="text/plain")
+            case "notification":
+                self._dispatch(
+                    request.headers["Twitch-Eventsub-Message-Id"], data["subscription"]["type"], data["event"]
+                )
+            case "revocation":
+                self._revoke(data["subscription"])
+
+        return web.Response(status=204)
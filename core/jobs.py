@@ -0,0 +1,225 @@
+import asyncio
+import json
+import logging
+import time
+
+from typing import Any, Awaitable, Callable, Dict, Iterable, List, Optional, Set, Tuple
+
+from redis import asyncio as redis
+from redis.exceptions import ResponseError
+
+from core.sharding import default_worker_id
+
+STREAM_KEY = "twitch:notifications"
+DEAD_LETTER_KEY = "twitch:notifications:dead"
+GROUP = "notifiers"
+STREAM_MAXLEN = 100000  # 已確認的工作只保留最近的這些筆 (近似裁剪)
+
+JobHandler = Callable[[Dict[str, Any]], Awaitable[None]]
+
+
+class NotificationQueue:
+    """
+    以 Redis Streams 實作的通知工作佇列，讓偵測開台/關台與 Discord 發送互相獨立。
+
+    輪詢只負責 :meth:`publish` 開台 (``live``)、關台 (``offline``) 與更新 (``refresh``) 工作，
+    同一個 consumer group 內的所有 worker (可以是同一個程序或多個程序) 以 :meth:`run` 消費並執行發送。
+
+    - 處理成功後才 XACK，worker 在處理中當機時，工作會留在 pending 列表中
+    - 處理失敗的工作不 ack，閒置超過 ``retry_after`` 秒後由任一 worker 以 XCLAIM 取回重試
+    - 投遞超過 ``max_attempts`` 次的工作移到 dead-letter stream 並 ack，不再重試
+    """
+
+    def __init__(
+        self,
+        client: redis.Redis,
+        consumer: Optional[str] = None,
+        concurrency: int = 32,
+        max_attempts: int = 5,
+        retry_after: float = 30,
+        block: int = 5000,
+        logger: Optional[logging.Logger] = None,
+        stream: str = STREAM_KEY,
+        group: str = GROUP,
+        dead_letter: str = DEAD_LETTER_KEY,
+    ):
+        self.r = client
+        self.consumer = consumer or default_worker_id()
+        self.concurrency = concurrency
+        self.max_attempts = max_attempts
+        self.retry_after = retry_after
+        self.block = block
+        self.logger = logger or logging.getLogger(__name__)
+        self.stream = stream
+        self.group = group
+        self.dead_letter = dead_letter
+
+        self._tasks: Set[asyncio.Task] = set()
+        self._slots = asyncio.Semaphore(concurrency)
+        self._reclaimed_at = 0.0
+        self._stopped = False
+
+    @property
+    def retry_window(self) -> float:
+        """一個工作從第一次投遞到移入 dead-letter 最多經過的秒數 (每次重試最多等待 1.5 倍 ``retry_after``)"""
+        return self.max_attempts * self.retry_after * 1.5
+
+    async def ensure_group(self) -> None:
+        try:
+            await self.r.xgroup_create(self.stream, self.group, id="0", mkstream=True)
+        except ResponseError as e:
+            if "BUSYGROUP" not in str(e):
+                raise
+
+    async def publish(self, jobs: Iterable[Dict[str, Any]]) -> int:
+        """以單一 pipeline 加入多個工作，回傳加入的數量"""
+        jobs = list(jobs)
+        if not jobs:
+            return 0
+
+        async with self.r.pipeline(transaction=False) as pipe:
+            for job in jobs:
+                pipe.xadd(self.stream, {"job": json.dumps(job)}, maxlen=STREAM_MAXLEN, approximate=True)
+            await pipe.execute()
+
+        return len(jobs)
+
+    async def run(self, handler: JobHandler) -> None:
+        """持續消費工作直到 :meth:`stop`，同時處理中的工作數量不超過 ``concurrency``"""
+        await self.ensure_group()
+        self._stopped = False
+
+        while not self._stopped:
+            try:
+                messages = await self._reclaim()
+                free = self.concurrency - len(self._tasks) - len(messages)
+
+                if free > 0:
+                    # 有待重試的工作時不阻塞等待新工作
+                    messages += await self._read(free, block=None if messages else self.block)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self.logger.error(f"讀取通知佇列失敗: {e}")
+                await asyncio.sleep(1)
+                continue
+
+            for message_id, job, attempts in messages:
+                await self._slots.acquire()
+                task = asyncio.create_task(self._process(handler, message_id, job, attempts))
+                self._tasks.add(task)
+                task.add_done_callback(self._done)
+
+            if not messages and len(self._tasks) >= self.concurrency:
+                await asyncio.wait(self._tasks, return_when=asyncio.FIRST_COMPLETED)
+
+    async def backlog(self) -> Tuple[int, int]:
+        """回傳 (尚未被讀取的工作數, 已讀取但尚未 ack 的工作數)"""
+        try:
+            groups = await self.r.xinfo_groups(self.stream)
+        except ResponseError:
+            return 0, 0  # stream 尚未建立
+
+        for group in groups:
+            if group["name"] != self.group:
+                continue
+
+            lag = group.get("lag")
+            if lag is None:
+                # stream 有刪除紀錄時 Redis 無法計算 lag，只能判斷是否還有未讀取的工作
+                info = await self.r.xinfo_stream(self.stream)
+                lag = int(info["last-generated-id"] != group["last-delivered-id"])
+
+            return int(lag), int(group["pending"])
+
+        return 0, 0
+
+    def stop(self) -> None:
+        """停止讀取新工作；已取出但未完成的工作不會被 ack，之後由其他 worker 取回"""
+        self._stopped = True
+        for task in self._tasks:
+            task.cancel()
+
+    def _done(self, task: asyncio.Task) -> None:
+        self._tasks.discard(task)
+        self._slots.release()
+
+    async def _read(self, count: int, block: Optional[int]) -> List[Tuple[str, Dict[str, Any], int]]:
+        response = await self.r.xreadgroup(self.group, self.consumer, {self.stream: ">"}, count=count, block=block)
+
+        return [
+            (message_id, json.loads(fields["job"]), 1)
+            for _, entries in response or []
+            for message_id, fields in entries
+        ]
+
+    async def _reclaim(self) -> List[Tuple[str, Dict[str, Any], int]]:
+        """取回閒置過久 (處理失敗或 worker 已失效) 的工作；投遞次數過多的工作移到 dead-letter"""
+        now = time.monotonic()
+        if now - self._reclaimed_at < self.retry_after / 2:
+            return []
+        self._reclaimed_at = now
+
+        pending = await self.r.xpending_range(
+            self.stream, self.group, min="-", max="+", count=self.concurrency, idle=int(self.retry_after * 1000)
+        )
+        if not pending:
+            return []
+
+        attempts = {entry["message_id"]: entry["times_delivered"] for entry in pending}
+
+        exhausted = [message_id for message_id, count in attempts.items() if count >= self.max_attempts]
+        retry = [message_id for message_id, count in attempts.items() if count < self.max_attempts]
+
+        if exhausted:
+            entries = await self.r.xclaim(
+                self.stream, self.group, self.consumer, int(self.retry_after * 1000), exhausted
+            )
+            for message_id, fields in entries:
+                if fields:
+                    await self._dead_letter(message_id, json.loads(fields["job"]), attempts[message_id], "重試次數過多")
+            await self.r.xack(self.stream, self.group, *exhausted)
+
+        if not retry:
+            return []
+
+        entries = await self.r.xclaim(self.stream, self.group, self.consumer, int(self.retry_after * 1000), retry)
+
+        missing = [message_id for message_id, fields in entries if not fields]
+        if missing:
+            # stream 已被裁剪，工作內容已不存在
+            await self.r.xack(self.stream, self.group, *missing)
+
+        return [
+            (message_id, json.loads(fields["job"]), attempts[message_id] + 1)
+            for message_id, fields in entries
+            if fields
+        ]
+
+    async def _process(self, handler: JobHandler, message_id: str, job: Dict[str, Any], attempts: int) -> None:
+        try:
+            await handler(job)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            if attempts >= self.max_attempts:
+                await self._dead_letter(message_id, job, attempts, repr(e))
+                await self.r.xack(self.stream, self.group, message_id)
+            else:
+                self.logger.warning(
+                    f"通知工作 {message_id} 失敗 (第 {attempts}/{self.max_attempts} 次)，"
+                    f"{self.retry_after:.0f} 秒後重試: {e}"
+                )
+            return
+
+        await self.r.xack(self.stream, self.group, message_id)
+
+    async def _dead_letter(self, message_id: str, job: Dict[str, Any], attempts: int, error: str) -> None:
+        self.logger.error(f"通知工作 {message_id} 已失敗 {attempts} 次，移到 dead-letter: {job} ({error})")
+
+        await self.r.xadd(
+            self.dead_letter,
+            {"job": json.dumps(job), "error": error, "attempts": attempts, "source_id": message_id},
+            maxlen=STREAM_MAXLEN,
+            approximate=True,
+        )
@@ -0,0 +1,299 @@
+import bisect
+import functools
+import logging
+import time
+
+from abc import ABC, abstractmethod
+from contextlib import contextmanager
+from typing import Awaitable, Callable, Dict, Iterator, List, Optional, Sequence, Tuple
+
+from aiohttp import web
+
+# 預設的秒數分桶，涵蓋單一 Redis 指令 (毫秒以下) 到一輪輪詢 (數十秒)
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+LAG_BUCKETS = (0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600)
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+Collector = Callable[[], Awaitable[None]]
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) and not value.is_integer() else str(int(value))
+
+
+class Metric(ABC):
+    """Prometheus 指標的共用部分：每組標籤值對應一個樣本"""
+
+    type = ""
+
+    def __init__(self, name: str, documentation: str, labels: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(labels)
+
+    def _key(self, labels: Dict[str, str]) -> Tuple[str, ...]:
+        if set(labels) != set(self.label_names):
+            raise ValueError(f"{self.name} 需要標籤 {self.label_names}，收到 {tuple(labels)}")
+        return tuple(str(labels[name]) for name in self.label_names)
+
+    @abstractmethod
+    def samples(self) -> Iterator[str]:
+        """輸出這個指標所有樣本的文字格式，每個元素為一行"""
+
+    def render(self) -> str:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.type}"]
+        lines.extend(self.samples())
+        return "\n".join(lines)
+
+
+class Counter(Metric):
+    type = "counter"
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, amount: float = 1, **labels: str) -> None:
+        key = self._key(labels)
+        self._values[key] = self._values.get(key, 0) + amount
+
+    def samples(self) -> Iterator[str]:
+        for key, value in self._values.items():
+            yield f"{self.name}{_format_labels(self.label_names, key)} {_format_value(value)}"
+
+
+class Gauge(Metric):
+    type = "gauge"
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def set(self, value: float, **labels: str) -> None:
+        self._values[self._key(labels)] = value
+
+    def samples(self) -> Iterator[str]:
+        for key, value in self._values.items():
+            yield f"{self.name}{_format_labels(self.label_names, key)} {_format_value(value)}"
+
+
+class Histogram(Metric):
+    type = "histogram"
+
+    def __init__(self, *args, buckets: Sequence[float] = DEFAULT_BUCKETS, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.buckets = tuple(sorted(buckets))
+        # 標籤值 -> (各分桶的次數 (不累計，最後一格為 +Inf), 總和)
+        self._values: Dict[Tuple[str, ...], Tuple[List[int], List[float]]] = {}
+
+    def observe(self, value: float, **labels: str) -> None:
+        key = self._key(labels)
+        item = self._values.get(key)
+        if item is None:
+            item = self._values[key] = ([0] * (len(self.buckets) + 1), [0.0])
+
+        counts, total = item
+        counts[bisect.bisect_left(self.buckets, value)] += 1
+        total[0] += value
+
+    @contextmanager
+    def time(self, **labels: str) -> Iterator[None]:
+        """量測區塊的執行時間 (秒)，區塊拋出例外時同樣記錄"""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+    def samples(self) -> Iterator[str]:
+        for key, (counts, total) in self._values.items():
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                le = f'le="{_format_value(bound)}"'
+                yield f"{self.name}_bucket{_format_labels(self.label_names, key, le)} {cumulative}"
+
+            labels = _format_labels(self.label_names, key)
+            yield f"{self.name}_sum{labels} {_format_value(total[0])}"
+            yield f"{self.name}_count{labels} {cumulative}"
+
+
+class Registry:
+    """
+    程序內所有指標的集合，以 Prometheus 文字格式輸出。
+
+    需要在抓取時才查詢的數值 (例如 Redis 中的佇列長度) 以 :meth:`add_collector` 註冊，
+    每次 :meth:`collect` 前會先執行，失敗時只記錄錯誤，不影響其他指標的輸出。
+    """
+
+    def __init__(self, logger: Optional[logging.Logger] = None):
+        self.logger = logger or logging.getLogger(__name__)
+        self._metrics: Dict[str, Metric] = {}
+        self._collectors: List[Collector] = []
+
+    def register(self, metric: Metric) -> Metric:
+        if metric.name in self._metrics:
+            raise ValueError(f"指標 {metric.name} 已經註冊")
+        self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, documentation: str, labels: Sequence[str] = ()) -> Counter:
+        return self.register(Counter(name, documentation, labels))
+
+    def gauge(self, name: str, documentation: str, labels: Sequence[str] = ()) -> Gauge:
+        return self.register(Gauge(name, documentation, labels))
+
+    def histogram(
+        self, name: str, documentation: str, labels: Sequence[str] = (), buckets: Sequence[float] = DEFAULT_BUCKETS
+    ) -> Histogram:
+        return self.register(Histogram(name, documentation, labels, buckets=buckets))
+
+    def add_collector(self, collector: Collector) -> None:
+        self._collectors.append(collector)
+
+    def remove_collector(self, collector: Collector) -> None:
+        if collector in self._collectors:
+            self._collectors.remove(collector)
+
+    async def collect(self) -> str:
+        for collector in list(self._collectors):
+            try:
+                await collector()
+            except Exception as e:
+                self.logger.error(f"收集指標失敗 ({getattr(collector, '__qualname__', collector)}): {e}")
+
+        return "\n".join(metric.render() for metric in self._metrics.values()) + "\n"
+
+
+class MetricsServer:
+    """在本機 HTTP 連接埠的 ``/metrics`` 提供 Prometheus 抓取"""
+
+    def __init__(
+        self, registry: Registry, host: str = "127.0.0.1", port: int = 9100, logger: Optional[logging.Logger] = None
+    ):
+        self.registry = registry
+        self.host = host
+        self.port = port
+        self.logger = logger or logging.getLogger(__name__)
+        self._runner: Optional[web.AppRunner] = None
+
+    async def start(self) -> None:
+        if self._runner is not None:
+            return
+
+        app = web.Application()
+        app.router.add_get("/metrics", self.handle_metrics)
+
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        await web.TCPSite(self._runner, self.host, self.port).start()
+
+        self.logger.info(f"Metrics 伺服器已啟動於 {self.host}:{self.port}")
+
+    async def close(self) -> None:
+        if self._runner:
+            await self._runner.cleanup()
+            self._runner = None
+
+    async def handle_metrics(self, request: web.Request) -> web.Response:
+        body = (await self.registry.collect()).encode()
+        return web.Response(body=body, headers={"Content-Type": CONTENT_TYPE})
+
+
+registry = Registry()
+
+LOOP_DURATION = registry.histogram(
+    "tystream_loop_duration_seconds", "每一輪背景迴圈的執行時間", ["loop"]
+)
+HELIX_REQUESTS = registry.counter(
+    "tystream_helix_requests_total", "送出的 Twitch Helix 請求 (含 429)", ["endpoint", "status"]
+)
+HELIX_REQUEST_DURATION = registry.histogram(
+    "tystream_helix_request_duration_seconds", "Helix 請求的往返時間 (不含等待額度)", ["endpoint"]
+)
+WEBHOOK_REQUESTS = registry.counter(
+    "tystream_webhook_requests_total", "Discord Webhook 請求的結果", ["action", "outcome"]
+)
+WEBHOOK_REQUEST_DURATION = registry.histogram(
+    "tystream_webhook_request_duration_seconds", "Discord Webhook 請求的往返時間", ["action"]
+)
+REDIS_COMMAND_DURATION = registry.histogram(
+    "tystream_redis_command_duration_seconds", "Redis 指令與 pipeline 的往返時間", ["command"]
+)
+DB_QUERY_DURATION = registry.histogram(
+    "tystream_db_query_duration_seconds", "SQLite 查詢的執行時間", ["statement"]
+)
+LIVE_STREAMERS = registry.gauge(
+    "tystream_live_streamers", "這個程序負責的實況主中，目前正在直播的人數"
+)
+FOLLOWED_STREAMERS = registry.gauge(
+    "tystream_followed_streamers", "這個程序負責輪詢的實況主人數"
+)
+NOTIFICATION_LAG = registry.histogram(
+    "tystream_notification_lag_seconds",
+    "從偵測到開台/關台到 Discord 訊息送出/編輯完成的時間",
+    ["type"],
+    buckets=LAG_BUCKETS,
+)
+QUEUE_BACKLOG = registry.gauge(
+    "tystream_notification_queue_backlog", "通知佇列中尚未完成的工作", ["state"]
+)
+
+
+def webhook_outcome(error: Optional[BaseException]) -> str:
+    if error is None:
+        return "success"
+
+    match getattr(error, "status", None):
+        case 404:
+            return "not_found"
+        case 429:
+            return "rate_limited"
+
+    return "failed"
+
+
+@contextmanager
+def track_webhook(action: str) -> Iterator[None]:
+    """記錄一次 Webhook 請求的耗時與結果 (被取消時不記錄)，例外會原樣拋出"""
+    started = time.perf_counter()
+
+    def record(error: Optional[BaseException]) -> None:
+        WEBHOOK_REQUEST_DURATION.observe(time.perf_counter() - started, action=action)
+        WEBHOOK_REQUESTS.inc(action=action, outcome=webhook_outcome(error))
+
+    try:
+        yield
+    except Exception as e:
+        record(e)
+        raise
+    else:
+        record(None)
+
+
+def timed_loop(name: str):
+    """記錄 ``tasks.loop`` 每一輪的執行時間，需放在 ``@tasks.loop`` 之下"""
+
+    def decorator(func):
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs):
+            with LOOP_DURATION.time(loop=name):
+                return await func(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
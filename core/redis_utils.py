@@ -1,92 +1,470 @@
-import redis
-
-import Constants
+import json
+import time
 
+from typing import Dict, Iterable, List, Optional, Set, Tuple
 
+from redis import asyncio as redis
+from redis.asyncio.client import Pipeline
 
-r = redis.Redis(host=Constants.REDIS_HOST, port=Constants.REDIS_PORT, password=Constants.REDIS_PASSWORD, db=0, decode_responses=True)
+import Constants
+from core.metrics import REDIS_COMMAND_DURATION
+
+
+
+CLAIM_PENDING_TTL = 120  # 搶佔後超過這個秒數仍未寫入訊息 ID，視為該 worker 已失效
+SUBSCRIPTION_VERSION_KEY = "twitch:subscriptions:version"
+SUBSCRIPTION_LOG_KEY = "twitch:subscriptions:log"
+SUBSCRIPTION_LOG_SIZE = 10000  # 保留的變更紀錄筆數，落後超過這個數量的 worker 會重新載入完整列表
+
+
+
+class InstrumentedPipeline(Pipeline):
+    """整個 pipeline 視為一次往返記錄耗時"""
+
+    async def execute(self, raise_on_error: bool = True):
+        with REDIS_COMMAND_DURATION.time(command="PIPELINE"):
+            return await super().execute(raise_on_error)
+
+
+class InstrumentedRedis(redis.Redis):
+    """記錄每個 Redis 指令的往返時間，Lua script 會記錄為 EVALSHA"""
+
+    async def execute_command(self, *args, **options):
+        with REDIS_COMMAND_DURATION.time(command=str(args[0]).upper()):
+            return await super().execute_command(*args, **options)
+
+    def pipeline(self, transaction: bool = True, shard_hint: Optional[str] = None) -> InstrumentedPipeline:
+        return InstrumentedPipeline(self.connection_pool, self.response_callbacks, transaction, shard_hint)
+
+
+r = InstrumentedRedis(host=Constants.REDIS_HOST, port=Constants.REDIS_PORT, password=Constants.REDIS_PASSWORD, db=0, decode_responses=True)
+
+# twitch:notified_streams:{guild_id} 的欄位值有三種：
+#   訊息 ID                    已送出開台通知
+#   pending:<時間>             已搶佔開台通知，尚未送出
+#   offline:<時間>:<訊息 ID>   已排入關台動作，尚未完成
+
+# 對每組 (Guild, 實況主) 執行 HSETNX 式的搶佔：欄位不存在、或 pending / offline 標記已超過 ARGV[2] 秒時寫入 pending 標記
+# KEYS: 各組的 twitch:notified_streams:{guild_id}，ARGV: 現在時間、標記有效秒數、各組的實況主
+_claim_twitch_notifications = r.register_script("""
+local won = {}
+for i, key in ipairs(KEYS) do
+    local streamer = ARGV[i + 2]
+    local current = redis.call('HGET', key, streamer)
+    local claimable = not current
+    local marked_at = current and string.match(current, '^%a+:(%d+)')
+    if marked_at then
+        claimable = tonumber(marked_at) + tonumber(ARGV[2]) < tonumber(ARGV[1])
+    end
+    if claimable then
+        redis.call('HSET', key, streamer, 'pending:' .. ARGV[1])
+        table.insert(won, i)
+    end
+end
+return won
+""")
+
+# 只有在欄位仍是 pending 標記時才刪除，避免刪掉其他 worker 已寫入的訊息 ID
+_release_twitch_claim = r.register_script("""
+local current = redis.call('HGET', KEYS[1], ARGV[1])
+if current and string.sub(current, 1, 8) == 'pending:' then
+    return redis.call('HDEL', KEYS[1], ARGV[1])
+end
+return 0
+""")
+
+# 欄位仍是 pending 標記時更新為現在時間 (ARGV[2])，讓處理中或等待重試的通知不會被重新搶佔
+# KEYS[1]: twitch:notified_streams:{guild_id}，ARGV[1]: 實況主
+_renew_twitch_claim = r.register_script("""
+local current = redis.call('HGET', KEYS[1], ARGV[1])
+if current and string.sub(current, 1, 8) == 'pending:' then
+    redis.call('HSET', KEYS[1], ARGV[1], 'pending:' .. ARGV[2])
+    return 1
+end
+return 0
+""")
+
+# 將已送出開台通知 (欄位為訊息 ID) 的組合改為 offline 標記，同一次關台只會被標記一次
+# KEYS: 各組的 twitch:notified_streams:{guild_id}，ARGV: 現在時間、各組的實況主；回傳 [序號, 標記, ...]
+_mark_twitch_offline = r.register_script("""
+local marked = {}
+for i, key in ipairs(KEYS) do
+    local streamer = ARGV[i + 1]
+    local current = redis.call('HGET', key, streamer)
+    if current and not string.find(current, ':', 1, true) then
+        local marker = 'offline:' .. ARGV[1] .. ':' .. current
+        redis.call('HSET', key, streamer, marker)
+        table.insert(marked, i)
+        table.insert(marked, marker)
+    end
+end
+return marked
+""")
+
+# 欄位仍是 ARGV[2] 時改為 ARGV[3]，ARGV[3] 為空字串時刪除欄位；KEYS[1]: twitch:notified_streams:{guild_id}，ARGV[1]: 實況主
+_replace_twitch_notified = r.register_script("""
+if redis.call('HGET', KEYS[1], ARGV[1]) ~= ARGV[2] then
+    return 0
+end
+if ARGV[3] == '' then
+    redis.call('HDEL', KEYS[1], ARGV[1])
+else
+    redis.call('HSET', KEYS[1], ARGV[1], ARGV[3])
+end
+return 1
+""")
+
+# 更新 Guild 的追蹤列表快照 (KEYS[3])：有變動時遞增版本 (KEYS[1])，並把變更寫入以版本為分數的紀錄 (KEYS[2])
+# ARGV: 操作、變更內容 (JSON)、保留的紀錄筆數、實況主
+_publish_twitch_subscriptions = r.register_script("""
+local op = ARGV[1]
+local changed = 1
+if op == 'reset' then
+    redis.call('DEL', KEYS[3])
+    if #ARGV > 3 then
+        redis.call('SADD', KEYS[3], unpack(ARGV, 4))
+    end
+elseif op == 'add' then
+    changed = redis.call('SADD', KEYS[3], unpack(ARGV, 4))
+    redis.call('PERSIST', KEYS[3])
+else
+    changed = redis.call('SREM', KEYS[3], unpack(ARGV, 4))
+end
+if changed == 0 then
+    return tonumber(redis.call('GET', KEYS[1]) or 0)
+end
+local version = redis.call('INCR', KEYS[1])
+redis.call('ZADD', KEYS[2], version, version .. ':' .. ARGV[2])
+redis.call('ZREMRANGEBYRANK', KEYS[2], 0, -tonumber(ARGV[3]) - 1)
+return version
+""")
 
 ### === Twitch 相關緩存 === ###
 
-def check_and_clear_twitch_streamer(streamer_id):
+async def check_and_clear_twitch_streamer(streamer_id):
     """檢查 Twitch 實況主是否在線，若已下線則清除緩存"""
-    if not is_twitch_streamer_live(streamer_id):
-        clear_twitch_notified_streamer(streamer_id)
+    if not await is_twitch_streamer_live(streamer_id):
+        await clear_twitch_notified_streamer(streamer_id)
 
-def check_and_clear_youtube_streamer(streamer_id):
+async def check_and_clear_youtube_streamer(streamer_id):
     """檢查 YouTube 直播主是否在線，若已下線則清除緩存"""
-    if not is_youtube_streamer_live(streamer_id):
-        clear_youtube_notified_streamer(streamer_id)
-
-def cache_twitch_guild_streamers(guild_id, streamers):
-    """緩存特定 Guild 追蹤的 Twitch 實況主"""
-
-    if not streamers:
-        return
-
-    r.sadd(f"twitch:guild_streamers:{guild_id}", *streamers)
-    r.expire(f"twitch:guild_streamers:{guild_id}", 86400)
-
-
-def remove_twitch_guild_streamers(guild_id, streamers) -> bool:
-    """移除特定 Guild 追蹤的 Twitch 實況主"""
-    if not streamers:
-        return False
-
-    if isinstance(streamers, str):
-        streamers = [streamers]
-
-    removed_count = r.srem(f"twitch:guild_streamers:{guild_id}", *streamers)
-    return removed_count > 0 # 返回是否成功移除
-
-
-def get_twitch_guild_streamers(guild_id):
+    if not await is_youtube_streamer_live(streamer_id):
+        await clear_youtube_notified_streamer(streamer_id)
+
+async def publish_twitch_subscriptions(guild_id, op: str, streamers: Iterable[str] = ()) -> int:
+    """
+    更新 Guild 追蹤列表的快照，並寫入變更紀錄供其他 worker 增量同步，回傳目前的版本。
+
+    ``op`` 為 ``add``、``remove`` 或 ``reset`` (以 ``streamers`` 取代整個列表)；
+    新增/移除沒有造成任何變動時不會遞增版本。
+    """
+    streamers = list(streamers)
+    if op != "reset" and not streamers:
+        return await get_twitch_subscription_version()
+
+    payload = json.dumps({"op": op, "guild": int(guild_id), "streamers": streamers})
+
+    return int(await _publish_twitch_subscriptions(
+        keys=[SUBSCRIPTION_VERSION_KEY, SUBSCRIPTION_LOG_KEY, f"twitch:guild_streamers:{guild_id}"],
+        args=[op, payload, SUBSCRIPTION_LOG_SIZE, *streamers],
+    ))
+
+async def get_twitch_subscription_version() -> int:
+    return int(await r.get(SUBSCRIPTION_VERSION_KEY) or 0)
+
+async def get_twitch_subscription_changes(since: int) -> Tuple[int, Optional[List[dict]]]:
+    """
+    取得版本 ``since`` 之後的追蹤列表變更 (依版本排序)，回傳 (目前版本, 變更)。
+
+    所需的紀錄已被裁剪時變更為 ``None``，呼叫端需要重新載入完整的追蹤列表。
+    """
+    async with r.pipeline(transaction=True) as pipe:
+        pipe.get(SUBSCRIPTION_VERSION_KEY)
+        pipe.zrange(SUBSCRIPTION_LOG_KEY, 0, 0, withscores=True)
+        pipe.zrangebyscore(SUBSCRIPTION_LOG_KEY, f"({since}", "+inf")
+        version, oldest, entries = await pipe.execute()
+
+    version = int(version or 0)
+    if version <= since:
+        return version, []
+
+    if not oldest or int(oldest[0][1]) > since + 1:
+        return version, None
+
+    changes = []
+    for entry in entries:
+        entry_version, payload = entry.split(":", 1)
+        change = json.loads(payload)
+        change["version"] = int(entry_version)
+        changes.append(change)
+
+    return version, changes
+
+async def get_twitch_subscription_snapshot(guild_ids: Iterable[int]) -> Dict[int, Set[str]]:
+    """以單一 pipeline 取得多個 Guild 在快照中的追蹤列表"""
+    guild_ids = list(guild_ids)
+    async with r.pipeline(transaction=False) as pipe:
+        for guild_id in guild_ids:
+            pipe.smembers(f"twitch:guild_streamers:{guild_id}")
+        results = await pipe.execute()
+
+    return dict(zip(guild_ids, results))
+
+
+AUTOCOMPLETE_SEPARATOR = "\x00"
+AUTOCOMPLETE_MAX_CHAR = "\U0010ffff"  # UTF-8 編碼最大的字元，作為前綴查詢的上界
+# 索引建立時一併寫入的成員 (空字串 + 分隔字元)，讓沒有追蹤任何實況主的 Guild 也有索引，不必每次按鍵都查詢資料庫
+AUTOCOMPLETE_SENTINEL = AUTOCOMPLETE_SEPARATOR
+# 舊版在索引不存在時只寫入新追蹤的實況主，留下不完整的索引；更換 key 讓所有 Guild 重新從資料庫建立一次
+AUTOCOMPLETE_KEY = "twitch:autocomplete:v2:{}"
+AUTOCOMPLETE_NAMES_KEY = "twitch:autocomplete_names:v2:{}"
+
+# 只在索引 (KEYS[1]) 已建立時加入實況主，索引尚未建立時留待自動完成從資料庫建立完整索引
+# KEYS: 索引、顯示名稱 hash，ARGV: login、顯示名稱、索引成員
+_add_twitch_autocomplete = r.register_script("""
+if redis.call('EXISTS', KEYS[1]) == 0 then
+    return 0
+end
+for i = 3, #ARGV do
+    redis.call('ZADD', KEYS[1], 0, ARGV[i])
+end
+redis.call('HSET', KEYS[2], ARGV[1], ARGV[2])
+return 1
+""")
+
+
+def _autocomplete_terms(login: str, display_name: Optional[str]) -> Set[str]:
+    return {f"{term}{AUTOCOMPLETE_SEPARATOR}{login}" for term in {login.lower(), (display_name or login).lower()}}
+
+
+async def index_twitch_streamers(guild_id, streamers: Dict[str, str]):
+    """
+    以 Guild 追蹤的所有實況主建立自動完成索引 (login -> 顯示名稱)。
+
+    索引為分數皆為 0 的 sorted set，成員為 ``小寫 login 或顯示名稱 + 分隔字元 + login``，
+    可用 ZRANGEBYLEX 以前綴查詢；``streamers`` 為空時只寫入 :data:`AUTOCOMPLETE_SENTINEL`。
+    """
+    terms = {AUTOCOMPLETE_SENTINEL: 0}
+    for login, display_name in streamers.items():
+        terms.update(dict.fromkeys(_autocomplete_terms(login, display_name), 0))
+
+    async with r.pipeline(transaction=True) as pipe:
+        pipe.zadd(AUTOCOMPLETE_KEY.format(guild_id), terms)
+        if streamers:
+            pipe.hset(
+                AUTOCOMPLETE_NAMES_KEY.format(guild_id),
+                mapping={login: display_name or login for login, display_name in streamers.items()},
+            )
+        await pipe.execute()
+
+async def add_twitch_streamer_to_index(guild_id, streamer_id: str, display_name: Optional[str]) -> bool:
+    """將新追蹤的實況主加入已建立的自動完成索引，索引尚未建立時不做任何事並回傳 False"""
+    return bool(await _add_twitch_autocomplete(
+        keys=[AUTOCOMPLETE_KEY.format(guild_id), AUTOCOMPLETE_NAMES_KEY.format(guild_id)],
+        args=[streamer_id, display_name or streamer_id, *_autocomplete_terms(streamer_id, display_name)],
+    ))
+
+async def unindex_twitch_streamer(guild_id, streamer_id):
+    """從自動完成索引移除實況主"""
+    display_name = await r.hget(AUTOCOMPLETE_NAMES_KEY.format(guild_id), streamer_id) or streamer_id
+
+    async with r.pipeline(transaction=True) as pipe:
+        pipe.zrem(AUTOCOMPLETE_KEY.format(guild_id), *_autocomplete_terms(streamer_id, display_name))
+        pipe.hdel(AUTOCOMPLETE_NAMES_KEY.format(guild_id), streamer_id)
+        await pipe.execute()
+
+async def search_twitch_streamers(guild_id, query: str, limit: int = 25) -> Optional[List[str]]:
+    """以前綴查詢 login 或顯示名稱符合的實況主，索引尚未建立時回傳 None"""
+    key = AUTOCOMPLETE_KEY.format(guild_id)
+    prefix = query.lower()
+
+    async with r.pipeline(transaction=False) as pipe:
+        pipe.exists(key)
+        pipe.zrangebylex(key, f"[{prefix}", f"[{prefix}{AUTOCOMPLETE_MAX_CHAR}", start=0, num=limit * 2 + 1)
+        exists, members = await pipe.execute()
+
+    if not exists:
+        return None
+
+    results = []
+    for member in members:
+        login = member.rsplit(AUTOCOMPLETE_SEPARATOR, 1)[1]
+        if login and login not in results:
+            results.append(login)
+
+    return results[:limit]
+
+
+async def get_twitch_guild_streamers(guild_id):
     """獲取特定 Guild 追蹤的 Twitch 直播主"""
-    return r.smembers(f"twitch:guild_streamers:{guild_id}")
+    return await r.smembers(f"twitch:guild_streamers:{guild_id}")
 
-def is_twitch_streamer_live(streamer_id):
+async def is_twitch_streamer_live(streamer_id):
     """檢查 Twitch 實況主是否在線"""
-    return r.exists(f"twitch:live_streamer:{streamer_id}")
-
-def cache_twitch_streamer_live(streamer_id, duration=60):
-    r.setex(f"twitch:live_streamer:{streamer_id}", duration, "1")
-
-
-def mark_twitch_as_notified(guild_id, streamer_id, message_id):
+    return await r.exists(f"twitch:live_streamer:{streamer_id}")
+
+async def are_twitch_streamers_live(streamer_ids: Iterable[str]) -> Dict[str, bool]:
+    """以單一 pipeline 檢查多個 Twitch 實況主是否在線"""
+    streamer_ids = list(streamer_ids)
+    async with r.pipeline(transaction=False) as pipe:
+        for streamer_id in streamer_ids:
+            pipe.exists(f"twitch:live_streamer:{streamer_id}")
+        results = await pipe.execute()
+    return {streamer_id: bool(live) for streamer_id, live in zip(streamer_ids, results)}
+
+async def cache_twitch_streamer_live(streamer_id, duration=60):
+    await r.setex(f"twitch:live_streamer:{streamer_id}", duration, "1")
+
+async def clear_twitch_streamer_live(streamer_id):
+    """清除 Twitch 實況主的直播狀態緩存"""
+    await r.delete(f"twitch:live_streamer:{streamer_id}")
+
+async def cache_twitch_streamers_live(streamer_ids: Iterable[str], duration: float = 60):
+    """以單一 pipeline 緩存多個 Twitch 實況主的直播狀態，``duration`` 可以是小數秒"""
+    async with r.pipeline(transaction=False) as pipe:
+        for streamer_id in streamer_ids:
+            pipe.set(f"twitch:live_streamer:{streamer_id}", "1", px=max(1, int(duration * 1000)))
+        await pipe.execute()
+
+async def get_twitch_schedules(streamer_ids: Iterable[str]) -> Dict[str, dict]:
+    """取得多個 Twitch 實況主的開台紀錄，沒有紀錄的實況主不會出現在結果中"""
+    streamer_ids = list(streamer_ids)
+    if not streamer_ids:
+        return {}
+    results = await r.hmget("twitch:schedules", streamer_ids)
+    return {streamer_id: json.loads(data) for streamer_id, data in zip(streamer_ids, results) if data}
+
+async def save_twitch_schedules(schedules: Dict[str, dict]):
+    """保存多個 Twitch 實況主的開台紀錄，供輪詢排程器重新啟動後使用"""
+    await r.hset("twitch:schedules", mapping={streamer_id: json.dumps(data) for streamer_id, data in schedules.items()})
+
+async def get_twitch_user_profiles(field: str, keys: Iterable[str]) -> Dict[str, dict]:
+    """以 login 或用戶 ID 取得快取的 Twitch 用戶資料，未快取的 key 不會出現在結果中"""
+    keys = list(keys)
+    results = await r.mget([f"twitch:user:{field}:{key}" for key in keys])
+    return {key: json.loads(data) for key, data in zip(keys, results) if data}
+
+async def cache_twitch_user_profiles(profiles: Iterable[dict], ttl: int):
+    """以 login 與用戶 ID 快取 Twitch 用戶資料"""
+    async with r.pipeline(transaction=False) as pipe:
+        for profile in profiles:
+            data = json.dumps(profile)
+            pipe.setex(f"twitch:user:login:{profile['login'].lower()}", ttl, data)
+            pipe.setex(f"twitch:user:id:{profile['id']}", ttl, data)
+        await pipe.execute()
+
+
+async def mark_twitch_as_notified(guild_id, streamer_id, message_id):
     """標記 Twitch 實況主已被通知"""
     key = f"twitch:notified_streams:{guild_id}"
     # 使用 hset 將訊息 ID 存儲在哈希中
-    r.hset(key, streamer_id, message_id)
+    await r.hset(key, streamer_id, message_id)
     return True
 
-def get_twitch_message_id(guild_id, streamer_id):
+async def get_twitch_message_id(guild_id, streamer_id):
     """獲取已通知的 Twitch 訊息 ID"""
     key = f"twitch:notified_streams:{guild_id}"
-    return r.hget(key, streamer_id)
-
-
-def has_twitch_notified(guild_id, streamer_id):
+    return await r.hget(key, streamer_id)
+
+async def get_twitch_message_ids(pairs: Iterable[Tuple[int, str]]) -> Dict[Tuple[int, str], str]:
+    """以單一 pipeline 取得多組 (Guild, 實況主) 已通知的 Twitch 訊息 ID，未通知的組合不會出現在結果中"""
+    pairs = list(pairs)
+    async with r.pipeline(transaction=False) as pipe:
+        for guild_id, streamer_id in pairs:
+            pipe.hget(f"twitch:notified_streams:{guild_id}", streamer_id)
+        results = await pipe.execute()
+    return {
+        pair: message_id
+        for pair, message_id in zip(pairs, results)
+        if message_id and ":" not in message_id  # 略過 pending / offline 標記
+    }
+
+
+async def has_twitch_notified(guild_id, streamer_id):
     """檢查 Twitch 實況主是否已被通知"""
     key = f"twitch:notified_streams:{guild_id}"
-    return r.hexists(key, streamer_id)  # 檢查 Redis Hash 是否存在該主播的訊息 ID
-
-
-def clear_twitch_notified_streamer(guild_id, streamer_id):
-    """清除特定 Guild 中 Twitch 已通知的直播狀態"""
+    return await r.hexists(key, streamer_id)  # 檢查 Redis Hash 是否存在該主播的訊息 ID
+
+async def claim_twitch_notifications(
+    pairs: Iterable[Tuple[int, str]], pending_ttl: int = CLAIM_PENDING_TTL
+) -> Set[Tuple[int, str]]:
+    """
+    以單一 Lua 腳本原子地搶佔多組 (Guild, 實況主) 的開台通知，回傳這次搶到的組合。
+
+    搶到的組合會先寫入 pending 標記，送出通知後再由 mark_twitch_as_notified 覆寫為訊息 ID；
+    若 worker 在送出前當機，pending 超過 ``pending_ttl`` 秒後可被重新搶佔。
+    """
+    pairs = list(pairs)
+    if not pairs:
+        return set()
+
+    won = await _claim_twitch_notifications(
+        keys=[f"twitch:notified_streams:{guild_id}" for guild_id, _ in pairs],
+        args=[int(time.time()), pending_ttl, *(streamer_id for _, streamer_id in pairs)],
+    )
+    return {pairs[i - 1] for i in won}
+
+async def release_twitch_claim(guild_id, streamer_id):
+    """通知發送失敗時釋放搶佔，讓下一次檢查可以重試"""
+    await _release_twitch_claim(keys=[f"twitch:notified_streams:{guild_id}"], args=[streamer_id])
+
+async def renew_twitch_claim(guild_id, streamer_id) -> bool:
+    """延長尚未送出的開台通知搶佔，回傳 False 表示通知已送出或搶佔已被清除"""
+    renewed = await _renew_twitch_claim(
+        keys=[f"twitch:notified_streams:{guild_id}"], args=[streamer_id, int(time.time())]
+    )
+    return bool(renewed)
+
+async def mark_twitch_offline(pairs: Iterable[Tuple[int, str]]) -> Dict[Tuple[int, str], str]:
+    """
+    以單一 Lua 腳本將已送出開台通知的組合標記為關台處理中，回傳 {(Guild, 實況主): offline 標記}。
+
+    只有欄位是訊息 ID 時才會標記，因此同一次關台只會回傳一次，尚未送出的 pending 搶佔也不會被視為已通知。
+    訊息 ID 可用 :func:`twitch_offline_message_id` 從標記取出。
+    """
+    pairs = list(pairs)
+    if not pairs:
+        return {}
+
+    marked = await _mark_twitch_offline(
+        keys=[f"twitch:notified_streams:{guild_id}" for guild_id, _ in pairs],
+        args=[int(time.time()), *(streamer_id for _, streamer_id in pairs)],
+    )
+    return {pairs[index - 1]: marker for index, marker in zip(marked[::2], marked[1::2])}
+
+def twitch_offline_message_id(marker: str) -> str:
+    return marker.rsplit(":", 1)[1]
+
+async def restore_twitch_offline(guild_id, streamer_id, marker: str) -> bool:
+    """關台動作失敗時把 offline 標記改回訊息 ID，讓下一次檢查重新排入"""
+    return bool(await _replace_twitch_notified(
+        keys=[f"twitch:notified_streams:{guild_id}"], args=[streamer_id, marker, twitch_offline_message_id(marker)]
+    ))
+
+
+async def clear_twitch_notified_streamer(guild_id, streamer_id, expected: Optional[str] = None) -> bool:
+    """
+    清除特定 Guild 中 Twitch 已通知的直播狀態。
+
+    指定 ``expected`` 時只有欄位仍是該值才清除，避免過時的工作清掉新一場直播的通知或搶佔。
+    """
     key = f"twitch:notified_streams:{guild_id}"
-    if r.hexists(key, streamer_id):
-        r.hdel(key, streamer_id)
+    if expected is None:
+        return bool(await r.hdel(key, streamer_id))
+    return bool(await _replace_twitch_notified(keys=[key], args=[streamer_id, expected, ""]))
 
 ### === YouTube 相關緩存 === ###
 
-def cache_youtube_guild_streamers(guild_id, streamers):
+async def cache_youtube_guild_streamers(guild_id, streamers):
     """緩存特定 Guild 追蹤的 Youtube 實況主"""
     if not streamers:
         return
-    r.sadd(f"youtube:guild_streamers:{guild_id}", *streamers)
-    r.expire(f"youtube:guild_streamers:{guild_id}", 86400)
+    async with r.pipeline(transaction=False) as pipe:
+        pipe.sadd(f"youtube:guild_streamers:{guild_id}", *streamers)
+        pipe.expire(f"youtube:guild_streamers:{guild_id}", 86400)
+        await pipe.execute()
 
-def remove_youtube_guild_streamers(guild_id, streamers):
+async def remove_youtube_guild_streamers(guild_id, streamers):
     """移除特定 Guild 追蹤的 Twitch 實況主"""
     if not streamers:
         return
@@ -94,33 +472,44 @@ def remove_youtube_guild_streamers(guild_id, streamers):
     if isinstance(streamers, str):
         streamers = [streamers]
 
-    r.srem(f"youtube:guild_streamers:{guild_id}", *streamers)
+    await r.srem(f"youtube:guild_streamers:{guild_id}", *streamers)
 
-def get_youtube_guild_streamers(guild_id):
+async def get_youtube_guild_streamers(guild_id):
     """獲取特定 Guild 追蹤的 YouTube 直播主"""
-    return r.smembers(f"youtube:guild_streamers:{guild_id}")
+    return await r.smembers(f"youtube:guild_streamers:{guild_id}")
 
-def is_youtube_streamer_live(streamer_id):
+async def is_youtube_streamer_live(streamer_id):
     """檢查 YouTube 直播主是否在線"""
-    return r.exists(f"youtube:live_streamer:{streamer_id}")
+    return await r.exists(f"youtube:live_streamer:{streamer_id}")
 
-def cache_youtube_streamer_live(streamer_id, duration=10):
+async def cache_youtube_streamer_live(streamer_id, duration=10):
     """緩存 YouTube 直播狀態"""
-    clear_youtube_notified_streamer(streamer_id)
-    r.setex(f"youtube:live_streamer:{streamer_id}", duration, "1")
-
-def mark_youtube_as_notified(guild_id, streamer_id, duration=600):
-    """標記 YouTube 直播主已通知"""
-    r.sadd(f"youtube:notified_streams:{guild_id}", streamer_id)
-    r.expire(f"youtube:notified_streams:{guild_id}", duration)
-
-def has_youtube_notified(guild_id, streamer_id):
+    await clear_youtube_notified_streamer(streamer_id)
+    await r.setex(f"youtube:live_streamer:{streamer_id}", duration, "1")
+
+async def mark_youtube_as_notified(guild_id, streamer_id, duration=600):
+    """標記 YouTube 直播主已通知，並同步更新 實況主 -> Guild 的反向索引"""
+    async with r.pipeline(transaction=True) as pipe:
+        pipe.sadd(f"youtube:notified_streams:{guild_id}", streamer_id)
+        pipe.expire(f"youtube:notified_streams:{guild_id}", duration)
+        pipe.sadd(f"youtube:notified_guilds:{streamer_id}", guild_id)
+        pipe.expire(f"youtube:notified_guilds:{streamer_id}", duration)
+        await pipe.execute()
+
+async def has_youtube_notified(guild_id, streamer_id):
     """檢查 YouTube 是否已通知"""
-    return r.sismember(f"youtube:notified_streams:{guild_id}", streamer_id)
-
-def clear_youtube_notified_streamer(streamer_id):
-    """清除 YouTube 已通知的直播狀態"""
-    keys = r.keys(f"youtube:notified_streams:*")
-    for key in keys:
-        r.srem(key, streamer_id)
-    r.delete(f"youtube:live_streamer:{streamer_id}")
\ No newline at end of file
+    return await r.sismember(f"youtube:notified_streams:{guild_id}", streamer_id)
+
+async def clear_youtube_notified_streamer(streamer_id):
+    """清除 YouTube 已通知的直播狀態，只會碰到反向索引中記錄的 Guild"""
+    index_key = f"youtube:notified_guilds:{streamer_id}"
+    guilds = await r.smembers(index_key)
+
+    async with r.pipeline(transaction=True) as pipe:
+        for guild_id in guilds:
+            pipe.srem(f"youtube:notified_streams:{guild_id}", streamer_id)
+        if guilds:
+            # 只移除讀到的 Guild，期間新加入反向索引的 Guild 留待下次清除
+            pipe.srem(index_key, *guilds)
+        pipe.delete(f"youtube:live_streamer:{streamer_id}")
+        await pipe.execute()
@@ -0,0 +1,212 @@
+import heapq
+import math
+import time
+
+from dataclasses import dataclass, field
+from typing import Awaitable, Callable, Dict, Iterable, List, Optional, Tuple
+
+from core.twitch import HELIX_BATCH_SIZE
+
+MIN_INTERVAL = 10  # 最可能開台的實況主：與原本固定 10 秒輪詢相同
+LIVE_INTERVAL = 30  # 直播中只需要偵測結束，須短於直播狀態緩存的 60 秒
+NEW_INTERVAL = 30  # 剛開始追蹤、還沒有開台紀錄的實況主
+NEW_PERIOD = 86400  # 開始追蹤後一天內都視為新追蹤
+ACTIVE_MAX_INTERVAL = 120  # 不在常開台的時段，或追蹤超過一天仍未開台
+DORMANT_INTERVAL = 600  # 很久沒開台
+DORMANT_AFTER = 30 * 86400
+HISTORY_DECAY = 0.9  # 每次開台時舊紀錄的權重衰減，讓最近的開台時段比較重要
+LIKELY_HOUR_WEIGHT = 0.25  # 前後一小時內的開台比例達到這個值時，以最短間隔輪詢
+
+HistoryLoader = Callable[[List[str]], Awaitable[Dict[str, dict]]]
+HistorySaver = Callable[[Dict[str, dict]], Awaitable[None]]
+
+
+@dataclass(slots=True)
+class StreamerSchedule:
+    hours: List[float] = field(default_factory=lambda: [0.0] * 24)  # 各 UTC 小時的開台次數 (含衰減)
+    last_live_at: Optional[float] = None
+    first_seen: Optional[float] = None
+    live: Optional[bool] = None  # None：尚未輪詢過，啟動時已在直播不算一次開台
+    next_poll: float = 0.0
+
+    def record_go_live(self, now: float) -> None:
+        self.hours = [count * HISTORY_DECAY for count in self.hours]
+        self.hours[time.gmtime(now).tm_hour] += 1
+        self.last_live_at = now
+
+    def hour_weight(self, now: float) -> float:
+        """目前時段 (前後一小時) 佔所有開台紀錄的比例"""
+        total = sum(self.hours)
+        if not total:
+            return 0.0
+        hour = time.gmtime(now).tm_hour
+        return sum(self.hours[(hour + offset) % 24] for offset in (-1, 0, 1)) / total
+
+    def interval(self, now: float) -> float:
+        if self.live:
+            return LIVE_INTERVAL
+
+        idle = now - (self.last_live_at or self.first_seen or now)
+
+        if self.last_live_at is None and idle < NEW_PERIOD:
+            return NEW_INTERVAL
+
+        if idle > DORMANT_AFTER:
+            return DORMANT_INTERVAL
+
+        likelihood = min(1.0, self.hour_weight(now) / LIKELY_HOUR_WEIGHT)
+        backoff = (ACTIVE_MAX_INTERVAL - MIN_INTERVAL) * (1 - likelihood)
+        backoff *= 1 + idle / (7 * 86400)  # 每一週沒開台，延長的部分再加一倍
+
+        return min(MIN_INTERVAL + backoff, DORMANT_INTERVAL)
+
+    def to_dict(self) -> dict:
+        return {
+            "hours": [round(count, 3) for count in self.hours],
+            "last_live_at": self.last_live_at,
+            "first_seen": self.first_seen,
+        }
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "StreamerSchedule":
+        return cls(
+            hours=list(data.get("hours") or [0.0] * 24),
+            last_live_at=data.get("last_live_at"),
+            first_seen=data.get("first_seen"),
+        )
+
+
+class PollScheduler:
+    """
+    依每位實況主的開台習慣決定輪詢頻率的排程器。
+
+    以最早的下次輪詢時間為優先的 heap 排程：常在目前時段開台的實況主每 10 秒輪詢，
+    近期沒開台、不在常開台時段或從未開台的實況主逐漸拉長間隔，超過 30 天沒開台則每 10 分鐘輪詢一次。
+    每分鐘的 Helix 請求數受 ``budget`` 限制 (token bucket)，超出預算的實況主會留到下一輪。
+    開台紀錄可透過 ``load_history`` / ``save_history`` 持久化，重新啟動後不需重新學習。
+    """
+
+    def __init__(
+        self,
+        budget: int = 60,
+        batch_size: int = HELIX_BATCH_SIZE,
+        load_history: Optional[HistoryLoader] = None,
+        save_history: Optional[HistorySaver] = None,
+    ):
+        self.budget = budget
+        self.batch_size = batch_size
+        self.load_history = load_history
+        self.save_history = save_history
+
+        self.schedules: Dict[str, StreamerSchedule] = {}
+        self._heap: List[Tuple[float, str]] = []
+        self._tokens = float(budget)
+        self._updated_at: Optional[float] = None
+
+    def _push(self, streamer: str, next_poll: float) -> None:
+        self.schedules[streamer].next_poll = next_poll
+        heapq.heappush(self._heap, (next_poll, streamer))
+
+    def _pop(self, until: float = math.inf) -> Optional[str]:
+        """取出在 ``until`` 之前到期的下一位實況主，略過已移除或已重新排程的過期項目"""
+        while self._heap:
+            next_poll, streamer = self._heap[0]
+            schedule = self.schedules.get(streamer)
+
+            if schedule is None or schedule.next_poll != next_poll:
+                heapq.heappop(self._heap)
+                continue
+
+            if next_poll > until:
+                return None
+
+            heapq.heappop(self._heap)
+            schedule.next_poll = -1.0  # 讓 heap 中相同時間的重複項目失效
+            return streamer
+
+        return None
+
+    def _compact(self) -> None:
+        """重新排程會在 heap 中留下過期項目，累積過多時重建 heap"""
+        if len(self._heap) > 2 * len(self.schedules) + 64:
+            self._heap = [(schedule.next_poll, streamer) for streamer, schedule in self.schedules.items()]
+            heapq.heapify(self._heap)
+
+    def _refill(self, now: float) -> None:
+        if self._updated_at is not None:
+            self._tokens = min(self.budget, self._tokens + max(0.0, now - self._updated_at) * self.budget / 60)
+        self._updated_at = now
+
+    async def sync(self, streamers: Iterable[str], now: Optional[float] = None) -> None:
+        """讓排程與目前的追蹤列表一致，新追蹤的實況主會立即輪詢"""
+        now = now or time.time()
+        streamers = set(streamers)
+
+        for streamer in set(self.schedules) - streamers:
+            del self.schedules[streamer]
+
+        added = [streamer for streamer in streamers if streamer not in self.schedules]
+        if not added:
+            return
+
+        history = await self.load_history(added) if self.load_history else {}
+        first_seen = {}
+
+        for streamer in added:
+            data = history.get(streamer)
+            if data:
+                self.schedules[streamer] = StreamerSchedule.from_dict(data)
+            else:
+                self.schedules[streamer] = StreamerSchedule(first_seen=now)
+                first_seen[streamer] = self.schedules[streamer].to_dict()
+            self._push(streamer, now)
+
+        if first_seen and self.save_history:
+            await self.save_history(first_seen)
+
+    async def due(self, streamers: Iterable[str], now: Optional[float] = None) -> List[str]:
+        """
+        取得這一輪需要輪詢的實況主。
+
+        在預算內依到期先後取出到期的實況主；最後一個批次若還有空位，
+        會順便帶上最快到期的實況主，不增加請求數。
+        取出的實況主會先暫定在 ``MIN_INTERVAL`` 秒後重試，收到結果後由 :meth:`record` 重新排程。
+        """
+        now = now or time.time()
+        await self.sync(streamers, now)
+        self._refill(now)
+
+        capacity = int(self._tokens) * self.batch_size
+        selected: List[str] = []
+
+        while len(selected) < capacity and (streamer := self._pop(until=now)) is not None:
+            selected.append(streamer)
+
+        if selected:
+            while len(selected) % self.batch_size and (streamer := self._pop()) is not None:
+                selected.append(streamer)
+
+            self._tokens -= math.ceil(len(selected) / self.batch_size)
+
+        for streamer in selected:
+            self._push(streamer, now + MIN_INTERVAL)
+
+        self._compact()
+        return selected
+
+    async def record(self, streamer: str, live: bool, now: Optional[float] = None) -> None:
+        """依輪詢或 EventSub 的結果更新開台紀錄並排定下次輪詢"""
+        schedule = self.schedules.get(streamer)
+        if schedule is None:
+            return
+
+        now = now or time.time()
+        went_live = live and schedule.live is False
+        schedule.live = live
+
+        if went_live:
+            schedule.record_go_live(now)
+            if self.save_history:
+                await self.save_history({streamer: schedule.to_dict()})
+
+        self._push(streamer, now + schedule.interval(now))
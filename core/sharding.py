@@ -0,0 +1,136 @@
+import hashlib
+import logging
+import os
+import socket
+import time
+import zlib
+
+from typing import Iterable, List, Optional, Set
+
+from redis import asyncio as redis
+
+WORKERS_KEY = "twitch:workers"
+LEASE_KEY = "twitch:shard_lease:{}"
+
+# 租約不存在時取得、屬於自己時續約，回傳成功持有的租約索引
+_ACQUIRE_LEASES = """
+local held = {}
+for i, key in ipairs(KEYS) do
+    local owner = redis.call('GET', key)
+    if not owner then
+        redis.call('SET', key, ARGV[1], 'PX', ARGV[2])
+        table.insert(held, i)
+    elseif owner == ARGV[1] then
+        redis.call('PEXPIRE', key, ARGV[2])
+        table.insert(held, i)
+    end
+end
+return held
+"""
+
+# 只釋放屬於自己的租約
+_RELEASE_LEASES = """
+local released = 0
+for _, key in ipairs(KEYS) do
+    if redis.call('GET', key) == ARGV[1] then
+        released = released + redis.call('DEL', key)
+    end
+end
+return released
+"""
+
+
+def default_worker_id() -> str:
+    return f"{socket.gethostname()}-{os.getpid()}"
+
+
+def shard_of(streamer: str, shard_count: int) -> int:
+    """實況主固定落在同一個分片，與 worker 數量無關"""
+    return zlib.crc32(streamer.lower().encode()) % shard_count
+
+
+def _score(worker_id: str, shard: int) -> int:
+    return int.from_bytes(hashlib.blake2b(f"{worker_id}:{shard}".encode(), digest_size=8).digest(), "big")
+
+
+def assign_shards(worker_id: str, workers: Iterable[str], shard_count: int) -> Set[int]:
+    """以 rendezvous hashing 計算 ``worker_id`` 應負責的分片，worker 增減時只會移動少量分片"""
+    workers = list(workers) or [worker_id]
+    return {
+        shard
+        for shard in range(shard_count)
+        if max(workers, key=lambda worker: _score(worker, shard)) == worker_id
+    }
+
+
+class ShardCoordinator:
+    """
+    透過 Redis 租約把實況主輪詢分散到多個 worker。
+
+    每個 worker 定期呼叫 :meth:`refresh`：
+    送出心跳、依存活的 worker 計算自己應負責的分片、取得或續約這些分片的租約，
+    並釋放不再負責的分片。worker 停止心跳後，其租約會在 ``lease_ttl`` 秒內過期並由其他 worker 接手。
+    """
+
+    def __init__(
+        self,
+        client: redis.Redis,
+        worker_id: Optional[str] = None,
+        shard_count: int = 64,
+        lease_ttl: int = 30,
+        logger: Optional[logging.Logger] = None,
+    ):
+        self.r = client
+        self.worker_id = worker_id or default_worker_id()
+        self.shard_count = shard_count
+        self.lease_ttl = lease_ttl
+        self.logger = logger or logging.getLogger(__name__)
+        self.shards: Set[int] = set()
+
+        self._acquire = client.register_script(_ACQUIRE_LEASES)
+        self._release = client.register_script(_RELEASE_LEASES)
+
+    def owns(self, streamer: str) -> bool:
+        return shard_of(streamer, self.shard_count) in self.shards
+
+    def filter(self, streamers: Iterable[str]) -> List[str]:
+        return [streamer for streamer in streamers if self.owns(streamer)]
+
+    async def alive_workers(self) -> List[str]:
+        now = time.time()
+        async with self.r.pipeline(transaction=True) as pipe:
+            pipe.zadd(WORKERS_KEY, {self.worker_id: now})
+            pipe.zremrangebyscore(WORKERS_KEY, "-inf", now - self.lease_ttl)
+            pipe.zrange(WORKERS_KEY, 0, -1)
+            *_, workers = await pipe.execute()
+        return workers
+
+    async def refresh(self) -> Set[int]:
+        workers = await self.alive_workers()
+        desired = assign_shards(self.worker_id, workers, self.shard_count)
+
+        released = sorted(self.shards - desired)
+        if released:
+            await self._release(keys=[LEASE_KEY.format(shard) for shard in released], args=[self.worker_id])
+
+        desired = sorted(desired)
+        held = await self._acquire(
+            keys=[LEASE_KEY.format(shard) for shard in desired], args=[self.worker_id, self.lease_ttl * 1000]
+        ) if desired else []
+
+        shards = {desired[i - 1] for i in held}
+
+        if shards != self.shards:
+            self.logger.info(
+                f"Worker {self.worker_id}: 負責 {len(shards)}/{self.shard_count} 個分片 (存活 worker: {len(workers)})"
+            )
+
+        self.shards = shards
+        return shards
+
+    async def stop(self) -> None:
+        """釋放所有租約並移除心跳，讓其他 worker 立即接手"""
+        if self.shards:
+            await self._release(keys=[LEASE_KEY.format(shard) for shard in self.shards], args=[self.worker_id])
+        await self.r.zrem(WORKERS_KEY, self.worker_id)
+        self.shards = set()
@@ -0,0 +1,165 @@
+from typing import Callable, Dict, Iterable, KeysView, Optional, Set
+
+from core.db import get_all_guild_settings
+from core.redis_utils import (
+    get_twitch_subscription_changes,
+    get_twitch_subscription_snapshot,
+    get_twitch_subscription_version,
+    publish_twitch_subscriptions,
+)
+
+_EMPTY: frozenset = frozenset()
+
+
+class SubscriptionIndex:
+    """
+    常駐的 Twitch 追蹤索引 (實況主 -> Guild)。
+
+    啟動時由資料庫載入一次，並把與 Redis 快照不一致的 Guild 寫回快照。
+    新增/移除實況主的指令與 Guild 加入/離開事件會同時更新本機索引與 Redis 快照；
+    每次變動都會遞增 Redis 中的全域版本，其他 worker 在 :meth:`refresh` 時發現版本改變，
+    才依變更紀錄增量更新自己的索引 (包含移除)，版本沒有改變時只需要一次 GET。
+
+    ``guild_ids`` 回傳這個程序負責的 Guild，``owns_guild`` 判斷變更紀錄中的 Guild 是否由這個程序負責。
+    回傳的集合與 view 皆為索引內部的資料，呼叫端不應修改。
+    """
+
+    def __init__(
+        self,
+        guild_ids: Callable[[], Iterable[int]],
+        owns_guild: Optional[Callable[[int], bool]] = None,
+    ):
+        self.get_guild_ids = guild_ids
+        self.owns_guild = owns_guild or (lambda guild_id: True)
+
+        self._guilds: Dict[str, Set[int]] = {}  # streamer -> guild ids
+        self._streamers: Dict[int, Set[str]] = {}  # guild id -> streamers
+        self.version = 0  # 已同步的 Redis 快照版本
+        self.loaded = False
+
+    def __len__(self) -> int:
+        return len(self._guilds)
+
+    def __contains__(self, streamer: str) -> bool:
+        return streamer in self._guilds
+
+    @property
+    def streamers(self) -> KeysView[str]:
+        """所有被追蹤的實況主"""
+        return self._guilds.keys()
+
+    @property
+    def guild_ids(self) -> KeysView[int]:
+        return self._streamers.keys()
+
+    def guilds_for(self, streamer: str) -> Set[int]:
+        return self._guilds.get(streamer, _EMPTY)
+
+    def streamers_of(self, guild_id: int) -> Set[str]:
+        return self._streamers.get(guild_id, _EMPTY)
+
+    def snapshot(self, streamers: Iterable[str]) -> Dict[str, Set[int]]:
+        """
+        指定實況主的 Guild 對照表副本，沒有 Guild 追蹤的實況主對應空集合。
+
+        索引可能在 await 期間被指令或 :meth:`refresh` 修改，需要跨越 await 使用時應取用副本。
+        """
+        return {streamer: set(self._guilds.get(streamer, _EMPTY)) for streamer in streamers}
+
+    async def load(self) -> None:
+        """由資料庫重建整個索引，並修正 Redis 快照中與資料庫不一致的 Guild"""
+        # 先記下版本：載入期間其他 worker 的變更會在下一次 refresh 重新套用 (套用是冪等的)
+        version = await get_twitch_subscription_version()
+        guild_settings = await get_all_guild_settings("twitch", self.get_guild_ids())
+
+        self._guilds.clear()
+        self._streamers.clear()
+
+        for guild_id, settings in guild_settings.items():
+            self._set_guild(guild_id, settings.streamers.keys())
+
+        snapshot = await get_twitch_subscription_snapshot(guild_settings)
+        for guild_id, streamers in snapshot.items():
+            if streamers != self.streamers_of(guild_id):
+                await publish_twitch_subscriptions(guild_id, "reset", self.streamers_of(guild_id))
+
+        self.version = version
+        self.loaded = True
+
+    async def load_guild(self, guild_id: int) -> None:
+        """載入 (或重新載入) 單一 Guild 的追蹤列表，用於加入新的 Guild"""
+        settings = (await get_all_guild_settings("twitch", [guild_id])).get(guild_id)
+
+        self._set_guild(guild_id, settings.streamers.keys() if settings else ())
+        await publish_twitch_subscriptions(guild_id, "reset", self.streamers_of(guild_id))
+
+    async def add(self, guild_id: int, streamer: str) -> None:
+        self._add(guild_id, streamer)
+        await publish_twitch_subscriptions(guild_id, "add", [streamer])
+
+    async def remove(self, guild_id: int, streamer: str) -> None:
+        self._remove(guild_id, streamer)
+        await publish_twitch_subscriptions(guild_id, "remove", [streamer])
+
+    async def remove_guild(self, guild_id: int) -> None:
+        self._set_guild(guild_id, ())
+        await publish_twitch_subscriptions(guild_id, "reset")
+
+    async def refresh(self) -> bool:
+        """Redis 快照的版本改變時套用新的變更，紀錄已被裁剪時重新載入，回傳索引是否可能有變動"""
+        version, changes = await get_twitch_subscription_changes(self.version)
+
+        if changes is None:
+            await self.load()
+            return True
+
+        for change in changes:
+            guild_id = change["guild"]
+            if not self.owns_guild(guild_id):
+                continue
+
+            if change["op"] == "reset":
+                self._set_guild(guild_id, change["streamers"])
+            elif change["op"] == "add":
+                for streamer in change["streamers"]:
+                    self._add(guild_id, streamer)
+            else:
+                for streamer in change["streamers"]:
+                    self._remove(guild_id, streamer)
+
+        changed = version != self.version
+        self.version = version
+        return changed
+
+    def _add(self, guild_id: int, streamer: str) -> None:
+        self._streamers.setdefault(guild_id, set()).add(streamer)
+        self._guilds.setdefault(streamer, set()).add(guild_id)
+
+    def _remove(self, guild_id: int, streamer: str) -> None:
+        streamers = self._streamers.get(guild_id)
+        if not streamers or streamer not in streamers:
+            return
+
+        streamers.discard(streamer)
+        if not streamers:
+            del self._streamers[guild_id]
+
+        self._unlink(guild_id, streamer)
+
+    def _set_guild(self, guild_id: int, streamers: Iterable[str]) -> None:
+        for streamer in self._streamers.pop(guild_id, ()):
+            self._unlink(guild_id, streamer)
+
+        streamers = set(streamers)
+        if not streamers:
+            return
+
+        self._streamers[guild_id] = streamers
+        for streamer in streamers:
+            self._guilds.setdefault(streamer, set()).add(guild_id)
+
+    def _unlink(self, guild_id: int, streamer: str) -> None:
+        guilds = self._guilds[streamer]
+        guilds.discard(guild_id)
+        if not guilds:
+            del self._guilds[streamer]
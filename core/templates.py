@@ -0,0 +1,56 @@
+import re
+
+from typing import List, Optional, Tuple
+
+from core.cache import LRUCache
+
+TEMPLATE_CACHE_SIZE = 4096
+
+_WHITESPACE = re.compile(r"\s+")
+
+# (content, role mention) -> 以 {name} 切開、已完成其他替換的片段
+_compiled: LRUCache[Tuple[str, str], List[str]] = LRUCache(maxsize=TEMPLATE_CACHE_SIZE)
+
+
+def replace_text(text: str, role: Optional[str] = None, streamer_name: Optional[str] = None) -> str:
+    replacements = {
+        "{everyone}": "@everyone",
+        "{here}": "@here",
+        "{role}": role if role is not None else "",
+        "{name}": streamer_name if streamer_name is not None else "",
+        "\\n": "\n"
+    }
+
+    for old, new in replacements.items():
+        text = text.replace(old, new)
+
+    text = _WHITESPACE.sub(' ', text).strip()
+
+    return text
+
+
+def compile_content(content: str, role: str = "") -> List[str]:
+    """
+    預先完成 ``{everyone}``、``{here}``、``{role}`` 與空白整理，只留下 ``{name}`` 的位置。
+
+    同一個 Guild 的通知訊息與身分組不變時，只會編譯一次；Guild 修改訊息後 key 不同，會自動重新編譯。
+    """
+    key = (content, role)
+    parts = _compiled.get(key)
+
+    if parts is None:
+        placeholder = "\x00"
+        text = replace_text(content.replace("{name}", placeholder), role, None)
+        parts = text.split(placeholder)
+        _compiled.set(key, parts)
+
+    return parts
+
+
+def render_content(content: str, role: Optional[str] = None, streamer_name: Optional[str] = None) -> str:
+    """與 :func:`replace_text` 結果相同，但重複使用編譯好的模板"""
+    # 名稱為空或含空白時會影響空白整理的結果，改用完整的替換流程
+    if not streamer_name or _WHITESPACE.search(streamer_name) or "\\n" in streamer_name or "\x00" in content:
+        return replace_text(content, role, streamer_name)
+
+    return streamer_name.join(compile_content(content, role or ""))
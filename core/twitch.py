@@ -0,0 +1,464 @@
+import asyncio
+import heapq
+import itertools
+import time
+
+from enum import IntEnum
+from typing import Any, Awaitable, Callable, Dict, Iterable, List, Mapping, Optional, Tuple, TypeVar
+
+import aiohttp
+
+from tystream import AsyncTwitch, TwitchStreamData, TwitchUserData, TwitchVODData
+from tystream.exceptions import OauthException
+
+from core.cache import LRUCache
+from core.metrics import HELIX_REQUEST_DURATION, HELIX_REQUESTS
+
+T = TypeVar("T")
+
+HELIX_URL = "https://api.twitch.tv/helix"
+OAUTH_TOKEN_URL = "https://id.twitch.tv/oauth2/token"
+HELIX_BATCH_SIZE = 100  # Helix /streams 與 /users 每次最多可查詢 100 個 login
+TOKEN_REFRESH_MARGIN = 300  # 在 token 到期前幾秒就先換發
+HELIX_RATE_LIMIT = 800  # App Access Token 預設每分鐘 800 points
+HELIX_MAX_RETRIES = 2
+USER_CACHE_SIZE = 10000
+USER_CACHE_TTL = 3600  # 用戶資料 (顯示名稱、頭像) 很少變動
+
+# (login / id, keys) -> {key: Helix 原始用戶資料}
+ProfileLoader = Callable[[str, List[str]], Awaitable[Dict[str, dict]]]
+ProfileSaver = Callable[[List[dict], int], Awaitable[None]]
+
+
+def chunked(items: List[T], size: int = HELIX_BATCH_SIZE) -> List[List[T]]:
+    return [items[i:i + size] for i in range(0, len(items), size)]
+
+
+class Priority(IntEnum):
+    """Helix 請求的優先順序，數字越小越先取得額度"""
+
+    LIVE = 0  # 開台偵測
+    REFRESH = 1  # 更新直播訊息、直播結束後的動作、EventSub 訂閱
+    COMMAND = 2  # 使用者指令
+
+
+class HelixRateLimiter:
+    """
+    所有 Helix 請求共用的 token bucket。
+
+    額度會依回應的 ``Ratelimit-Limit`` / ``Ratelimit-Remaining`` / ``Ratelimit-Reset`` 標頭校正，
+    剩餘額度用完時暫停到 ``Ratelimit-Reset`` 為止；等待中的請求依 :class:`Priority` 先後取得額度。
+    """
+
+    def __init__(self, limit: int = HELIX_RATE_LIMIT, per: float = 60.0):
+        self.limit = limit
+        self.per = per
+        self._tokens = float(limit)
+        self._updated_at = time.monotonic()
+        self._paused_until = 0.0
+        self._waiters: List[Tuple[int, int, asyncio.Future]] = []
+        self._counter = itertools.count()
+        self._drainer: Optional[asyncio.Task] = None
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self._tokens = min(self.limit, self._tokens + (now - self._updated_at) * self.limit / self.per)
+        self._updated_at = now
+
+    async def acquire(self, priority: Priority = Priority.COMMAND) -> None:
+        self._refill()
+
+        if not self._waiters and self._tokens >= 1 and time.monotonic() >= self._paused_until:
+            self._tokens -= 1
+            return
+
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiters, (priority, next(self._counter), future))
+
+        if self._drainer is None or self._drainer.done():
+            self._drainer = asyncio.create_task(self._drain())
+
+        await future
+
+    async def _drain(self) -> None:
+        while self._waiters:
+            now = time.monotonic()
+
+            if now < self._paused_until:
+                await asyncio.sleep(self._paused_until - now)
+                continue
+
+            self._refill()
+
+            if self._tokens < 1:
+                await asyncio.sleep((1 - self._tokens) * self.per / self.limit)
+                continue
+
+            _, _, future = heapq.heappop(self._waiters)
+            if not future.done():  # 已取消的請求不消耗額度
+                self._tokens -= 1
+                future.set_result(None)
+
+    def update(self, headers: Mapping[str, str]) -> None:
+        """依 Helix 回應標頭校正剩餘額度"""
+        try:
+            limit = int(headers["Ratelimit-Limit"])
+            remaining = int(headers["Ratelimit-Remaining"])
+            reset = float(headers["Ratelimit-Reset"])
+        except (KeyError, ValueError):
+            return
+
+        self._refill()
+        self.limit = limit
+        self._tokens = min(self._tokens, remaining)
+
+        if remaining == 0:
+            self._paused_until = max(self._paused_until, time.monotonic() + max(0.0, reset - time.time()))
+
+
+class TwitchClient(AsyncTwitch):
+    """
+    由 Bot 持有的長期 Twitch 客戶端。
+
+    與 ``AsyncTwitch`` 不同，這個客戶端只建立一次 HTTP 連線池，
+    App Access Token 存在記憶體中並在到期前自動換發，可在所有 Cog 之間共用。
+    所有 Helix 請求都經過 :class:`HelixRateLimiter`，相同的 GET 請求在回應前只會送出一次。
+    用戶資料以 login 與 ID 快取在記憶體 LRU 中，可透過 ``load_profiles`` / ``save_profiles`` 以 Redis 作為第二層快取。
+    """
+
+    def __init__(
+        self,
+        client_id: str,
+        client_secret: str,
+        cache_ttl: int = 300,
+        connection_limit: int = 100,
+        eventsub_url: str = f"{HELIX_URL}/eventsub/subscriptions",
+        user_cache_ttl: int = USER_CACHE_TTL,
+        load_profiles: Optional[ProfileLoader] = None,
+        save_profiles: Optional[ProfileSaver] = None,
+    ) -> None:
+        super().__init__(client_id, client_secret, cache_ttl)
+        self.connection_limit = connection_limit
+        self.eventsub_url = eventsub_url
+        self._token: Optional[str] = None
+        self._token_expires_at = 0.0
+        self._revoked_token: Optional[str] = None  # 最近一次收到 401 而清除的 token
+        self._token_lock = asyncio.Lock()
+        self.limiter = HelixRateLimiter()
+        self._inflight: Dict[Tuple[str, Tuple], asyncio.Future] = {}
+        self.user_cache_ttl = user_cache_ttl
+        self.users: LRUCache[Tuple[str, str], TwitchUserData] = LRUCache(USER_CACHE_SIZE, ttl=user_cache_ttl)
+        self.load_profiles = load_profiles
+        self.save_profiles = save_profiles
+
+    async def __aenter__(self):
+        await self.start()
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        await self.close()
+
+    async def start(self) -> None:
+        """建立共用的 HTTP 連線池"""
+        if self._session and not self._session.closed:
+            return
+
+        connector = aiohttp.TCPConnector(limit=self.connection_limit, ttl_dns_cache=300, keepalive_timeout=60)
+        self._session = aiohttp.ClientSession(connector=connector, timeout=aiohttp.ClientTimeout(total=10))
+
+    async def close(self) -> None:
+        if self._session and not self._session.closed:
+            await self._session.close()
+
+    @property
+    def token_expired(self) -> bool:
+        return self._token is None or time.time() >= self._token_expires_at - TOKEN_REFRESH_MARGIN
+
+    async def _renew_token(self) -> Optional[str]:
+        if not self.token_expired:
+            return self._token
+
+        async with self._token_lock:
+            if not self.token_expired:
+                return self._token
+
+            data = {
+                "client_id": self.client_id,
+                "client_secret": self.client_secret,
+                "grant_type": "client_credentials",
+            }
+            async with self.session.post(OAUTH_TOKEN_URL, data=data) as response:
+                if not response.ok:
+                    raise OauthException(f"Twitch Get Access Token Failed. Detail: {await response.text()}")
+                token_info = await response.json()
+
+            self._token = token_info["access_token"]
+            self._token_expires_at = time.time() + token_info["expires_in"]
+            self.logger.info("Twitch app access token renewed, expires in %ss", token_info["expires_in"])
+
+            return self._token
+
+    async def _request(
+        self, method: str, url: str, priority: Priority = Priority.COMMAND, **kwargs
+    ) -> Tuple[int, Any]:
+        """
+        經由 rate limiter 發送 Helix 請求並回傳 (status, json)。
+
+        收到 429 時等到額度重置後重試；使用 App Access Token 的請求收到 401 時 (token 提早被撤銷)，
+        會清除 token 並以新換發的 token 重試一次。
+        """
+        endpoint = url.rstrip("/").rsplit("/", 1)[-1]
+        token_renewed = False
+
+        for attempt in range(HELIX_MAX_RETRIES + 1):
+            await self.limiter.acquire(priority)
+
+            started = time.perf_counter()
+            async with self.session.request(method, url, **kwargs) as response:
+                HELIX_REQUEST_DURATION.observe(time.perf_counter() - started, endpoint=endpoint)
+                HELIX_REQUESTS.inc(endpoint=endpoint, status=str(response.status))
+                self.limiter.update(response.headers)
+
+                if response.status == 429 and attempt < HELIX_MAX_RETRIES:
+                    self.logger.warning("Helix rate limited, retrying after reset")
+                    continue
+
+                unauthorized = (
+                    response.status == 401
+                    and not token_renewed
+                    and attempt < HELIX_MAX_RETRIES
+                    and self._invalidate_token(kwargs.get("headers"))
+                )
+
+                if not unauthorized:
+                    data = await response.json() if response.content_type == "application/json" else None
+                    return response.status, data
+
+            self.logger.warning("Helix returned 401, renewing the app access token")
+            token_renewed = True
+            kwargs["headers"] = {**kwargs["headers"], **await self._get_headers()}
+
+        raise RuntimeError("Unreachable code in Helix request.")
+
+    def _invalidate_token(self, headers: Optional[Mapping[str, str]]) -> bool:
+        """
+        請求使用的是 App Access Token 時清除 token，回傳是否應以新的 token 重試。
+
+        token 已被同時失敗的其他請求清除時直接重試；使用 User Access Token 的請求 (EventSub WebSocket) 不重試。
+        """
+        authorization = (headers or {}).get("Authorization")
+
+        if self._token is not None and authorization == f"Bearer {self._token}":
+            self._revoked_token = self._token
+            self._token = None
+            self._token_expires_at = 0.0
+            return True
+
+        return self._revoked_token is not None and authorization == f"Bearer {self._revoked_token}"
+
+    async def _make_request(
+        self,
+        url: str,
+        headers: Optional[Dict[str, str]] = None,
+        params: Optional[Any] = None,
+        timeout: int = 10,
+        priority: Priority = Priority.COMMAND,
+    ) -> Dict:
+        """相同的 GET 請求 (網址與參數相同) 在回應前只送出一次，同時呼叫的人共用結果"""
+        items = params.items() if isinstance(params, dict) else params or ()
+        key = (url, tuple(sorted((str(k), str(v)) for k, v in items)))
+
+        future = self._inflight.get(key)
+        if future is None:
+            future = self._inflight[key] = asyncio.ensure_future(
+                self._get_json(url, headers, params, timeout, priority)
+            )
+            future.add_done_callback(lambda _: self._inflight.pop(key, None))
+
+        return await asyncio.shield(future)
+
+    async def _get_json(
+        self, url: str, headers: Optional[Dict[str, str]], params: Optional[Any], timeout: int, priority: Priority
+    ) -> Dict:
+        status, data = await self._request(
+            "GET", url, priority, headers=headers, params=params, timeout=aiohttp.ClientTimeout(total=timeout)
+        )
+        if status != 200:
+            self.logger.error(f"API request failed with status {status}")
+            raise aiohttp.ClientError(f"API request failed: \n{data}")
+        return data
+
+    async def _get_eventsub_headers(self, user_token: Optional[str] = None) -> Dict[str, str]:
+        """WebSocket 傳輸必須使用 User Access Token，Webhook 傳輸則使用 App Access Token"""
+        if user_token:
+            return {"Client-ID": self.client_id, "Authorization": f"Bearer {user_token}"}
+        return await self._get_headers()
+
+    async def create_eventsub_subscription(
+        self,
+        subscription_type: str,
+        broadcaster_id: str,
+        transport: Dict[str, str],
+        user_token: Optional[str] = None,
+    ) -> Optional[str]:
+        """
+        建立 EventSub 訂閱。
+
+        Returns
+        -------
+        Optional[str]
+            訂閱 ID，若訂閱已存在 (409) 則回傳 None。
+        """
+        payload = {
+            "type": subscription_type,
+            "version": "1",
+            "condition": {"broadcaster_user_id": broadcaster_id},
+            "transport": transport,
+        }
+
+        headers = await self._get_eventsub_headers(user_token)
+
+        status, data = await self._request("POST", self.eventsub_url, Priority.REFRESH, json=payload, headers=headers)
+        if status == 409:
+            return None
+        if status != 202:
+            raise aiohttp.ClientError(f"EventSub subscription failed: \n{data}")
+        return data["data"][0]["id"]
+
+    async def delete_eventsub_subscription(self, subscription_id: str, user_token: Optional[str] = None) -> None:
+        headers = await self._get_eventsub_headers(user_token)
+
+        status, data = await self._request(
+            "DELETE", self.eventsub_url, Priority.REFRESH, params={"id": subscription_id}, headers=headers
+        )
+        if status not in (204, 404):
+            raise aiohttp.ClientError(f"EventSub unsubscribe failed: \n{data}")
+
+    def _remember(self, user_data: dict) -> TwitchUserData:
+        user = TwitchUserData(**user_data)
+        self.users.set(("login", user.login.lower()), user)
+        self.users.set(("id", user.id), user)
+        return user
+
+    async def _lookup_users(self, field: str, keys: Iterable[str], priority: Priority) -> Dict[str, TwitchUserData]:
+        """依序從記憶體、Redis、Helix 取得用戶資料，``field`` 為 ``login`` 或 ``id``"""
+        users: Dict[str, TwitchUserData] = {}
+        missing: List[str] = []
+
+        for key in {key.lower() for key in keys}:
+            user = self.users.get((field, key))
+            if user:
+                users[key] = user
+            else:
+                missing.append(key)
+
+        if missing and self.load_profiles:
+            for key, user_data in (await self.load_profiles(field, missing)).items():
+                users[key] = self._remember(user_data)
+            missing = [key for key in missing if key not in users]
+
+        if not missing:
+            return users
+
+        headers = await self._get_headers()
+        results = await asyncio.gather(*(
+            self._make_request(
+                f"{HELIX_URL}/users", headers=headers, params=[(field, key) for key in chunk], priority=priority
+            )
+            for chunk in chunked(sorted(missing))
+        ))
+
+        fetched = [user_data for result in results for user_data in result["data"]]
+
+        for user_data in fetched:
+            users[user_data[field].lower()] = self._remember(user_data)
+
+        if fetched and self.save_profiles:
+            await self.save_profiles(fetched, self.user_cache_ttl)
+
+        return users
+
+    async def get_users(
+        self, logins: Iterable[str], priority: Priority = Priority.COMMAND
+    ) -> Dict[str, TwitchUserData]:
+        """
+        批次取得 Twitch 用戶資料，未快取的用戶每個請求最多查詢 100 個 login。
+
+        Returns
+        -------
+        Dict[str, TwitchUserData]
+            以小寫 login 為 key 的用戶資料，查無此人的 login 不會出現在結果中。
+        """
+        return await self._lookup_users("login", logins, priority)
+
+    async def get_users_by_id(
+        self, user_ids: Iterable[str], priority: Priority = Priority.COMMAND
+    ) -> Dict[str, TwitchUserData]:
+        """以用戶 ID 批次取得 Twitch 用戶資料，回傳以 ID 為 key 的用戶資料"""
+        return await self._lookup_users("id", user_ids, priority)
+
+    async def get_user(self, streamer_name: str, priority: Priority = Priority.COMMAND) -> TwitchUserData:
+        """取得單一用戶資料，查無此人時與 ``AsyncTwitch`` 相同拋出 IndexError"""
+        user = (await self.get_users([streamer_name], priority=priority)).get(streamer_name.lower())
+        if user is None:
+            raise IndexError(f"Twitch user {streamer_name} not found")
+        return user
+
+    async def check_streams_live(
+        self, logins: Iterable[str], priority: Priority = Priority.LIVE
+    ) -> Dict[str, TwitchStreamData]:
+        """
+        批次檢查多個實況主是否正在直播，每個 /streams 請求最多查詢 100 個 login。
+
+        Returns
+        -------
+        Dict[str, TwitchStreamData]
+            以傳入的 login 為 key 的直播資料，未出現在結果中的實況主視為未開台。
+        """
+        requested = {login.lower(): login for login in logins}
+
+        if not requested:
+            return {}
+
+        headers = await self._get_headers()
+        results = await asyncio.gather(*(
+            self._make_request(
+                f"{HELIX_URL}/streams",
+                headers=headers,
+                params=[("user_login", login) for login in chunk] + [("first", str(len(chunk)))],
+                priority=priority,
+            )
+            for chunk in chunked(sorted(requested))
+        ))
+
+        streams = {
+            stream_data["user_login"].lower(): stream_data
+            for result in results
+            for stream_data in result["data"]
+            if stream_data.get("type") == "live"
+        }
+
+        users = await self.get_users(streams.keys(), priority=priority)
+
+        return {
+            requested[login]: TwitchStreamData(**stream_data, user=users[login])
+            for login, stream_data in streams.items()
+            if login in requested and login in users
+        }
+
+    async def get_latest_stream_vod(
+        self, streamer_name: str, priority: Priority = Priority.REFRESH
+    ) -> Optional[TwitchVODData]:
+        """取得實況主最新的直播 VOD，沒有 VOD 時回傳 None"""
+        user = (await self.get_users([streamer_name], priority=priority)).get(streamer_name.lower())
+        if user is None:
+            return None
+
+        result = await self._make_request(
+            f"{HELIX_URL}/videos",
+            headers=await self._get_headers(),
+            params=[("user_id", user.id), ("type", "archive"), ("first", "1")],
+            priority=priority,
+        )
+
+        return TwitchVODData(**result["data"][0]) if result["data"] else None
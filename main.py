@@ -4,11 +4,12 @@ import logging
 import os
 
 from colorlog import ColoredFormatter
-from disnake import Intents, Activity, BaseActivity
+from disnake import Activity, BaseActivity
 from disnake.ext.commands import CommandSyncFlags, InteractionBot as Bot
 from dotenv import load_dotenv
 
-from core.bot import Bot
+import Constants
+from core.bot import Bot, gateway_options
 
 
 
@@ -23,7 +24,7 @@ def main():
 
     bot = Bot(
         logger=main_logger,
-        intents=Intents.all(),
+        **gateway_options(Constants.LOW_MEMORY_MODE),
         loop=loop,
         activity=get_activity(),
         command_sync_flags=CommandSyncFlags.default(),
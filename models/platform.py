@@ -1,9 +1,10 @@
-from sqlalchemy import Column, BigInteger, String, Integer
+from sqlalchemy import Column, BigInteger, String, Integer, DateTime, Index, UniqueConstraint
 from sqlalchemy.dialects.sqlite import JSON
 from core.base import Base
 
 class GuildMixin:
     id = Column(BigInteger, primary_key=True, autoincrement=True)
+    # 舊版的追蹤列表 (streamer -> message_id)，已改存於 guild_streamers，只保留給一次性遷移使用
     streamers = Column(JSON, nullable=False, default=lambda: {})
     content = Column(String, nullable=True)
     channel_id = Column(BigInteger, nullable=True)
@@ -17,4 +18,19 @@ class TwitchGuilds(Base, GuildMixin):
     __tablename__ = "twitch_guilds"
 
 class YouTubeGuilds(Base, GuildMixin):
-    __tablename__ = "youtube_guilds"
\ No newline at end of file
+    __tablename__ = "youtube_guilds"
+
+class GuildStreamers(Base):
+    __tablename__ = "guild_streamers"
+    __table_args__ = (
+        UniqueConstraint("guild_id", "platform", "streamer", name="uq_guild_streamers_subscription"),
+        Index("ix_guild_streamers_guild_id", "guild_id"),
+        Index("ix_guild_streamers_platform_streamer", "platform", "streamer"),
+    )
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    guild_id = Column(BigInteger, nullable=False)
+    platform = Column(String, nullable=False)
+    streamer = Column(String, nullable=False)
+    message_id = Column(BigInteger, nullable=True)
+    notified_at = Column(DateTime, nullable=True)
@@ -0,0 +1,16 @@
+from dataclasses import dataclass, field
+from typing import Dict, Optional
+
+
+@dataclass(slots=True)
+class GuildSettings:
+    """單一 Guild 的通知設定與追蹤列表，由 ``core.db.get_all_guild_settings`` 批次載入"""
+    id: int
+    streamers: Dict[str, Optional[int]] = field(default_factory=dict)
+    content: Optional[str] = None
+    channel_id: Optional[int] = None
+    webhook_link: Optional[str] = None
+    webhook_name: Optional[str] = None
+    webhook_avatar: Optional[str] = None
+    notification_role: Optional[int] = None
+    when_live_end: int = 1
@@ -0,0 +1,397 @@
+"""
+以本機的 EventSub 替身檢查 ``core.eventsub`` 的行為，不會連線到 Twitch。
+
+    python -m scripts.fake_eventsub
+    python -m scripts.fake_eventsub --streamers 400 --latency 0.02
+
+WebSocket：替身會送出 session_welcome 與 keepalive，訂閱 API 與 Twitch 一樣限制每個 session 300 個訂閱。
+檢查 welcome 後的訂閱在背景進行 (訂閱期間仍能收到通知)、超過上限的實況主不會訂閱而是交給輪詢。
+訂閱失敗時：檢查冷卻期間不會重送，冷卻結束後只補上缺少的訂閱類型。
+Webhook：檢查簽章錯誤、時間戳超過 10 分鐘、未設定 secret 的回呼都會被拒絕。
+任一項檢查失敗時以非 0 結束。
+"""
+import argparse
+import asyncio
+import hashlib
+import hmac
+import itertools
+import json
+import logging
+import sys
+import time
+
+from datetime import datetime, timedelta, timezone
+from collections import Counter
+from typing import Dict, List, Optional, Set, Tuple
+
+import aiohttp
+from aiohttp import web
+
+import core.twitch
+from benchmarks.fake_twitch import FakeHelix
+from core.eventsub import STREAM_EVENTS, WEBSOCKET_MAX_SUBSCRIPTIONS, WebhookEventSub, WebSocketEventSub
+from core.twitch import TwitchClient
+
+SECRET = "fake-eventsub-secret"
+
+
+def rfc3339(moment: datetime) -> str:
+    return moment.strftime("%Y-%m-%dT%H:%M:%S.%f") + "123Z"  # Twitch 的時間戳有 9 位小數
+
+
+class FakeEventSub:
+    """EventSub WebSocket 與訂閱 API (``/eventsub/subscriptions``) 的替身"""
+
+    def __init__(self, helix: FakeHelix, keepalive: int = 1, latency: float = 0.0):
+        self.helix = helix
+        self.keepalive = keepalive
+        self.latency = latency
+        self.sessions: Dict[str, web.WebSocketResponse] = {}
+        self.subscriptions: Dict[str, dict] = {}  # 訂閱 ID -> 訂閱內容
+        self.rejected = 0  # 因超過 session 上限而拒絕的訂閱
+        self.failing: Set[Tuple[str, str]] = set()  # 一律回傳 400 的 (broadcaster id, 訂閱類型)
+        self.requests: Counter = Counter()  # (broadcaster id, 訂閱類型) -> 建立訂閱的請求數
+        self._ids = itertools.count(1)
+
+    def install(self, app: web.Application) -> None:
+        app.router.add_get("/ws", self.websocket)
+        app.router.add_post("/eventsub/subscriptions", self.create)
+        app.router.add_delete("/eventsub/subscriptions", self.delete)
+
+    def session_subscriptions(self, session_id: str) -> List[dict]:
+        return [
+            subscription for subscription in self.subscriptions.values()
+            if subscription["transport"].get("session_id") == session_id
+        ]
+
+    @staticmethod
+    def _metadata(message_type: str, **extra) -> dict:
+        return {
+            "message_id": f"{message_type}-{time.time_ns()}",
+            "message_type": message_type,
+            "message_timestamp": rfc3339(datetime.now(timezone.utc)),
+            **extra,
+        }
+
+    async def websocket(self, request: web.Request) -> web.WebSocketResponse:
+        ws = web.WebSocketResponse()
+        await ws.prepare(request)
+
+        session_id = f"session-{next(self._ids)}"
+        self.sessions[session_id] = ws
+
+        await ws.send_json({
+            "metadata": self._metadata("session_welcome"),
+            "payload": {"session": {
+                "id": session_id,
+                "status": "connected",
+                "keepalive_timeout_seconds": self.keepalive,
+                "reconnect_url": None,
+            }},
+        })
+
+        try:
+            while not ws.closed:
+                await asyncio.sleep(self.keepalive)
+                await ws.send_json({"metadata": self._metadata("session_keepalive"), "payload": {}})
+        except ConnectionError:
+            pass
+        finally:
+            self.sessions.pop(session_id, None)
+
+        return ws
+
+    async def create(self, request: web.Request) -> web.Response:
+        if self.latency:
+            await asyncio.sleep(self.latency)
+
+        body = await request.json()
+        transport = body["transport"]
+        target = (body["condition"]["broadcaster_user_id"], body["type"])
+        self.requests[target] += 1
+
+        if target in self.failing:
+            return web.json_response({"status": 400, "message": "subscription rejected"}, status=400)
+
+        if transport["method"] == "websocket":
+            if transport["session_id"] not in self.sessions:
+                return web.json_response({"status": 400, "message": "session does not exist"}, status=400)
+            if len(self.session_subscriptions(transport["session_id"])) >= WEBSOCKET_MAX_SUBSCRIPTIONS:
+                self.rejected += 1
+                return web.json_response({"status": 429, "message": "too many subscriptions"}, status=429)
+
+        subscription_id = f"sub-{next(self._ids)}"
+        self.subscriptions[subscription_id] = {
+            "id": subscription_id,
+            "type": body["type"],
+            "condition": body["condition"],
+            "transport": transport,
+            "status": "enabled",
+        }
+        return web.json_response({"data": [self.subscriptions[subscription_id]]}, status=202)
+
+    async def delete(self, request: web.Request) -> web.Response:
+        self.subscriptions.pop(request.query["id"], None)
+        return web.Response(status=204)
+
+    async def notify(self, login: str, subscription_type: str) -> bool:
+        """對訂閱了該實況主的 session 送出通知，沒有任何訂閱時回傳 False"""
+        user = self.helix.users[login]
+
+        for subscription in self.subscriptions.values():
+            if subscription["type"] != subscription_type:
+                continue
+            if subscription["condition"]["broadcaster_user_id"] != user["id"]:
+                continue
+
+            ws = self.sessions.get(subscription["transport"].get("session_id"))
+            if ws is None:
+                continue
+
+            await ws.send_json({
+                "metadata": self._metadata("notification", subscription_type=subscription_type),
+                "payload": {
+                    "subscription": subscription,
+                    "event": {
+                        "broadcaster_user_id": user["id"],
+                        "broadcaster_user_login": login,
+                        "broadcaster_user_name": user["display_name"],
+                    },
+                },
+            })
+            return True
+
+        return False
+
+
+async def start_server(app: web.Application) -> tuple:
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    await site.start()
+    port = site._server.sockets[0].getsockname()[1]
+    return runner, f"http://127.0.0.1:{port}"
+
+
+class Checks:
+    def __init__(self):
+        self.failed = 0
+
+    def check(self, ok: bool, description: str) -> None:
+        print(f"{'✅' if ok else '❌'} {description}")
+        if not ok:
+            self.failed += 1
+
+
+async def wait_until(predicate, timeout: float) -> bool:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if predicate():
+            return True
+        await asyncio.sleep(0.01)
+    return predicate()
+
+
+async def check_websocket(args, checks: Checks, url: str, fake: FakeEventSub, twitch: TwitchClient) -> None:
+    logins = sorted(fake.helix.users)
+    online: List[str] = []
+    subscribed_during_notification: Optional[int] = None
+
+    async def on_online(login: str) -> None:
+        nonlocal subscribed_during_notification
+        if subscribed_during_notification is None:
+            subscribed_during_notification = len(fake.subscriptions)
+        online.append(login)
+
+    async def on_offline(login: str) -> None:
+        pass
+
+    eventsub = WebSocketEventSub(
+        twitch, on_online, on_offline, url=url.replace("http", "ws", 1) + "/ws", user_token="fake-user-token"
+    )
+    await eventsub.sync(logins)  # 尚未連線，只記錄追蹤列表
+    await eventsub.start()
+
+    capacity = WEBSOCKET_MAX_SUBSCRIPTIONS // len(STREAM_EVENTS)
+    expected = min(len(logins), capacity)
+
+    try:
+        checks.check(await wait_until(lambda: fake.sessions, 5), "WebSocket 已連線")
+
+        # welcome 後的訂閱在背景進行，此時送出的通知應該能馬上被處理
+        await wait_until(lambda: fake.subscriptions, 5)
+        await fake.notify(logins[0], "stream.online")
+        await wait_until(lambda: online, 5)
+        checks.check(
+            subscribed_during_notification is not None
+            and subscribed_during_notification < expected * len(STREAM_EVENTS),
+            f"訂閱期間仍能收到通知 (收到通知時已建立 {subscribed_during_notification} 個訂閱)",
+        )
+
+        covered = lambda: sum(eventsub.covers(login) for login in logins)
+        await wait_until(lambda: covered() == expected, max(10.0, len(logins) * args.latency * 2))
+
+        session_counts = [len(fake.session_subscriptions(session_id)) for session_id in fake.sessions]
+        checks.check(covered() == expected, f"訂閱了 {covered()}/{len(logins)} 位實況主 (上限 {capacity})")
+        checks.check(
+            all(count <= WEBSOCKET_MAX_SUBSCRIPTIONS for count in session_counts) and fake.rejected == 0,
+            f"每個 session 的訂閱數 {session_counts} 未超過上限 (被拒絕 {fake.rejected} 次)",
+        )
+
+        uncovered = [login for login in logins if not eventsub.covers(login)]
+        checks.check(
+            len(uncovered) == len(logins) - expected,
+            f"{len(uncovered)} 位超出上限的實況主交由輪詢偵測",
+        )
+
+        await eventsub.sync(logins)  # 已達上限時再次同步不應送出新的訂閱
+        checks.check(fake.rejected == 0, "達到上限後再次同步不會送出超額的訂閱")
+
+        await asyncio.sleep(fake.keepalive * 2)
+        checks.check(len(fake.sessions) == 1, "keepalive 期間連線維持不變")
+    finally:
+        await eventsub.close()
+
+
+async def check_failures(checks: Checks, fake: FakeEventSub, twitch: TwitchClient) -> None:
+    """streamer_0 的 stream.offline 與 streamer_1 的所有訂閱都失敗"""
+    partial, failed = fake.helix.users["streamer_0"]["id"], fake.helix.users["streamer_1"]["id"]
+    fake.failing = {(partial, "stream.offline"), (failed, "stream.online"), (failed, "stream.offline")}
+    fake.requests.clear()
+
+    async def ignore(login: str) -> None:
+        pass
+
+    eventsub = WebhookEventSub(
+        twitch, ignore, ignore, callback_url="https://example.invalid/eventsub", secret=SECRET, port=0
+    )
+    logins = ["streamer_0", "streamer_1"]
+
+    try:
+        await eventsub.sync(logins)
+        first = sum(fake.requests.values())
+        await eventsub.sync(logins)
+        checks.check(
+            first == 4 and sum(fake.requests.values()) == first,
+            f"失敗後的冷卻期間不會重送訂閱 ({first} -> {sum(fake.requests.values())} 個請求)",
+        )
+        checks.check(
+            not eventsub.covers("streamer_0") and not eventsub.covers("streamer_1"),
+            "只訂閱到部分類型的實況主仍交由輪詢偵測",
+        )
+
+        # 模擬冷卻結束且 Twitch 恢復正常
+        fake.failing.clear()
+        eventsub._failures = {login: (count, 0.0) for login, (count, _) in eventsub._failures.items()}
+        await eventsub.sync(logins)
+
+        checks.check(
+            fake.requests[(partial, "stream.online")] == 1 and fake.requests[(partial, "stream.offline")] == 2,
+            "冷卻結束後只補上缺少的 stream.offline 訂閱",
+        )
+        checks.check(
+            eventsub.covers("streamer_0") and eventsub.covers("streamer_1"), "重試後兩位實況主都已完整訂閱"
+        )
+    finally:
+        await eventsub.close()
+
+
+def signed_headers(body: bytes, secret: str, message_id: str, timestamp: str, message_type: str) -> dict:
+    signature = hmac.new(secret.encode(), (message_id + timestamp).encode() + body, hashlib.sha256).hexdigest()
+    return {
+        "Twitch-Eventsub-Message-Id": message_id,
+        "Twitch-Eventsub-Message-Timestamp": timestamp,
+        "Twitch-Eventsub-Message-Signature": f"sha256={signature}",
+        "Twitch-Eventsub-Message-Type": message_type,
+        "Content-Type": "application/json",
+    }
+
+
+async def check_webhook(checks: Checks, twitch: TwitchClient) -> None:
+    online: List[str] = []
+
+    async def on_online(login: str) -> None:
+        online.append(login)
+
+    async def on_offline(login: str) -> None:
+        pass
+
+    body = json.dumps({
+        "subscription": {"type": "stream.online", "condition": {"broadcaster_user_id": "1"}},
+        "event": {"broadcaster_user_id": "1", "broadcaster_user_login": "streamer_0"},
+    }).encode()
+    now = datetime.now(timezone.utc)
+
+    for secret in (SECRET, None):
+        eventsub = WebhookEventSub(
+            twitch, on_online, on_offline,
+            callback_url="https://example.invalid/eventsub", secret=secret, host="127.0.0.1", port=0,
+        )
+        await eventsub.sync(["streamer_0"])
+
+        app = web.Application()
+        app.router.add_post("/eventsub", eventsub.handle_callback)
+        runner, url = await start_server(app)
+
+        async def post(headers: dict) -> int:
+            async with aiohttp.ClientSession() as session:
+                async with session.post(f"{url}/eventsub", data=body, headers=headers) as response:
+                    return response.status
+
+        try:
+            if secret is None:
+                status = await post(signed_headers(body, "", "none-1", rfc3339(now), "notification"))
+                checks.check(status == 403, f"未設定 secret 時拒絕回呼 ({status})")
+                continue
+
+            status = await post(signed_headers(body, SECRET, "fresh-1", rfc3339(now), "notification"))
+            await wait_until(lambda: online, 2)
+            checks.check(status == 204 and online == ["streamer_0"], f"接受簽章正確的通知 ({status})")
+
+            status = await post(signed_headers(body, "wrong-secret", "forged-1", rfc3339(now), "notification"))
+            checks.check(status == 403, f"拒絕簽章錯誤的通知 ({status})")
+
+            stale = rfc3339(now - timedelta(minutes=11))
+            status = await post(signed_headers(body, SECRET, "stale-1", stale, "notification"))
+            checks.check(status == 403 and len(online) == 1, f"拒絕 11 分鐘前的通知 ({status})")
+
+            status = await post(signed_headers(body, SECRET, "bad-time-1", "yesterday", "notification"))
+            checks.check(status == 403, f"拒絕無法解析時間戳的通知 ({status})")
+        finally:
+            await runner.cleanup()
+            await eventsub.close()
+
+
+async def main(args) -> int:
+    logging.basicConfig(level=logging.WARNING)
+    checks = Checks()
+
+    helix = FakeHelix([f"streamer_{index}" for index in range(args.streamers)])
+    fake = FakeEventSub(helix, keepalive=args.keepalive, latency=args.latency)
+    app = helix.app()
+    fake.install(app)
+    runner, url = await start_server(app)
+
+    core.twitch.HELIX_URL = f"{url}/helix"
+    core.twitch.OAUTH_TOKEN_URL = f"{url}/oauth2/token"
+    twitch = TwitchClient("fake", "fake", eventsub_url=f"{url}/eventsub/subscriptions")
+    await twitch.start()
+
+    try:
+        await check_websocket(args, checks, url, fake, twitch)
+        await check_failures(checks, fake, twitch)
+        await check_webhook(checks, twitch)
+    finally:
+        await twitch.close()
+        await runner.cleanup()
+
+    print("全部通過" if not checks.failed else f"{checks.failed} 項檢查失敗")
+    return 1 if checks.failed else 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="以本機的 EventSub 替身檢查 WebSocket / Webhook 的處理")
+    parser.add_argument("--streamers", type=int, default=400, help="追蹤的實況主數量，超過 150 位時會觸發訂閱上限")
+    parser.add_argument("--keepalive", type=int, default=1, help="替身送出 keepalive 的間隔秒數")
+    parser.add_argument("--latency", type=float, default=0.01, help="每個訂閱請求的延遲秒數")
+    sys.exit(asyncio.run(main(parser.parse_args())))
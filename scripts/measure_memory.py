@@ -0,0 +1,152 @@
+"""
+比較完整模式與低記憶體模式在合成 Guild 資料下的 Gateway 快取記憶體用量。
+
+    python -m scripts.measure_memory --guilds 200 --members 2000
+
+不會連線到 Discord：直接把合成的 GUILD_CREATE / MESSAGE_CREATE 事件交給 disnake 的 ConnectionState 解析，
+並依各模式的 intents 決定 Discord 會送來哪些資料 (成員、上線狀態、訊息)，以 tracemalloc 量測快取的大小。
+"""
+import argparse
+import asyncio
+import gc
+import logging
+import tracemalloc
+
+from core.bot import Bot, gateway_options
+
+CHANNELS_PER_GUILD = 20
+ROLES_PER_GUILD = 30
+MESSAGES_PER_GUILD = 50
+
+
+def snowflake(*parts: int) -> str:
+    value = 0
+    for part in parts:
+        value = value * 100_000 + part
+    return str((value + 1) << 22)
+
+
+def user_payload(guild: int, index: int) -> dict:
+    return {
+        "id": snowflake(guild, index, 1),
+        "username": f"user_{guild}_{index}",
+        "discriminator": "0",
+        "global_name": f"User {index}",
+        "avatar": None,
+    }
+
+
+def guild_payload(guild: int, members: int, intents) -> dict:
+    data = {
+        "id": snowflake(guild),
+        "name": f"Guild {guild}",
+        "owner_id": snowflake(guild, 0, 1),
+        "member_count": members,
+        "large": members >= 250,
+        "features": [],
+        "emojis": [],
+        "stickers": [],
+        "roles": [
+            {
+                "id": snowflake(guild, role, 2),
+                "name": f"role {role}",
+                "permissions": "0",
+                "position": role,
+                "color": 0,
+                "colors": {"primary_color": 0, "secondary_color": None, "tertiary_color": None},
+                "hoist": False,
+                "managed": False,
+                "mentionable": False,
+            }
+            for role in range(ROLES_PER_GUILD)
+        ],
+        "channels": [
+            {"id": snowflake(guild, channel, 3), "type": 0, "name": f"channel-{channel}", "position": channel,
+             "permission_overwrites": []}
+            for channel in range(CHANNELS_PER_GUILD)
+        ],
+    }
+
+    # 沒有 members intent 時 Discord 不會送出成員列表，也不會進行成員分塊
+    if intents.members:
+        data["members"] = [
+            {"user": user_payload(guild, index), "roles": [], "joined_at": "2024-01-01T00:00:00+00:00",
+             "deaf": False, "mute": False}
+            for index in range(members)
+        ]
+
+    if intents.presences:
+        data["presences"] = [
+            {"user": {"id": snowflake(guild, index, 1)}, "status": "online", "activities": [],
+             "client_status": {"desktop": "online"}}
+            for index in range(0, members, 4)
+        ]
+
+    return data
+
+
+def message_payload(guild: int, index: int) -> dict:
+    return {
+        "id": snowflake(guild, index, 4),
+        "channel_id": snowflake(guild, index % CHANNELS_PER_GUILD, 3),
+        "guild_id": snowflake(guild),
+        "author": user_payload(guild, index),
+        "content": "hello " * 20,
+        "timestamp": "2024-01-01T00:00:00+00:00",
+        "edited_timestamp": None,
+        "tts": False,
+        "mention_everyone": False,
+        "mentions": [],
+        "mention_roles": [],
+        "attachments": [],
+        "embeds": [],
+        "pinned": False,
+        "type": 0,
+    }
+
+
+async def measure(low_memory: bool, guilds: int, members: int) -> int:
+    options = gateway_options(low_memory)
+    bot = Bot(logger=logging.getLogger(__name__), **options)
+    state = bot._connection
+    intents = options["intents"]
+
+    gc.collect()
+    tracemalloc.start()
+    before = tracemalloc.take_snapshot()
+
+    for guild in range(guilds):
+        state.parse_guild_create(guild_payload(guild, members, intents))
+
+    if intents.guild_messages:
+        for guild in range(guilds):
+            for index in range(MESSAGES_PER_GUILD):
+                state.parse_message_create(message_payload(guild, index))
+
+    gc.collect()
+    after = tracemalloc.take_snapshot()
+    tracemalloc.stop()
+
+    size = sum(stat.size_diff for stat in after.compare_to(before, "filename"))
+
+    await bot.twitch.close()
+    return size
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="比較 Gateway 快取的記憶體用量")
+    parser.add_argument("--guilds", type=int, default=100)
+    parser.add_argument("--members", type=int, default=1000, help="每個 Guild 的成員數量")
+    args = parser.parse_args()
+
+    results = {}
+    for name, low_memory in (("完整模式", False), ("低記憶體模式", True)):
+        results[name] = await measure(low_memory, args.guilds, args.members)
+        print(f"{name}: {results[name] / 1024 / 1024:.1f} MiB")
+
+    full, low = results["完整模式"], results["低記憶體模式"]
+    print(f"節省 {(full - low) / 1024 / 1024:.1f} MiB ({(1 - low / full) * 100:.1f}%)")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,86 @@
+"""
+在本機以多個程序模擬分片輪詢，觀察 worker 加入、離開時的分片重新分配。
+
+    python -m scripts.simulate_shards --workers 3 --kill 1
+    python -m scripts.simulate_shards --fake   # 使用 fakeredis TCP 伺服器代替 Redis
+
+每個 worker 都是獨立程序，透過同一個 Redis 取得分片租約。
+``--kill`` 會在數輪後直接終止指定的 worker (不釋放租約)，其分片會在租約到期後由其他 worker 接手。
+"""
+import argparse
+import asyncio
+import multiprocessing
+import threading
+import time
+
+from redis import asyncio as redis
+
+from core.sharding import ShardCoordinator
+
+STREAMERS = [f"streamer_{i}" for i in range(1000)]
+
+
+def run_worker(worker_id: str, host: str, port: int, password: str, shard_count: int, lease_ttl: int, rounds: int):
+    async def main():
+        client = redis.Redis(host=host, port=port, password=password, decode_responses=True)
+        coordinator = ShardCoordinator(client, worker_id=worker_id, shard_count=shard_count, lease_ttl=lease_ttl)
+
+        try:
+            for _ in range(rounds):
+                await coordinator.refresh()
+                owned = coordinator.filter(STREAMERS)
+                print(f"[{time.strftime('%X')}] {worker_id}: {len(coordinator.shards)} 個分片, {len(owned)} 位實況主")
+                await asyncio.sleep(max(1, lease_ttl // 3))
+        finally:
+            await coordinator.stop()
+            await client.aclose()
+
+    asyncio.run(main())
+
+
+def start_fake_server(port: int) -> None:
+    from fakeredis import TcpFakeServer
+
+    server = TcpFakeServer(("127.0.0.1", port))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="模擬多個 worker 分片輪詢實況主")
+    parser.add_argument("--workers", type=int, default=3)
+    parser.add_argument("--shards", type=int, default=64)
+    parser.add_argument("--lease-ttl", type=int, default=6)
+    parser.add_argument("--rounds", type=int, default=12)
+    parser.add_argument("--kill", type=int, default=None, help="在第 3 輪後終止的 worker 編號")
+    parser.add_argument("--fake", action="store_true", help="啟動 fakeredis TCP 伺服器")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=6379)
+    parser.add_argument("--password", default=None)
+    args = parser.parse_args()
+
+    if args.fake:
+        args.port = 16379
+        start_fake_server(args.port)
+
+    processes = [
+        multiprocessing.Process(
+            target=run_worker,
+            args=(f"worker-{i}", args.host, args.port, args.password, args.shards, args.lease_ttl, args.rounds),
+        )
+        for i in range(args.workers)
+    ]
+
+    for process in processes:
+        process.start()
+
+    if args.kill is not None:
+        time.sleep(max(1, args.lease_ttl // 3) * 3)
+        processes[args.kill].kill()
+        print(f"--- 已終止 worker-{args.kill}，等待租約過期 ({args.lease_ttl} 秒) 後重新分配 ---")
+
+    for process in processes:
+        process.join()
+
+
+if __name__ == "__main__":
+    main()